@@ -1,10 +1,17 @@
 from dotenv import load_dotenv
 from dify_plugin import Plugin, DifyPluginEnv
 
+from utils.metrics import serve_metrics
+from utils.warmup import warm_up
+
 # 加载 .env 文件
 load_dotenv()
 
 plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=120))
 
 if __name__ == '__main__':
+    # 插件启动后在后台导入 SDK 并预建客户端，不阻塞启动
+    warm_up()
+    # 设置 DREAMAI_METRICS_PORT 时提供 Prometheus 指标
+    serve_metrics()
     plugin.run()
@@ -8,7 +8,8 @@ class DreamaiProvider(ToolProvider):
     
     def _validate_credentials(self, credentials: dict[str, Any]) -> None:
         try:
-            from volcengine.visual.VisualService import VisualService
+            from utils.credential_check import credential_validator
+            from utils.key_pool import parse_api_keys
             
             # 获取凭证
             access_key = credentials.get('volcengine_access_key')
@@ -17,14 +18,23 @@ class DreamaiProvider(ToolProvider):
             if not access_key or not secret_key:
                 raise ToolProviderCredentialValidationError("VolcEngine Access Key and Secret Key are required")
             
-            # 创建服务实例并验证凭证
-            visual_service = VisualService()
-            visual_service.set_ak(access_key)
-            visual_service.set_sk(secret_key)
+            # 解析额外凭证，格式错误时直接提示
+            try:
+                api_keys = parse_api_keys(credentials)
+            except ValueError as e:
+                raise ToolProviderCredentialValidationError(str(e))
             
-            # 简单的验证请求（可以根据实际API调整）
-            # 这里只是验证凭证格式，实际使用时会在工具中进行真正的API调用
+            # 每组凭证并发发送一次签名的查询请求，结果按凭证指纹缓存，供工具调用时快速失败
+            # 网络错误等无法判断的情况不阻止保存
+            verdicts = credential_validator.validate(
+                [(api_key.access_key, api_key.secret_key) for api_key in api_keys], refresh=True)
+            for index, verdict in enumerate(verdicts):
+                if verdict.valid is False:
+                    label = "Primary credential" if index == 0 else f"Extra credential #{index}"
+                    raise ToolProviderCredentialValidationError(f"{label} was rejected by VolcEngine: {verdict.message}")
             
+        except ToolProviderCredentialValidationError:
+            raise
         except Exception as e:
             raise ToolProviderCredentialValidationError(f"Invalid VolcEngine credentials: {str(e)}")
 
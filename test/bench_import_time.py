@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入耗时基准：逐个模块在全新子进程中测量导入耗时，用于跟踪插件冷启动开销
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行：python test/bench_import_time.py [--repeat 5] [模块名 ...]
+
+默认先导入 dify_plugin 作为基线（插件进程启动时必然导入），只统计模块本身新增的耗时；
+同时列出导入后是否已加载火山引擎 SDK，工具模块应当为“否”。
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import json, sys, time
+started_at = time.perf_counter()
+{baseline}
+baseline = time.perf_counter() - started_at
+started_at = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started_at
+print(json.dumps({{"baseline": baseline, "elapsed": elapsed,
+                  "sdk_loaded": any(name.startswith("volcengine") for name in sys.modules)}}))
+"""
+
+
+def default_modules() -> list[str]:
+    modules = ['volcengine.visual.VisualService', 'provider.dreamai']
+    for pattern in ('tools/*.py', 'utils/*.py'):
+        for path in sorted(glob.glob(os.path.join(ROOT, pattern))):
+            name = os.path.splitext(os.path.relpath(path, ROOT))[0].replace(os.sep, '.')
+            if not name.endswith('__init__'):
+                modules.append(name)
+    return modules
+
+
+def measure(module: str, baseline: str = 'dify_plugin') -> dict:
+    """在全新子进程中导入模块，返回基线与模块本身的导入耗时（秒）"""
+    code = _PROBE.format(module=module, baseline=f"import {baseline}" if baseline else 'pass')
+    completed = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    for line in completed.stdout.splitlines():
+        if line.startswith('{'):
+            return json.loads(line)
+    raise RuntimeError(f"import {module} failed: {completed.stderr.strip().splitlines()[-1:]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Per-module import time benchmark')
+    parser.add_argument('modules', nargs='*', help='modules to measure, defaults to all tools and utils')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per module, the median is reported')
+    parser.add_argument('--baseline', default='dify_plugin', help="module imported before timing, '' for none")
+    args = parser.parse_args()
+
+    rows = []
+    for module in args.modules or default_modules():
+        try:
+            runs = [measure(module, args.baseline) for _ in range(max(args.repeat, 1))]
+        except RuntimeError as e:
+            print(f"{module:<40} error: {e}")
+            continue
+        rows.append((module, statistics.median(run['elapsed'] for run in runs),
+                     statistics.median(run['baseline'] for run in runs), runs[-1]['sdk_loaded']))
+
+    print(f"{'module':<40} {'import ms':>10} {'baseline ms':>12}  sdk loaded")
+    for module, elapsed, baseline, sdk_loaded in sorted(rows, key=lambda row: row[1], reverse=True):
+        print(f"{module:<40} {elapsed * 1000:>10.1f} {baseline * 1000:>12.1f}  {'yes' if sdk_loaded else 'no'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端基准：以指定并发驱动工具类访问本地模拟接口服务，统计吞吐与延迟
+
+使用方法：
+1. 无需 VolcEngine 凭证，脚本会在进程内启动 mock_visual_server
+2. 运行：python test/bench_tools.py --tool text_to_image --invocations 200 --concurrency 32
+3. 加上 --output result.json 输出 JSON，便于在版本之间对比
+
+统计内容：
+- 吞吐（每秒完成的调用数）与调用延迟的 p50/p90/p99
+- 额外开销：调用延迟减去模拟服务中任务本身的耗时（提交到完成），反映轮询与调度带来的延迟
+- 每个任务的接口调用次数、CPU 时间与进程峰值内存
+
+限流、轮询等配置沿用插件的环境变量（如 DREAMAI_SUBMIT_QPS、DREAMAI_POLL_IMAGE_MIN_INTERVAL），
+任务日志与调用时间预算在基准中默认关闭，可通过环境变量覆盖。
+"""
+
+# 安装了 trio 的环境中 httpcore 导入时会创建 epoll，需在 gevent monkey patch 之前导入（与 pytest 下一致）
+import httpcore  # noqa: F401
+
+# 与插件进程一致，先由 dify_plugin 完成 gevent monkey patch 再导入其他模块；
+# 否则 concurrent.futures 等模块会持有未打补丁的锁，在工作线程中 fork 子进程时死锁
+import dify_plugin  # noqa: F401
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+
+# 任务日志在模块导入时创建，需在导入工具之前设置
+os.environ.setdefault('DREAMAI_TASK_JOURNAL', 'off')
+os.environ.setdefault('DREAMAI_DEADLINE_SECONDS', '0')
+
+# 添加项目根目录到 Python 路径
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_visual_server import MockConfig, MockVisualServer  # noqa: E402
+
+
+def _tool_factories() -> dict:
+    from tools.text_to_image import TextToImageTool
+    from tools.text_to_video import TextToVideoTool
+
+    return {
+        'text_to_image': (TextToImageTool, lambda index: {'prompt': f"benchmark image {index}"}),
+        'text_to_video': (TextToVideoTool, lambda index: {'prompt': f"benchmark video {index}"}),
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    """线性插值的分位数，q 取 0~100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _summary(values: list[float]) -> dict:
+    return {
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values, default=0.0),
+    }
+
+
+def _phase_totals(tool_name: str) -> dict:
+    """各阶段累计耗时与次数：阶段 -> (总耗时, 次数)"""
+    from utils.metrics import phase_seconds
+
+    totals = {}
+    for (tool, _, phase), (seconds, observed) in phase_seconds.totals().items():
+        if tool == tool_name:
+            total, count = totals.get(phase, (0.0, 0))
+            totals[phase] = (total + seconds, count + observed)
+    return totals
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def run_benchmark(tool_name: str, invocations: int, concurrency: int, config: MockConfig,
+                  access_key: str = 'bench_ak', secret_key: str = 'bench_sk') -> dict:
+    """在进程内启动模拟服务并以指定并发调用工具，返回统计结果"""
+    from test_task_poller import MockRuntime, MockSession
+
+    tool_class, make_parameters = _tool_factories()[tool_name]
+    with MockVisualServer(config) as server:
+        os.environ['DREAMAI_VISUAL_ENDPOINT'] = server.endpoint
+        runtime = MockRuntime(access_key, secret_key)
+
+        def invoke(index: int) -> dict:
+            tool = tool_class(runtime=runtime, session=MockSession())
+            started_at = time.monotonic()
+            messages = list(tool._invoke(make_parameters(index)))
+            finished_at = time.monotonic()
+            results = [m.message.json_object for m in messages if m.type == m.MessageType.JSON]
+            result = results[-1] if results else {}
+            return {"started_at": started_at, "finished_at": finished_at,
+                    "task_id": result.get('task_id'),
+                    "ok": bool(result.get('image_urls') or result.get('images') or result.get('video_url'))}
+
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        started_at = time.monotonic()
+        phases_before = _phase_totals(tool_name)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(invoke, range(invocations)))
+        elapsed = time.monotonic() - started_at
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+        latencies, overheads = [], []
+        for outcome in outcomes:
+            latency = outcome['finished_at'] - outcome['started_at']
+            latencies.append(latency)
+            task = server.tasks.get(outcome['task_id'] or '')
+            if outcome['ok'] and task is not None:
+                overheads.append(max(latency - (task.done_at - task.submitted_at), 0.0))
+        stats = server.stats.snapshot()
+        phases_after = _phase_totals(tool_name)
+
+    succeeded = sum(1 for outcome in outcomes if outcome['ok'])
+    api_calls = sum(stats['requests'].values())
+    cpu_seconds = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    return {
+        "tool": tool_name,
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "invocations": invocations,
+        "concurrency": concurrency,
+        "mock": asdict(config),
+        "succeeded": succeeded,
+        "failed": invocations - succeeded,
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": invocations / elapsed if elapsed else 0.0,
+        "latency_seconds": _summary(latencies),
+        "overhead_seconds": _summary(overheads),
+        # 工具内各阶段的平均耗时，来自 utils.metrics
+        "phase_mean_seconds": {
+            phase: (total - phases_before.get(phase, (0.0, 0))[0]) / max(count - phases_before.get(phase, (0.0, 0))[1], 1)
+            for phase, (total, count) in phases_after.items()
+            if count > phases_before.get(phase, (0.0, 0))[1]
+        },
+        "api_calls_per_task": api_calls / max(stats['tasks'], 1),
+        "queries_per_task": stats['queries_per_task'],
+        "requests": stats['requests'],
+        "throttled": stats['throttled'],
+        "cpu_seconds": cpu_seconds,
+        "cpu_ms_per_invocation": cpu_seconds * 1000 / invocations if invocations else 0.0,
+        # Linux 上 ru_maxrss 单位为 KB
+        "peak_rss_mb": usage_after.ru_maxrss / 1024,
+    }
+
+
+def _print_report(report: dict) -> None:
+    latency, overhead = report['latency_seconds'], report['overhead_seconds']
+    print(f"tool={report['tool']} invocations={report['invocations']} concurrency={report['concurrency']} "
+          f"revision={report['revision'] or '-'}")
+    print(f"succeeded={report['succeeded']} failed={report['failed']} throttled={report['throttled']}")
+    print(f"throughput   {report['throughput_per_second']:.2f} invocations/s over {report['elapsed_seconds']:.2f}s")
+    print(f"latency      p50={latency['p50']:.3f}s p90={latency['p90']:.3f}s p99={latency['p99']:.3f}s")
+    print(f"overhead     p50={overhead['p50']:.3f}s p90={overhead['p90']:.3f}s p99={overhead['p99']:.3f}s")
+    print(f"api calls    {report['api_calls_per_task']:.2f}/task (queries {report['queries_per_task']:.2f}/task)")
+    phases = ' '.join(f"{phase}={seconds:.3f}s" for phase, seconds in report['phase_mean_seconds'].items())
+    print(f"phases       {phases or '-'}")
+    print(f"cpu          {report['cpu_seconds']:.2f}s ({report['cpu_ms_per_invocation']:.1f} ms/invocation)")
+    print(f"peak rss     {report['peak_rss_mb']:.1f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='End-to-end tool benchmark against the mock visual server')
+    parser.add_argument('--tool', choices=sorted(_tool_factories()), default='text_to_image')
+    parser.add_argument('--invocations', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--queue-time', type=float, default=0.5)
+    parser.add_argument('--generation-median', type=float, default=2.0)
+    parser.add_argument('--generation-sigma', type=float, default=0.3)
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated network latency per request')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    config = MockConfig(queue_time=args.queue_time, generation_median=args.generation_median,
+                        generation_sigma=args.generation_sigma, latency=args.latency,
+                        error_rate=args.error_rate, throttle_rate=args.throttle_rate, seed=args.seed)
+    report = run_benchmark(args.tool, args.invocations, args.concurrency, config)
+    _print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
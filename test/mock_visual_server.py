@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟的火山引擎视觉接口服务，用于离线的负载与延迟测试
+
+实现 CVSync2AsyncSubmitTask、CVSync2AsyncGetResult 与 CVProcess：
+- CVProcess 的 cv_submit_task / cv_get_result（如动作模仿）与异步接口共用同一张任务表，
+  其他 req_key 按同步生成处理，在请求中等待排队与生成耗时后直接返回结果
+- 任务状态按时间推进：排队 queue_time 秒后进入生成中，生成耗时服从对数正态分布
+- 可按比例注入内部错误（50500）与限流错误码（50429），并可限制每个 AccessKey 的 QPS 与并发任务数（50430）
+- 可指定视为无效凭证的 AccessKey，返回与网关一致的鉴权错误
+- return_url 为 false 时返回 base64 数据，否则返回图片或视频链接
+- 统计提交、查询、限流与错误次数，便于衡量轮询效率
+
+使用方法：
+1. 启动服务：python test/mock_visual_server.py --port 8765 --queue-time 2 --generation-median 8
+2. 设置 DREAMAI_VISUAL_ENDPOINT=http://127.0.0.1:8765 后启动插件，所有客户端都会指向该服务
+3. 在测试中使用：server = MockVisualServer(MockConfig(...)).start()，用完调用 server.stop()
+"""
+
+import argparse
+import base64
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+# 1x1 像素的 PNG，用作 base64 返回结果
+TINY_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+
+
+@dataclass
+class MockConfig:
+    # 提交后的排队时长（秒）
+    queue_time: float = 0.0
+    # 生成耗时的中位数（秒）与对数正态分布的 sigma，sigma 为 0 时耗时固定
+    generation_median: float = 1.0
+    generation_sigma: float = 0.0
+    # 每个请求额外的网络延迟（秒）
+    latency: float = 0.0
+    # 请求返回 50500 内部错误的比例
+    error_rate: float = 0.0
+    # 请求返回 50429 限流的比例
+    throttle_rate: float = 0.0
+    # 每个 AccessKey 的 QPS 上限，超出返回 50429，0 表示不限制
+    qps_limit: float = 0.0
+    # 每个 AccessKey 同时进行中的任务数上限，超出返回 50430，0 表示不限制
+    max_running: int = 0
+    # 业务错误使用的 HTTP 状态码
+    error_http_status: int = 200
+    # 每个任务返回的图片数
+    image_count: int = 1
+    # 视为无效凭证的 AccessKey，多个用逗号分隔，请求返回 401 与 InvalidAccessKey
+    invalid_keys: str = ''
+    # 随机数种子，便于复现
+    seed: Optional[int] = None
+
+
+@dataclass
+class MockTask:
+    task_id: str
+    access_key: str
+    req_key: str
+    form: dict
+    submitted_at: float
+    running_at: float
+    done_at: float
+
+
+@dataclass
+class MockStats:
+    requests: Counter = field(default_factory=Counter)
+    throttled: int = 0
+    errors: int = 0
+    queries_per_task: Counter = field(default_factory=Counter)
+
+    def snapshot(self) -> dict:
+        queries = list(self.queries_per_task.values())
+        return {
+            "requests": dict(self.requests),
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "tasks": len(queries),
+            "queries_per_task": sum(queries) / len(queries) if queries else 0.0,
+        }
+
+
+def _access_key(authorization: Optional[str]) -> str:
+    # SignerV4：HMAC-SHA256 Credential=<AccessKey>/<date>/<region>/<service>/request, ...
+    if not authorization or 'Credential=' not in authorization:
+        return ''
+    return authorization.split('Credential=', 1)[1].split('/', 1)[0]
+
+
+def _is_video(req_key: str) -> bool:
+    return 'video' in req_key or req_key.startswith(('jimeng_i2v', 'jimeng_t2v', 'jimeng_dream_actor', 'jimeng_motion'))
+
+
+class MockVisualServer:
+    """在后台线程中运行的模拟接口服务"""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = '127.0.0.1', port: int = 0):
+        self.config = config or MockConfig()
+        self.stats = MockStats()
+        self.tasks: dict[str, MockTask] = {}
+        self._random = random.Random(self.config.seed)
+        self._windows: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockVisualServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-visual-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'MockVisualServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    # ---- 请求处理 ----
+
+    def handle(self, action: str, body: dict, access_key: str) -> dict:
+        config = self.config
+        if config.latency > 0:
+            time.sleep(config.latency)
+        with self._lock:
+            self.stats.requests[action] += 1
+            if config.invalid_keys and access_key in config.invalid_keys.split(','):
+                return {'ResponseMetadata': {'Action': action, 'Error': {
+                    'CodeN': 100009, 'Code': 'InvalidAccessKey', 'Message': 'The request has invalid access key'}}}
+            injected = self._inject(access_key)
+            if injected is not None:
+                return injected
+            if action == 'CVSync2AsyncSubmitTask':
+                return self._submit(body, access_key)
+            if action == 'CVSync2AsyncGetResult':
+                return self._get_result(body)
+            if action == 'CVProcess' and body.get('req_key') == 'cv_submit_task':
+                return self._submit_cv_process(body, access_key)
+            if action == 'CVProcess' and body.get('req_key') == 'cv_get_result':
+                task = self.tasks.get(body.get('task_id', ''))
+                return self._get_result(body, task.form if task else {})
+        if action == 'CVProcess':
+            time.sleep(config.queue_time + self._generation_time())
+            return {'code': 10000, 'message': 'Success', 'data': self._result(body.get('req_key', ''), body)}
+        return {'code': 50400, 'message': f"Unsupported action {action}", 'data': None}
+
+    def _inject(self, access_key: str) -> Optional[dict]:
+        config = self.config
+        if config.qps_limit > 0:
+            now = time.monotonic()
+            window = [at for at in self._windows.get(access_key, []) if now - at < 1.0]
+            if len(window) >= config.qps_limit:
+                self._windows[access_key] = window
+                self.stats.throttled += 1
+                return {'code': 50429, 'message': 'Request Has Reached API Limit', 'data': None}
+            window.append(now)
+            self._windows[access_key] = window
+        if config.throttle_rate > 0 and self._random.random() < config.throttle_rate:
+            self.stats.throttled += 1
+            return {'code': 50429, 'message': 'Request Has Reached API Limit', 'data': None}
+        if config.error_rate > 0 and self._random.random() < config.error_rate:
+            self.stats.errors += 1
+            return {'code': 50500, 'message': 'Internal Error', 'data': None}
+        return None
+
+    def _generation_time(self) -> float:
+        config = self.config
+        if config.generation_sigma <= 0:
+            return config.generation_median
+        return self._random.lognormvariate(math.log(max(config.generation_median, 1e-3)), config.generation_sigma)
+
+    def _submit(self, body: dict, access_key: str) -> dict:
+        config = self.config
+        now = time.monotonic()
+        if config.max_running > 0:
+            running = sum(1 for task in self.tasks.values() if task.access_key == access_key and task.done_at > now)
+            if running >= config.max_running:
+                self.stats.throttled += 1
+                return {'code': 50430, 'message': 'Request Has Reached API Concurrent Limit', 'data': None}
+        task_id = uuid.uuid4().hex
+        running_at = now + config.queue_time
+        self.tasks[task_id] = MockTask(task_id, access_key, body.get('req_key', ''), body, now, running_at,
+                                       running_at + self._generation_time())
+        return {'code': 10000, 'message': 'Success', 'data': {'task_id': task_id}}
+
+    def _submit_cv_process(self, body: dict, access_key: str) -> dict:
+        # task_type 为实际的 req_key，生成参数以 JSON 字符串放在 request_body 中
+        try:
+            form = json.loads(body.get('request_body') or '{}')
+        except ValueError:
+            return {'code': 50400, 'message': 'Invalid request_body', 'data': None}
+        return self._submit({**form, 'req_key': body.get('task_type', '')}, access_key)
+
+    def _get_result(self, body: dict, options: Optional[dict] = None) -> dict:
+        """查询任务状态；options 为 None 时按查询中的 req_json 决定返回格式"""
+        task = self.tasks.get(body.get('task_id', ''))
+        if task is None:
+            return {'code': 10000, 'message': 'Success', 'data': {'status': 'not_found'}}
+        self.stats.queries_per_task[task.task_id] += 1
+        now = time.monotonic()
+        if now < task.running_at:
+            return {'code': 10000, 'message': 'Success', 'data': {'status': 'in_queue'}}
+        if now < task.done_at:
+            return {'code': 10000, 'message': 'Success', 'data': {'status': 'generating'}}
+        if options is None:
+            options = {}
+            if body.get('req_json'):
+                try:
+                    options = json.loads(body['req_json'])
+                except ValueError:
+                    pass
+        return {'code': 10000, 'message': 'Success', 'data': {'status': 'done', **self._result(task.req_key, options)}}
+
+    def _result(self, req_key: str, options: dict) -> dict:
+        if options.get('return_url') is False:
+            encoded = base64.b64encode(TINY_PNG).decode()
+            return {'binary_data_base64': [encoded] * self.config.image_count}
+        if _is_video(req_key):
+            return {'video_url': f"https://mock.example.com/{uuid.uuid4().hex}.mp4"}
+        return {'image_urls': [f"https://mock.example.com/{uuid.uuid4().hex}.png"
+                               for _ in range(self.config.image_count)]}
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                action = (parse_qs(urlparse(self.path).query).get('Action') or [''])[0]
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    body = {}
+                result = server.handle(action, body, _access_key(self.headers.get('Authorization')))
+                if 'ResponseMetadata' in result:
+                    status = 401
+                else:
+                    status = 200 if result.get('code') == 10000 else server.config.error_http_status
+                payload = json.dumps(result).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Mock VolcEngine visual API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    for name, default in asdict(MockConfig()).items():
+        if name == 'seed':
+            parser.add_argument('--seed', type=int, default=None)
+        else:
+            parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+    config = MockConfig(**{name: getattr(args, name) for name in asdict(MockConfig())})
+
+    server = MockVisualServer(config, args.host, args.port).start()
+    print(f"Mock visual server listening on {server.endpoint}")
+    print(f"export DREAMAI_VISUAL_ENDPOINT={server.endpoint}")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(server.stats.snapshot(), ensure_ascii=False))
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证生成结果的内容寻址存储
+
+使用方法：
+1. 无需 VolcEngine 凭证，测试启动本地 HTTP 服务提供文件下载
+2. 运行测试：pytest test/test_artifact_store.py
+"""
+
+import hashlib
+import os
+import sys
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.artifact_store import ArtifactStore, url_key
+
+FILES = {
+    '/a.png': b'\x89PNG\r\n\x1a\n' + b'a' * 3000,
+    '/b.png': b'\x89PNG\r\n\x1a\n' + b'b' * 3000,
+    '/c.mp4': b'\x00\x00\x00\x20ftypisom' + b'c' * 3000,
+    '/copy-of-a.png': b'\x89PNG\r\n\x1a\n' + b'a' * 3000,
+}
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    downloads: Counter = Counter()
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        FileHandler.downloads[path] += 1
+        body = FILES.get(path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_store_url_downloads_once(tmp_path):
+    """同一链接只下载一次，签名参数不同也视为同一链接，内容按 SHA-256 存放"""
+    FileHandler.downloads.clear()
+    server, base = _serve()
+    try:
+        store = ArtifactStore(str(tmp_path), chunk_size=1024)
+        first = store.store_url(f"{base}/a.png?x-expires=1&x-signature=one")
+        second = store.store_url(f"{base}/a.png?x-expires=2&x-signature=two")
+        assert FileHandler.downloads['/a.png'] == 1
+        assert first['sha256'] == second['sha256'] == hashlib.sha256(FILES['/a.png']).hexdigest()
+        assert first['mime_type'] == 'image/png'
+        assert second['url'].endswith('x-signature=two')
+        assert store.read(first['sha256']) == FILES['/a.png']
+        with store.open_mmap(first['sha256']) as mapped:
+            assert mapped[:8] == b'\x89PNG\r\n\x1a\n'
+
+        # 内容相同的不同链接只保留一份文件
+        copy = store.store_url(f"{base}/copy-of-a.png")
+        assert copy['path'] == first['path']
+        assert store.total_bytes == len(FILES['/a.png'])
+    finally:
+        server.shutdown()
+
+
+def test_url_key_keeps_non_signature_params():
+    """只去掉签名与过期时间参数，其他查询参数不同的链接视为不同的文件"""
+    signed = url_key("https://tos.example.com/a.png?w=512&X-Tos-Signature=one&X-Tos-Expires=1")
+    assert signed == url_key("https://tos.example.com/a.png?w=512&X-Tos-Signature=two&X-Tos-Expires=2")
+    assert signed == url_key("https://tos.example.com/a.png?w=512&X-Amz-Date=1&Expires=3&Signature=s")
+    assert signed != url_key("https://tos.example.com/a.png?w=1024&X-Tos-Signature=one")
+    assert url_key("https://tos.example.com/a.png?X-Tos-Signature=one") == url_key("https://tos.example.com/a.png")
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    """超出总大小预算时淘汰最久未访问的文件"""
+    server, base = _serve()
+    try:
+        store = ArtifactStore(str(tmp_path), max_bytes=7000)
+        a = store.store_url(f"{base}/a.png")
+        b = store.store_url(f"{base}/b.png")
+        store.read(a['sha256'])
+        c = store.store_url(f"{base}/c.mp4")
+        assert c['mime_type'] == 'video/mp4'
+        assert store.contains(a['sha256']) and store.contains(c['sha256'])
+        assert not store.contains(b['sha256'])
+        assert store.lookup(f"{base}/b.png") is None
+
+        # 重新创建的实例从磁盘恢复用量
+        assert ArtifactStore(str(tmp_path), max_bytes=7000).total_bytes == store.total_bytes
+    finally:
+        server.shutdown()
+
+
+def test_store_urls_reports_failures(tmp_path):
+    """下载失败的链接记录错误，不影响其他链接"""
+    server, base = _serve()
+    try:
+        store = ArtifactStore(str(tmp_path))
+        references = store.store_urls([f"{base}/missing.png", f"{base}/b.png"])
+        assert 'error' in references[0]
+        assert references[1]['size'] == len(FILES['/b.png'])
+        assert os.listdir(os.path.join(str(tmp_path), 'tmp')) == []
+    finally:
+        server.shutdown()
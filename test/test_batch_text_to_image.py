@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证批量文生图工具
+
+使用方法：
+1. 无需 VolcEngine 凭证，测试复用 test_task_poller 中的本地接口服务
+2. 运行测试：pytest test/test_batch_text_to_image.py
+"""
+
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tools.batch_text_to_image
+import utils.polling
+import utils.task_poller
+from test_task_poller import MockRuntime, MockSession, start_fake_server
+from tools.batch_text_to_image import BatchTextToImageTool
+from utils.polling import LatencyHistory
+from utils.reconciler import TaskReconciler
+from utils.task_journal import TaskJournal
+from utils.task_poller import shared_poller
+
+
+def _isolate(monkeypatch, tmp_path):
+    monkeypatch.setenv('DREAMAI_POLL_IMAGE_FIRST_DELAY', '0.01')
+    monkeypatch.setenv('DREAMAI_POLL_IMAGE_MIN_INTERVAL', '0.01')
+    journal = TaskJournal(str(tmp_path / 'journal.db'))
+    monkeypatch.setattr(tools.batch_text_to_image, 'task_journal', journal)
+    monkeypatch.setattr(tools.batch_text_to_image, 'task_reconciler', TaskReconciler(journal, shared_poller))
+    monkeypatch.setattr(utils.task_poller, 'task_journal', journal)
+    monkeypatch.setattr(utils.polling, 'latency_history', LatencyHistory())
+
+
+def test_batch_streams_every_result(monkeypatch, tmp_path):
+    """每条提示词各提交一次任务，全部结果与汇总按完成顺序输出"""
+    _isolate(monkeypatch, tmp_path)
+    server = start_fake_server('batch_ak', 'batch_sk')
+    try:
+        tool = BatchTextToImageTool(runtime=MockRuntime('batch_ak', 'batch_sk'), session=MockSession())
+        prompts = ['一只猫', '一只狗', '一只鸟', '一条鱼', '一匹马']
+        messages = list(tool._invoke({'prompts': '\n'.join(prompts), 'concurrency': 3}))
+        json_messages = [m.message.json_object for m in messages if m.type == m.MessageType.JSON]
+
+        results, summary = json_messages[:-1], json_messages[-1]
+        assert summary == {"total": 5, "succeeded": 5, "failed": 0, "pending": 0}
+        assert sorted(result['index'] for result in results) == list(range(5))
+        assert {result['prompt'] for result in results} == set(prompts)
+        assert all(result['image_urls'] == ['https://example.com/a.png'] for result in results)
+        assert len({result['task_id'] for result in results}) == 5
+    finally:
+        server.shutdown()
+
+
+def test_batch_rejects_invalid_parameters(monkeypatch, tmp_path):
+    """参数有误时不提交任何任务"""
+    _isolate(monkeypatch, tmp_path)
+    tool = BatchTextToImageTool(runtime=MockRuntime('batch_ak', 'batch_sk'), session=MockSession())
+    messages = list(tool._invoke({'prompts': '一只猫', 'seeds': '1, abc'}))
+    assert messages[-1].message.text == "Error: seeds must be comma separated integers"
+
+    messages = list(tool._invoke({'prompts': '一只猫', 'model_version': '4.0', 'width': 1024}))
+    assert messages[-1].message.text == "Error: For 4.0 model, width and height must be specified together or not at all"
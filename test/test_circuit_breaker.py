@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证接口故障时的熔断与快速失败
+
+使用方法：
+1. 无需 VolcEngine 凭证，端到端用例使用 mock_visual_server
+2. 运行测试：pytest test/test_circuit_breaker.py
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_visual_server import MockConfig, MockVisualServer
+from test_mock_visual_server import _isolate
+from test_task_poller import MockRuntime, MockSession
+from tools.text_to_image import TextToImageTool
+from utils.circuit_breaker import (CIRCUIT_OPEN_CODE, CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers,
+                                   circuit_breakers)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_opens_on_failure_rate_and_recovers_through_probe():
+    """失败比例达到阈值后打开，冷却后只放行一个试探请求，试探成功后关闭"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, open_seconds=10, clock=clock)
+    for failed in (False, True, False):
+        assert breaker.acquire() is False
+        breaker.record(failed)
+    assert breaker.state == CLOSED
+    breaker.record(True)
+    assert breaker.state == OPEN
+    assert breaker.acquire() is None
+    # 熔断期间非试探请求（如进行中任务的查询）的结果不影响状态
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.acquire() is True
+    assert breaker.acquire() is None
+    breaker.record(True, probe=True)
+    assert breaker.state == OPEN and breaker.retry_after() == 10
+
+    clock.now = 20
+    assert breaker.acquire() is True
+    breaker.record(False, probe=True)
+    assert breaker.state == CLOSED
+
+
+def test_only_submissions_are_rejected_and_slow_calls_fail():
+    """耗时过长的请求记为失败；熔断后提交直接返回错误，查询照常发送"""
+    breakers = CircuitBreakers(enabled=True, slow_call_seconds=0.01, window=2, min_calls=2, failure_rate=1.0,
+                               open_seconds=60)
+    sent = []
+
+    def slow_send():
+        sent.append(1)
+        time.sleep(0.02)
+        return {'code': 10000, 'data': {}}
+
+    for _ in range(2):
+        breakers.call('host', 'CVSync2AsyncSubmitTask', {'req_key': 'k'}, slow_send)
+    assert breakers.breaker('host', 'k').state == OPEN
+
+    rejected = breakers.call('host', 'CVSync2AsyncSubmitTask', {'req_key': 'k'}, slow_send)
+    assert rejected['code'] == CIRCUIT_OPEN_CODE and 'circuit open' in rejected['message']
+    assert rejected['ResponseMetadata']['Error']['Code'] == 'CircuitOpen'
+    breakers.call('host', 'CVSync2AsyncGetResult', {'req_key': 'k', 'task_id': 't'}, slow_send)
+    assert len(sent) == 3
+    # CVProcess 上的 cv_get_result 同样是查询，不会被拒绝
+    breakers.call('host', 'CVProcess', {'req_key': 'cv_get_result', 'task_id': 't'}, slow_send)
+    assert len(sent) == 4
+
+    # 接口地址级的熔断器同样打开，其他 req_key 的提交也快速失败
+    assert breakers.call('host', 'CVProcess', {'req_key': 'other'}, slow_send)['code'] == CIRCUIT_OPEN_CODE
+    assert breakers.call('other-host', 'CVProcess', {'req_key': 'k'}, lambda: {'code': 10000})['code'] == 10000
+
+
+def test_tool_fails_fast_while_endpoint_is_down(monkeypatch, tmp_path):
+    """接口持续返回内部错误时，熔断打开后的调用不再请求接口而是立即返回错误"""
+    with MockVisualServer(MockConfig(error_rate=1.0)) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        monkeypatch.setattr(circuit_breakers, 'options', {**circuit_breakers.options, 'min_calls': 3})
+        tool = TextToImageTool(runtime=MockRuntime('breaker_ak', 'breaker_sk'), session=MockSession())
+
+        for _ in range(3):
+            messages = list(tool._invoke({'prompt': '一只猫'}))
+            assert 'Internal Error' in messages[-1].message.text
+        submitted = server.stats.requests['CVSync2AsyncSubmitTask']
+
+        started_at = time.monotonic()
+        messages = list(tool._invoke({'prompt': '一只猫'}))
+        assert 'circuit open' in messages[-1].message.text
+        assert time.monotonic() - started_at < 1.0
+        assert server.stats.requests['CVSync2AsyncSubmitTask'] == submitted
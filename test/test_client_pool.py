@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证 VisualService 客户端池
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行测试：python test/test_client_pool.py 或 pytest test/test_client_pool.py
+"""
+
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import utils.client_pool
+from mock_visual_server import MockConfig, MockVisualServer
+from utils.circuit_breaker import CLOSED, CircuitBreakers
+from utils.client_pool import ClientPool, PooledVisualService, get_visual_service, set_endpoint
+from utils.rate_limit import RateLimiter
+
+
+def test_reuse_per_credentials():
+    """相同凭证复用同一实例，不同凭证互不影响"""
+    service_a = get_visual_service('ak_a', 'sk_a')
+    service_b = get_visual_service('ak_b', 'sk_b')
+    assert service_a is get_visual_service('ak_a', 'sk_a')
+    assert service_a is not service_b
+    assert isinstance(service_a, PooledVisualService)
+    assert service_a.service_info.credentials.ak == 'ak_a'
+    assert service_b.service_info.credentials.ak == 'ak_b'
+
+
+def test_lru_eviction():
+    """超过容量时淘汰最久未使用的客户端"""
+    evicted = []
+    pool = ClientPool(lambda ak, sk: object(), max_size=2, on_evict=evicted.append)
+    first = pool.get('ak1', 'sk1')
+    pool.get('ak2', 'sk2')
+    pool.get('ak1', 'sk1')
+    pool.get('ak3', 'sk3')
+    assert len(pool) == 2
+    assert len(evicted) == 1
+    assert pool.get('ak1', 'sk1') is first
+
+
+def test_idle_ttl():
+    """空闲超时的客户端会被重建"""
+    evicted = []
+    pool = ClientPool(lambda ak, sk: object(), idle_ttl=0.0, on_evict=evicted.append)
+    first = pool.get('ak1', 'sk1')
+    second = pool.get('ak1', 'sk1')
+    assert first is not second
+    assert evicted == [first]
+
+
+if __name__ == '__main__':
+    test_reuse_per_credentials()
+    test_lru_eviction()
+    test_idle_ttl()
+    print("ClientPool 测试通过")
+
+
+def test_tool_modules_defer_sdk_import():
+    """加载工具模块时不导入火山引擎 SDK，首次创建客户端时才导入"""
+    import subprocess
+
+    code = (
+        "import sys\n"
+        "import tools.text_to_image, tools.batch_text_to_image, tools.video_generation, tools.cv_get_result\n"
+        "assert not any(name.startswith('volcengine') for name in sys.modules), 'sdk imported at load'\n"
+        "from utils.warmup import run_warm_up\n"
+        "run_warm_up()\n"
+        "assert 'volcengine.visual.VisualService' in sys.modules\n"
+        "print('ok')\n"
+    )
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               env={**os.environ, 'DREAMAI_WARMUP_CREDENTIALS': 'warm_ak,warm_sk'})
+    assert 'ok' in completed.stdout, completed.stderr
+
+
+def test_non_200_json_body_is_returned(monkeypatch):
+    """非 200 的 JSON 错误响应以 dict 返回：限流会被重试，且不计为接口故障"""
+    breakers = CircuitBreakers(enabled=True, window=2, min_calls=2, failure_rate=0.5)
+    monkeypatch.setattr(utils.client_pool, 'circuit_breakers', breakers)
+    monkeypatch.setattr(utils.client_pool, 'rate_limiter',
+                        RateLimiter(submit_qps=0, query_qps=0, max_retries=2, base_delay=0.01))
+    with MockVisualServer(MockConfig(throttle_rate=1.0, error_http_status=429, invalid_keys='bad_ak')) as server:
+        service = PooledVisualService('status_ak', 'status_sk')
+        set_endpoint(service, server.endpoint)
+        response = service.cv_sync2async_submit_task({'req_key': 'jimeng_t2i_v31', 'prompt': 'cat'})
+        assert response['code'] == 50429
+        assert server.stats.requests['CVSync2AsyncSubmitTask'] == 3
+        assert breakers.breaker(service.service_info.host).state == CLOSED
+
+        service = PooledVisualService('bad_ak', 'bad_sk')
+        set_endpoint(service, server.endpoint)
+        response = service.cv_sync2async_get_result({'req_key': 'jimeng_t2i_v31', 'task_id': 't'})
+        assert response['ResponseMetadata']['Error']['Code'] == 'InvalidAccessKey'
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证凭证验证与验证结果缓存
+
+使用方法：
+1. 无需 VolcEngine 凭证，验证请求发往 mock_visual_server
+2. 运行测试：pytest test/test_credential_check.py
+"""
+
+import os
+import socket
+import sys
+
+import pytest
+from dify_plugin.errors.tool import ToolProviderCredentialValidationError
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_visual_server import MockConfig, MockVisualServer
+from test_mock_visual_server import _isolate
+from test_task_poller import MockRuntime, MockSession
+from provider.dreamai import DreamaiProvider
+from tools.text_to_image import TextToImageTool
+from utils.client_pool import credential_fingerprint
+from utils.credential_check import CredentialValidator, auth_error, credential_validator
+
+
+def test_validate_probes_once_and_caches_verdicts(monkeypatch, tmp_path):
+    """有效与无效凭证并发验证，结果按凭证指纹缓存，refresh 时重新验证"""
+    with MockVisualServer(MockConfig(invalid_keys='bad_ak')) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        validator = CredentialValidator(timeout=5)
+        good, bad = validator.validate([('good_ak', 'good_sk'), ('bad_ak', 'bad_sk')])
+        assert good.valid is True
+        assert bad.valid is False and bad.message.startswith('InvalidAccessKey')
+        assert server.stats.requests['CVSync2AsyncGetResult'] == 2
+
+        assert validator.validate([('good_ak', 'good_sk'), ('bad_ak', 'bad_sk')]) == [good, bad]
+        assert server.stats.requests['CVSync2AsyncGetResult'] == 2
+        assert 'InvalidAccessKey' in validator.cached_error('bad_ak', 'bad_sk')
+        assert validator.cached_error('good_ak', 'good_sk') is None
+
+        validator.validate([('good_ak', 'good_sk')], refresh=True)
+        assert server.stats.requests['CVSync2AsyncGetResult'] == 3
+
+
+def test_unreachable_endpoint_is_inconclusive(monkeypatch, tmp_path):
+    """接口无法访问时无法判断，不缓存"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    _isolate(monkeypatch, tmp_path, f"http://127.0.0.1:{port}")
+    validator = CredentialValidator(timeout=2)
+    [verdict] = validator.validate([('offline_ak', 'offline_sk')])
+    assert verdict.valid is None
+    assert validator.cached(credential_fingerprint('offline_ak', 'offline_sk')) is None
+
+
+def test_record_learns_from_responses():
+    """提交时的鉴权错误记为无效，成功响应记为有效"""
+    validator = CredentialValidator()
+    rejected = {'ResponseMetadata': {'Error': {'Code': 'SignatureDoesNotMatch', 'Message': 'bad signature'}}}
+    assert auth_error(rejected) == 'SignatureDoesNotMatch: bad signature'
+    assert auth_error({'code': 50500, 'message': 'Internal Error'}) is None
+    validator.record('fp', rejected)
+    assert validator.is_invalid('fp')
+    validator.record('fp', {'code': 10000, 'data': {'task_id': 't'}})
+    assert validator.cached('fp').valid is True
+
+
+def test_provider_rejects_invalid_and_tool_fails_fast(monkeypatch, tmp_path):
+    """provider 保存凭证时发现无效凭证，之后的工具调用不再请求接口"""
+    with MockVisualServer(MockConfig(invalid_keys='rejected_ak')) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        provider = DreamaiProvider()
+        provider._validate_credentials({'volcengine_access_key': 'accepted_ak', 'volcengine_secret_key': 'sk'})
+        with pytest.raises(ToolProviderCredentialValidationError, match='Extra credential #1 was rejected'):
+            provider._validate_credentials({
+                'volcengine_access_key': 'accepted_ak', 'volcengine_secret_key': 'sk',
+                'volcengine_extra_credentials': 'rejected_ak,sk',
+            })
+        with pytest.raises(ToolProviderCredentialValidationError, match='Primary credential was rejected'):
+            provider._validate_credentials({'volcengine_access_key': 'rejected_ak', 'volcengine_secret_key': 'sk'})
+
+        requests = sum(server.stats.requests.values())
+        tool = TextToImageTool(runtime=MockRuntime('rejected_ak', 'sk'), session=MockSession())
+        messages = list(tool._invoke({'prompt': '一只猫'}))
+        assert len(messages) == 1 and 'rejected the credentials' in messages[0].message.text
+        assert sum(server.stats.requests.values()) == requests
+    credential_validator.clear()
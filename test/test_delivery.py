@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证 base64 生成结果的解码与 blob 投递
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行测试：pytest test/test_delivery.py
+"""
+
+import base64
+import hashlib
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from test_task_poller import MockRuntime, MockSession
+from tools.text_to_image import TextToImageTool
+from utils.delivery import decode_base64, deliver_blobs, iter_artifacts, sniff_mime_type
+
+PNG = b'\x89PNG\r\n\x1a\n' + os.urandom(5000)
+JPEG = b'\xff\xd8\xff\xe0' + os.urandom(3001)
+MP4 = b'\x00\x00\x00\x20ftypisom' + os.urandom(2002)
+
+
+def test_decode_base64_in_chunks():
+    """分块解码与整体解码结果一致，兼容缺失填充、换行与 data URL 前缀"""
+    encoded = base64.b64encode(PNG).decode()
+    assert decode_base64(encoded, chunk_chars=64) == PNG
+    assert decode_base64(encoded, chunk_chars=66) == PNG
+    assert decode_base64(encoded.rstrip('=')) == PNG
+    assert decode_base64(base64.encodebytes(PNG).decode(), chunk_chars=64) == PNG
+    assert decode_base64('data:image/png;base64,' + encoded) == PNG
+
+
+def test_sniff_mime_type():
+    """根据文件头识别图片与视频格式"""
+    assert sniff_mime_type(PNG[:16]) == 'image/png'
+    assert sniff_mime_type(JPEG[:16]) == 'image/jpeg'
+    assert sniff_mime_type(b'RIFF\x00\x00\x00\x00WEBPVP8 ') == 'image/webp'
+    assert sniff_mime_type(MP4[:16]) == 'video/mp4'
+    assert sniff_mime_type(b'unknown', 'image/png') == 'image/png'
+
+
+def test_iter_artifacts_names_files():
+    """单个结果不带序号，多个结果按序号命名并使用识别出的扩展名"""
+    single = list(iter_artifacts(base64.b64encode(MP4).decode(), 'video/mp4', 'video'))
+    assert [artifact.filename for artifact in single] == ['video.mp4']
+    multiple = list(iter_artifacts([base64.b64encode(PNG).decode(), base64.b64encode(JPEG).decode()], name='image'))
+    assert [artifact.filename for artifact in multiple] == ['image_1.png', 'image_2.jpg']
+
+
+def test_deliver_blobs_keeps_references_only():
+    """blob 消息携带解码后的字节，返回的引用不包含 base64 数据"""
+    tool = TextToImageTool(runtime=MockRuntime('delivery_ak', 'delivery_sk'), session=MockSession())
+    encoded = [base64.b64encode(PNG).decode(), base64.b64encode(JPEG).decode()]
+    generator = deliver_blobs(tool, encoded, 'image/png', 'image')
+    messages = []
+    try:
+        while True:
+            messages.append(next(generator))
+    except StopIteration as stop:
+        references = stop.value
+
+    assert [message.message.blob for message in messages] == [PNG, JPEG]
+    assert [message.meta['mime_type'] for message in messages] == ['image/png', 'image/jpeg']
+    assert references[0] == {
+        "index": 0,
+        "filename": "image_1.png",
+        "mime_type": "image/png",
+        "size": len(PNG),
+        "sha256": hashlib.sha256(PNG).hexdigest(),
+    }
+    assert all('base64' not in str(reference) for reference in references)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证排队过久任务的对冲提交
+
+使用方法：
+1. 无需 VolcEngine 凭证，任务提交到 mock_visual_server，首个任务一直停留在排队中
+2. 运行测试：pytest test/test_hedging.py
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tools.text_to_image
+import utils.hedging
+from mock_visual_server import MockConfig, MockVisualServer
+from test_mock_visual_server import _isolate
+from test_task_poller import MockRuntime, MockSession
+from tools.text_to_image import TextToImageTool
+from utils.hedging import HedgeBudget, TaskHedger
+from utils.metrics import hedge_races_total, hedges_total
+from utils.polling import LatencyHistory
+
+
+class StuckFirstServer(MockVisualServer):
+    """第一个提交的任务一直排队，之后提交的任务按配置完成"""
+
+    def _submit(self, body: dict, access_key: str) -> dict:
+        response = super()._submit(body, access_key)
+        task_id = response['data']['task_id'] if response['code'] == 10000 else None
+        if task_id and len(self.tasks) == 1:
+            task = self.tasks[task_id]
+            task.running_at = task.done_at = time.monotonic() + 3600
+        return response
+
+
+def _history(queue_seconds: float, samples: int = 20) -> LatencyHistory:
+    history = LatencyHistory()
+    for _ in range(samples):
+        history.record('jimeng_t2i_v31', queue_seconds, queue_seconds + 0.05)
+    return history
+
+
+def test_budget_accumulates_per_credential():
+    """每次提交积累额度，额度满 1 才能对冲一次，且不超过上限"""
+    budget = HedgeBudget(ratio=0.5, burst=1.5)
+    assert not budget.try_spend('a')
+    budget.deposit('a')
+    assert not budget.try_spend('a')
+    for _ in range(5):
+        budget.deposit('a')
+    assert budget.tokens('a') == 1.5
+    assert budget.try_spend('a') and not budget.try_spend('a')
+    assert budget.tokens('b') == 0.0
+
+
+def test_threshold_needs_history():
+    """未开启或历史样本不足时不对冲，阈值不低于最短排队时间"""
+    assert TaskHedger(enabled=False, history=_history(1.0)).threshold('jimeng_t2i_v31') is None
+    hedger = TaskHedger(enabled=True, min_samples=20, min_delay=0.5, history=_history(2.0, samples=10))
+    assert hedger.threshold('jimeng_t2i_v31') is None
+    hedger = TaskHedger(enabled=True, min_samples=20, min_delay=0.5, history=_history(2.0))
+    assert hedger.threshold('jimeng_t2i_v31') == 2.0
+    hedger = TaskHedger(enabled=True, min_samples=20, min_delay=0.5, history=_history(0.1))
+    assert hedger.threshold('jimeng_t2i_v31') == 0.5
+
+
+def _patch_hedger(monkeypatch, hedger: TaskHedger) -> None:
+    monkeypatch.setattr(tools.text_to_image, 'task_hedger', hedger)
+    monkeypatch.setattr(utils.hedging, 'task_journal', tools.text_to_image.task_journal)
+    monkeypatch.setattr(utils.hedging, 'task_reconciler', tools.text_to_image.task_reconciler)
+
+
+def test_stuck_task_is_hedged_and_hedge_wins(monkeypatch, tmp_path):
+    """原任务排队超过历史分位数后提交对冲任务，返回先完成的对冲任务结果"""
+    with StuckFirstServer(MockConfig(generation_median=0.05)) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        budget = HedgeBudget(ratio=1.0, burst=1.0)
+        _patch_hedger(monkeypatch, TaskHedger(enabled=True, min_delay=0.2, budget=budget, history=_history(0.1)))
+        wins = hedge_races_total.value(req_key='jimeng_t2i_v31', winner='hedge')
+
+        tool = TextToImageTool(runtime=MockRuntime('hedge_ak', 'hedge_sk'), session=MockSession())
+        messages = list(tool._invoke({'prompt': '一只猫', 'deadline_seconds': 30}))
+        result = messages[-1].message.json_object
+        assert server.stats.requests['CVSync2AsyncSubmitTask'] == 2
+        stuck_task_id = next(iter(server.tasks))
+        assert result['task_id'] != stuck_task_id and result['image_urls']
+        assert hedge_races_total.value(req_key='jimeng_t2i_v31', winner='hedge') == wins + 1
+        assert budget.tokens(tools.text_to_image.credential_fingerprint('hedge_ak', 'hedge_sk')) == 0.0
+
+
+def test_no_hedge_without_budget(monkeypatch, tmp_path):
+    """额度不足时不对冲，只等待原任务"""
+    with MockVisualServer(MockConfig(queue_time=0.5, generation_median=0.05)) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        hedger = TaskHedger(enabled=True, min_delay=0.1, budget=HedgeBudget(ratio=0.1), history=_history(0.05))
+        _patch_hedger(monkeypatch, hedger)
+        skipped = hedges_total.value(req_key='jimeng_t2i_v31', outcome='no_budget')
+
+        tool = TextToImageTool(runtime=MockRuntime('budget_ak', 'budget_sk'), session=MockSession())
+        messages = list(tool._invoke({'prompt': '一只猫', 'deadline_seconds': 30}))
+        assert messages[-1].message.json_object['image_urls']
+        assert server.stats.requests['CVSync2AsyncSubmitTask'] == 1
+        assert hedges_total.value(req_key='jimeng_t2i_v31', outcome='no_budget') == skipped + 1
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证图生图输入图像的预处理
+
+使用方法：
+1. 无需 VolcEngine 凭证，需要安装 Pillow
+2. 运行测试：pytest test/test_image_preprocess.py
+"""
+
+import base64
+import io
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.image_preprocess import ImagePreprocessor, image_preprocessor, target_size
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def _encode(image, format: str, **options) -> str:
+    output = io.BytesIO()
+    image.save(output, format=format, **options)
+    return base64.b64encode(output.getvalue()).decode('ascii')
+
+
+def _open(image_base64: str):
+    return Image.open(io.BytesIO(base64.b64decode(image_base64)))
+
+
+def _noise(size: tuple[int, int], mode: str = 'RGB'):
+    # 随机像素，避免纯色图像被编码器压缩得过小
+    return Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+
+
+def test_target_size():
+    """指定输出宽高时刚好覆盖输出尺寸，否则限制长边；不放大"""
+    assert target_size((4000, 3000), None, None, 2016) == (2016, 1512)
+    assert target_size((4000, 3000), 1024, 1024, 2016) == (1365, 1024)
+    assert target_size((800, 600), 1024, 1024, 2016) == (800, 600)
+
+
+def test_downsizes_and_caches_by_content():
+    """大图缩小并重新编码为 JPEG，同一张图再次处理时命中缓存"""
+    preprocessor = ImagePreprocessor(max_edge=512)
+    source = _encode(_noise((2048, 1024)), 'PNG')
+    processed = preprocessor.process(source)
+    assert len(processed) < len(source) / 4
+    with _open(processed) as image:
+        assert image.format == 'JPEG' and image.size == (512, 256)
+
+    assert preprocessor.process(f"data:image/png;base64,{source}") == processed
+    assert (preprocessor.hits, preprocessor.misses) == (1, 1)
+    # 目标尺寸不同时单独处理
+    with _open(preprocessor.process(source, 600, 600)) as image:
+        assert image.size == (1200, 600)
+
+
+def test_keeps_transparency_and_passes_through():
+    """带透明通道的图像保持 PNG；无需缩小且重新编码不更小时、或无法解码时原样返回"""
+    preprocessor = ImagePreprocessor(max_edge=256)
+    with _open(preprocessor.process(_encode(_noise((1024, 1024), 'RGBA'), 'PNG'))) as image:
+        assert image.format == 'PNG' and image.mode == 'RGBA' and image.size == (256, 256)
+
+    small = _encode(_noise((64, 64)), 'JPEG', quality=60)
+    assert preprocessor.process(small) == small
+    assert preprocessor.process('not base64!') == 'not base64!'
+    assert ImagePreprocessor(enabled=False).process(small) == small
+
+
+@pytest.mark.skipif(bool(os.getenv('DREAMAI_IMAGE_PREPROCESS')), reason="DREAMAI_IMAGE_PREPROCESS is set")
+def test_disabled_by_default_with_per_call_override():
+    """预处理有损，共享实例默认关闭；调用方可按次开启或关闭"""
+    assert not image_preprocessor.enabled
+
+    source = _encode(_noise((1024, 512)), 'PNG')
+    preprocessor = ImagePreprocessor(enabled=False, max_edge=256)
+    assert preprocessor.process(source) == source
+    with _open(preprocessor.process(source, enabled=True)) as image:
+        assert image.size == (256, 128)
+    assert ImagePreprocessor(max_edge=256).process(source, enabled=False) == source
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证多凭证密钥池的选择、冷却与 task_id 固定
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行测试：pytest test/test_key_pool.py
+"""
+
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.key_pool
+from utils.key_pool import ApiKey, KeyPool, parse_api_keys
+from utils.rate_limit import TaskSlots
+
+CREDENTIALS = {
+    'volcengine_access_key': 'ak_main',
+    'volcengine_secret_key': 'sk_main',
+    'volcengine_extra_credentials': 'ak_2,sk_2,3; ak_3,sk_3\nak_main,sk_main',
+}
+
+
+def test_parse_api_keys():
+    """主凭证在首位，额外凭证支持权重，重复凭证去重"""
+    keys = parse_api_keys(CREDENTIALS)
+    assert [(key.access_key, key.weight) for key in keys] == [('ak_main', 1), ('ak_2', 3), ('ak_3', 1)]
+
+    with pytest.raises(ValueError):
+        parse_api_keys({**CREDENTIALS, 'volcengine_extra_credentials': 'only_access_key'})
+    with pytest.raises(ValueError):
+        parse_api_keys({**CREDENTIALS, 'volcengine_extra_credentials': 'ak_2,sk_2,0'})
+
+
+def test_weighted_round_robin():
+    """加权轮询按权重比例分配"""
+    pool = KeyPool(TaskSlots())
+    keys = parse_api_keys(CREDENTIALS)
+    picks = Counter(pool.select(keys, 'weighted_round_robin').access_key for _ in range(50))
+    assert picks == {'ak_main': 10, 'ak_2': 30, 'ak_3': 10}
+
+
+def test_least_outstanding_and_cooldown():
+    """优先选择进行中任务最少的凭证，冷却中的凭证被跳过"""
+    slots = TaskSlots()
+    pool = KeyPool(slots, cooldown=60)
+    keys = [ApiKey('ak_a', 'sk_a'), ApiKey('ak_b', 'sk_b')]
+    slots.try_acquire(keys[0].fingerprint, 'jimeng_t2i_v31')
+    assert pool.select(keys).access_key == 'ak_b'
+
+    pool.cool_down(keys[1].fingerprint)
+    assert pool.select(keys).access_key == 'ak_a'
+    # 全部冷却时选择最早恢复的凭证
+    pool.cool_down(keys[0].fingerprint)
+    assert pool.select(keys).access_key == 'ak_b'
+
+
+class FakeClient:
+    def __init__(self, access_key, responses):
+        self.access_key = access_key
+        self.responses = responses
+
+    async def json_api(self, api, form):
+        return self.responses[self.access_key]
+
+
+def test_submit_fails_over_and_pins_task(monkeypatch):
+    """被限流的凭证冷却后改用下一组提交，task_id 固定到实际提交的凭证"""
+    responses = {
+        'ak_a': {'code': 50430, 'message': 'concurrency limit'},
+        'ak_b': {'code': 10000, 'data': {'task_id': 'task-b'}},
+    }
+    monkeypatch.setattr(utils.key_pool, 'get_async_client', lambda ak, sk: FakeClient(ak, responses))
+    pool = KeyPool(TaskSlots())
+    credentials = {'volcengine_access_key': 'ak_a', 'volcengine_secret_key': 'sk_a',
+                   'volcengine_extra_credentials': 'ak_b,sk_b'}
+
+    response = pool.submit(credentials, {'req_key': 'jimeng_t2i_v31'})
+    assert response['data']['task_id'] == 'task-b'
+    assert pool.cooling_down(ApiKey('ak_a', 'sk_a').fingerprint)
+    assert pool.client_for_task(credentials, 'task-b').access_key == 'ak_b'
+    # 未知任务使用主凭证
+    assert pool.client_for_task(credentials, 'unknown-task').access_key == 'ak_a'
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证分阶段计时与 Prometheus 指标导出
+
+使用方法：
+1. 无需 VolcEngine 凭证，端到端用例使用 mock_visual_server
+2. 运行测试：pytest test/test_metrics.py
+"""
+
+import os
+import sys
+import time
+import urllib.request
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tools.cv_get_result
+import tools.text_to_image
+from mock_visual_server import MockConfig, MockVisualServer
+from test_mock_visual_server import _isolate
+from test_task_poller import MockRuntime, MockSession
+from tools.cv_get_result import CVGetResultTool
+from tools.text_to_image import TextToImageTool
+from utils.metrics import (InvocationTimer, MetricsRegistry, api_request_seconds, invocations_total, phase_seconds,
+                           serve_metrics)
+
+
+def test_render_prometheus_text():
+    """计数器与直方图按 Prometheus 文本格式输出，标签值转义"""
+    registry = MetricsRegistry()
+    counter = registry.counter('demo_total', 'Demo counter', ('tool',))
+    histogram = registry.histogram('demo_seconds', 'Demo histogram', ('tool',), buckets=(0.1, 1.0))
+    counter.inc(tool='a"b')
+    counter.inc(2, tool='a"b')
+    histogram.observe(0.05, tool='x')
+    histogram.observe(0.5, tool='x')
+    assert registry.counter('demo_total', 'ignored', ('tool',)) is counter
+
+    lines = registry.render().splitlines()
+    assert '# TYPE demo_total counter' in lines
+    assert 'demo_total{tool="a\\"b"} 3' in lines
+    assert 'demo_seconds_bucket{tool="x",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{tool="x",le="1"} 2' in lines
+    assert 'demo_seconds_bucket{tool="x",le="+Inf"} 2' in lines
+    assert 'demo_seconds_sum{tool="x"} 0.55' in lines
+    assert 'demo_seconds_count{tool="x"} 2' in lines
+
+
+def test_timer_derives_queue_and_generation():
+    """排队与生成耗时由首次观察到的状态推算，finish 只汇总一次"""
+    timer = InvocationTimer('metrics_test', 'req_a')
+    with timer.phase('submit'):
+        time.sleep(0.01)
+    timer.submitted()
+    timer.observe_status('in_queue')
+    time.sleep(0.02)
+    timer.observe_status('generating')
+    time.sleep(0.03)
+    timer.observe_status('generating')
+    timer.observe_status('done')
+    timer.add_references([{'size': 10}, {'url': 'x', 'error': 'failed'}])
+    timer.finish('success')
+    timer.finish('error')
+
+    assert timer.polls == 4 and timer.bytes == 10
+    assert timer.phases['queue_wait'] >= 0.02
+    assert timer.phases['generation'] >= 0.03
+    assert timer.phases['total'] >= timer.phases['submit'] + timer.phases['generation']
+    assert invocations_total.value(tool='metrics_test', req_key='req_a', outcome='success') == 1
+    assert invocations_total.value(tool='metrics_test', req_key='req_a', outcome='error') == 0
+    assert phase_seconds.count(tool='metrics_test', req_key='req_a', phase='generation') == 1
+
+
+def test_cv_get_result_records_outcome(monkeypatch, tmp_path):
+    """查询工具同样记录调用结果：等待到任务完成记为 success，仍在进行中记为 pending"""
+    with MockVisualServer(MockConfig(queue_time=0.5, generation_median=0.05)) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        monkeypatch.setattr(tools.cv_get_result, 'task_journal', tools.text_to_image.task_journal)
+        labels = {'tool': 'cv_get_result', 'req_key': 'jimeng_t2i_v31'}
+        before = {outcome: invocations_total.value(outcome=outcome, **labels) for outcome in ('success', 'pending')}
+        tool = CVGetResultTool(runtime=MockRuntime('result_ak', 'result_sk'), session=MockSession())
+
+        task_id = server.handle('CVSync2AsyncSubmitTask', {'req_key': 'jimeng_t2i_v31'}, 'result_ak')['data']['task_id']
+        list(tool._invoke({'req_key': 'jimeng_t2i_v31', 'task_id': task_id}))
+        assert invocations_total.value(outcome='pending', **labels) == before['pending'] + 1
+
+        list(tool._invoke({'req_key': 'jimeng_t2i_v31', 'task_id': task_id, 'wait_seconds': 5}))
+        assert invocations_total.value(outcome='success', **labels) == before['success'] + 1
+        assert phase_seconds.count(phase='poll', **labels) >= 2
+
+
+def test_tool_invocation_records_phases(monkeypatch, tmp_path):
+    """工具调用经模拟服务完成后记录各阶段耗时，并可通过 /metrics 抓取"""
+    with MockVisualServer(MockConfig(queue_time=0.05, generation_median=0.1)) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        labels = {'tool': 'text_to_image', 'req_key': 'jimeng_t2i_v31'}
+        before = invocations_total.value(outcome='success', **labels)
+        queries_before = api_request_seconds.count(api='CVSync2AsyncGetResult')
+
+        tool = TextToImageTool(runtime=MockRuntime('metrics_ak', 'metrics_sk'), session=MockSession())
+        list(tool._invoke({'prompt': '一只猫', 'return_url': False}))
+
+        assert invocations_total.value(outcome='success', **labels) == before + 1
+        for phase in ('build', 'submit', 'generation', 'delivery', 'total'):
+            assert phase_seconds.count(phase=phase, **labels) >= 1
+        assert api_request_seconds.count(api='CVSync2AsyncGetResult') > queries_before
+
+    http_server = serve_metrics(port=0, host='127.0.0.1')
+    try:
+        port = http_server.server_address[1]
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode('utf-8')
+        assert '# TYPE dreamai_phase_seconds histogram' in body
+        assert 'dreamai_invocations_total{tool="text_to_image",req_key="jimeng_t2i_v31",outcome="success"}' in body
+    finally:
+        http_server.shutdown()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证模拟视觉接口服务与 DREAMAI_VISUAL_ENDPOINT 切换
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行测试：pytest test/test_mock_visual_server.py
+"""
+
+import json
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tools.motion_imitation
+import tools.text_to_image
+import tools.video_generation
+import utils.polling
+import utils.task_poller
+from mock_visual_server import TINY_PNG, MockConfig, MockVisualServer
+from test_task_poller import MockRuntime, MockSession
+from tools.motion_imitation import MotionImitationTool
+from tools.text_to_image import TextToImageTool
+from tools.video_generation import VideoGenerationTool
+from utils.client_pool import credential_fingerprint, get_visual_service
+from utils.polling import LatencyHistory
+from utils.reconciler import TaskReconciler
+from utils.task_journal import TaskJournal
+from utils.task_poller import shared_poller
+from utils.url_preflight import UrlPreflight
+
+
+def _isolate(monkeypatch, tmp_path, endpoint):
+    monkeypatch.setenv('DREAMAI_VISUAL_ENDPOINT', endpoint)
+    monkeypatch.setenv('DREAMAI_POLL_IMAGE_FIRST_DELAY', '0.01')
+    monkeypatch.setenv('DREAMAI_POLL_IMAGE_MIN_INTERVAL', '0.01')
+    journal = TaskJournal(str(tmp_path / 'journal.db'))
+    monkeypatch.setattr(tools.text_to_image, 'task_journal', journal)
+    monkeypatch.setattr(tools.text_to_image, 'task_reconciler', TaskReconciler(journal, shared_poller))
+    monkeypatch.setattr(utils.task_poller, 'task_journal', journal)
+    monkeypatch.setattr(utils.polling, 'latency_history', LatencyHistory())
+
+
+def test_task_status_follows_configured_timing():
+    """任务按排队与生成耗时依次经历 in_queue、generating、done"""
+    server = MockVisualServer(MockConfig(queue_time=0.05, generation_median=0.05))
+    submit = server.handle('CVSync2AsyncSubmitTask', {'req_key': 'jimeng_t2i_v31'}, 'ak')
+    task_id = submit['data']['task_id']
+    query = {'req_key': 'jimeng_t2i_v31', 'task_id': task_id}
+    assert server.handle('CVSync2AsyncGetResult', query, 'ak')['data']['status'] == 'in_queue'
+    time.sleep(0.06)
+    assert server.handle('CVSync2AsyncGetResult', query, 'ak')['data']['status'] == 'generating'
+    time.sleep(0.06)
+    done = server.handle('CVSync2AsyncGetResult', query, 'ak')['data']
+    assert done['status'] == 'done' and len(done['image_urls']) == 1
+    assert server.stats.snapshot()['queries_per_task'] == 3
+    assert server.handle('CVSync2AsyncGetResult', {'task_id': 'missing'}, 'ak')['data']['status'] == 'not_found'
+
+
+def test_cv_process_task_flow_shares_task_table():
+    """CVProcess 的 cv_submit_task 创建任务，cv_get_result 按任务表推进状态并按提交参数返回结果"""
+    server = MockVisualServer(MockConfig(queue_time=0.05, generation_median=0.05))
+    submit = server.handle('CVProcess', {
+        'req_key': 'cv_submit_task',
+        'task_type': 'jimeng_motion_imitation_L',
+        'request_body': json.dumps({'source_image': 'https://example.com/a.png', 'return_url': True}),
+    }, 'ak')
+    task_id = submit['data']['task_id']
+    assert server.tasks[task_id].req_key == 'jimeng_motion_imitation_L'
+    query = {'req_key': 'cv_get_result', 'task_id': task_id}
+    assert server.handle('CVProcess', query, 'ak')['data']['status'] == 'in_queue'
+    time.sleep(0.12)
+    done = server.handle('CVProcess', query, 'ak')['data']
+    assert done['status'] == 'done' and done['video_url'].endswith('.mp4')
+    assert server.handle('CVProcess', {'req_key': 'cv_get_result', 'task_id': 'missing'}, 'ak')['data']['status'] == 'not_found'
+
+
+def test_error_and_throttle_injection():
+    """按配置注入限流与并发超限错误码"""
+    server = MockVisualServer(MockConfig(max_running=1, generation_median=10))
+    assert server.handle('CVSync2AsyncSubmitTask', {'req_key': 'jimeng_t2i_v31'}, 'ak')['code'] == 10000
+    assert server.handle('CVSync2AsyncSubmitTask', {'req_key': 'jimeng_t2i_v31'}, 'ak')['code'] == 50430
+    # 并发限制按 AccessKey 计算
+    assert server.handle('CVSync2AsyncSubmitTask', {'req_key': 'jimeng_t2i_v31'}, 'other')['code'] == 10000
+
+    throttled = MockVisualServer(MockConfig(qps_limit=2))
+    codes = [throttled.handle('CVSync2AsyncGetResult', {'task_id': 'x'}, 'ak')['code'] for _ in range(3)]
+    assert codes == [10000, 10000, 50429]
+
+    failing = MockVisualServer(MockConfig(error_rate=1.0))
+    assert failing.handle('CVProcess', {'req_key': 'jimeng_t2i_v31'}, 'ak')['code'] == 50500
+    assert failing.stats.errors == 1
+
+
+def test_endpoint_switch_routes_tools_to_mock(monkeypatch, tmp_path):
+    """设置 DREAMAI_VISUAL_ENDPOINT 后工具的同步与异步客户端都指向模拟服务"""
+    with MockVisualServer(MockConfig(queue_time=0.02, generation_median=0.05)) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        service = get_visual_service('mock_ak', 'mock_sk')
+        assert service.service_info.host == server.endpoint.split('://')[1]
+        assert service.service_info.scheme == 'http'
+
+        tool = TextToImageTool(runtime=MockRuntime('mock_ak', 'mock_sk'), session=MockSession())
+        messages = list(tool._invoke({'prompt': '一只猫', 'return_url': False}))
+        blobs = [m.message.blob for m in messages if m.type == m.MessageType.BLOB]
+        result = [m.message.json_object for m in messages if m.type == m.MessageType.JSON][-1]
+        assert blobs == [TINY_PNG]
+        assert result['images'][0]['mime_type'] == 'image/png'
+        assert server.stats.requests['CVSync2AsyncSubmitTask'] == 1
+        assert server.stats.requests['CVSync2AsyncGetResult'] >= 1
+
+
+def test_benchmark_harness_reports_percentiles(monkeypatch, tmp_path):
+    """基准脚本驱动工具访问模拟服务并输出延迟分位数与每任务接口调用次数"""
+    monkeypatch.setenv('DREAMAI_TASK_JOURNAL', 'off')
+    monkeypatch.setenv('DREAMAI_DEADLINE_SECONDS', '0')
+    from bench_tools import percentile, run_benchmark
+
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert percentile([5.0], 99) == 5.0
+
+    _isolate(monkeypatch, tmp_path, '')
+    report = run_benchmark('text_to_image', invocations=4, concurrency=4,
+                           config=MockConfig(generation_median=0.05), access_key='bench_test_ak')
+    assert report['succeeded'] == 4
+    assert report['api_calls_per_task'] >= 2
+    assert report['latency_seconds']['p99'] >= report['latency_seconds']['p50'] > 0
+    json.dumps(report)
+
+
+def test_video_generation_journals_inline_completion(monkeypatch, tmp_path):
+    """video_generation 在调用内完成的任务同样写入任务日志，重启后不会被重新接管"""
+    monkeypatch.setenv('DREAMAI_POLL_VIDEO_FIRST_DELAY', '0.01')
+    monkeypatch.setenv('DREAMAI_POLL_VIDEO_MIN_INTERVAL', '0.01')
+    with MockVisualServer(MockConfig(queue_time=0.02, generation_median=0.05)) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        journal = utils.task_poller.task_journal
+        monkeypatch.setattr(tools.video_generation, 'task_journal', journal)
+
+        tool = VideoGenerationTool(runtime=MockRuntime('video_ak', 'video_sk'), session=MockSession())
+        messages = list(tool._invoke({'prompt': '一只猫', 'deadline_seconds': 0}))
+        assert 'Video URL' in messages[-1].message.text
+        task_id = next(iter(server.tasks))
+        assert journal.get(task_id)['status'] == 'done'
+        assert server.stats.requests['CVSync2AsyncGetResult'] >= 1
+
+
+def test_video_generation_reports_submit_errors(monkeypatch, tmp_path):
+    """提交失败时返回接口的错误信息，不再因缺少 ResponseMetadata 而报 KeyError"""
+    with MockVisualServer(MockConfig(invalid_keys='bad_video_ak')) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        tool = VideoGenerationTool(runtime=MockRuntime('bad_video_ak', 'bad_video_sk'), session=MockSession())
+        messages = list(tool._invoke({'prompt': '一只猫'}))
+        assert 'Task submission failed' in messages[-1].message.text
+        assert 'InvalidAccessKey' in messages[-1].message.text
+        assert not server.tasks
+
+
+def test_motion_imitation_submits_and_polls_through_cv_process(monkeypatch, tmp_path):
+    """动作模仿经 CVProcess 提交并查询，任务写入任务日志，完成后返回视频链接"""
+    monkeypatch.setenv('DREAMAI_POLL_VIDEO_FIRST_DELAY', '0.01')
+    monkeypatch.setenv('DREAMAI_POLL_VIDEO_MIN_INTERVAL', '0.01')
+    with MockVisualServer(MockConfig(queue_time=0.02, generation_median=0.05)) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        journal = utils.task_poller.task_journal
+        monkeypatch.setattr(tools.motion_imitation, 'task_journal', journal)
+        monkeypatch.setattr(tools.motion_imitation, 'url_preflight', UrlPreflight(enabled=False))
+
+        tool = MotionImitationTool(runtime=MockRuntime('motion_ak', 'motion_sk'), session=MockSession())
+        messages = list(tool._invoke({
+            'source_image': 'https://example.com/person.png',
+            'motion_video': 'https://example.com/dance.mp4',
+            'deadline_seconds': 0,
+        }))
+        assert 'Video URL' in messages[-1].message.text
+        task_id = next(iter(server.tasks))
+        assert server.tasks[task_id].req_key == 'jimeng_motion_imitation_L'
+        assert journal.get(task_id)['req_key'] == 'jimeng_motion_imitation_L'
+        assert journal.get(task_id)['status'] == 'done'
+        assert server.stats.requests['CVProcess'] >= 2
+
+
+
+def test_motion_imitation_detaches_when_over_deadline(monkeypatch, tmp_path):
+    """预计超出时间预算的动作模仿任务立即返回任务句柄，由后台继续跟踪至完成"""
+    monkeypatch.setenv('DREAMAI_POLL_VIDEO_FIRST_DELAY', '0.01')
+    monkeypatch.setenv('DREAMAI_POLL_VIDEO_MIN_INTERVAL', '0.01')
+    with MockVisualServer(MockConfig(queue_time=0.02, generation_median=0.05)) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        journal = utils.task_poller.task_journal
+        monkeypatch.setattr(tools.motion_imitation, 'task_journal', journal)
+        monkeypatch.setattr(tools.motion_imitation, 'task_reconciler', TaskReconciler(journal, shared_poller))
+        monkeypatch.setattr(tools.motion_imitation, 'url_preflight', UrlPreflight(enabled=False))
+
+        tool = MotionImitationTool(runtime=MockRuntime('detach_ak', 'detach_sk'), session=MockSession())
+        messages = list(tool._invoke({
+            'source_image': 'https://example.com/person.png',
+            'motion_video': 'https://example.com/dance.mp4',
+            'deadline_seconds': 0.001,
+        }))
+        handle = messages[-1].message.json_object
+        task_id = next(iter(server.tasks))
+        assert handle['task_id'] == task_id
+        assert handle['req_key'] == 'jimeng_motion_imitation_L'
+        assert handle['eta_seconds'] > 0
+        for _ in range(200):
+            if journal.get(task_id)['status'] == 'done':
+                break
+            time.sleep(0.02)
+        assert journal.get(task_id)['status'] == 'done'
+
+
+def test_motion_imitation_fails_over_to_extra_credentials(monkeypatch, tmp_path):
+    """主凭证无效时经凭证池改用额外凭证提交，并用同一凭证查询结果"""
+    monkeypatch.setenv('DREAMAI_POLL_VIDEO_FIRST_DELAY', '0.01')
+    monkeypatch.setenv('DREAMAI_POLL_VIDEO_MIN_INTERVAL', '0.01')
+    with MockVisualServer(MockConfig(queue_time=0.02, generation_median=0.05, invalid_keys='pool_bad_ak')) as server:
+        _isolate(monkeypatch, tmp_path, server.endpoint)
+        journal = utils.task_poller.task_journal
+        monkeypatch.setattr(tools.motion_imitation, 'task_journal', journal)
+        monkeypatch.setattr(tools.motion_imitation, 'url_preflight', UrlPreflight(enabled=False))
+
+        runtime = MockRuntime('pool_bad_ak', 'pool_bad_sk')
+        runtime.credentials['volcengine_extra_credentials'] = 'pool_good_ak,pool_good_sk'
+        tool = MotionImitationTool(runtime=runtime, session=MockSession())
+        messages = list(tool._invoke({
+            'source_image': 'https://example.com/person.png',
+            'motion_video': 'https://example.com/dance.mp4',
+            'deadline_seconds': 0,
+        }))
+        assert 'Video URL' in messages[-1].message.text
+        task_id = next(iter(server.tasks))
+        assert server.tasks[task_id].access_key == 'pool_good_ak'
+        assert journal.get(task_id)['credential'] == credential_fingerprint('pool_good_ak', 'pool_good_sk')
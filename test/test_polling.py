@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证 PollSchedule 轮询调度逻辑
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行测试：python test/test_polling.py 或 pytest test/test_polling.py
+"""
+
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.polling import (Deadline, LatencyHistory, PollPolicy, PollSchedule, get_policy, predict_time_to_done,
+                           req_key_family)
+
+
+NO_JITTER = PollPolicy(first_delay=2.0, min_interval=1.0, max_interval=8.0, backoff=2.0, jitter=0.0, timeout=300)
+
+
+def test_req_key_family():
+    """req_key 模型族识别"""
+    assert req_key_family('jimeng_t2i_v31') == 'image'
+    assert req_key_family('jimeng_i2i_v30') == 'image'
+    assert req_key_family('jimeng_t2v_v30_1080p') == 'video'
+    assert req_key_family('jimeng_video_v30_pro_L') == 'video'
+    assert req_key_family('jimeng_motion_imitation_L') == 'video'
+
+
+def test_env_override(monkeypatch):
+    """环境变量覆盖默认轮询参数"""
+    monkeypatch.setenv('DREAMAI_POLL_IMAGE_FIRST_DELAY', '0.5')
+    assert get_policy('jimeng_t2i_v40').first_delay == 0.5
+    assert get_policy('jimeng_t2v_v30').first_delay != 0.5
+
+
+def test_in_queue_backoff():
+    """排队中按指数退避，且不超过最大间隔"""
+    schedule = PollSchedule('jimeng_t2i_v31', policy=NO_JITTER, history=LatencyHistory())
+    assert schedule.next_delay() == 2.0
+    schedule.attempt = 1
+    schedule.update('in_queue')
+    delays = [schedule.next_delay() for _ in range(6)]
+    print(f"排队退避间隔: {delays}")
+    assert delays[:4] == [1.0, 2.0, 4.0, 8.0]
+    assert max(delays) == 8.0
+
+
+def test_generating_uses_history():
+    """生成中时根据历史耗时等待到预计完成时间"""
+    history = LatencyHistory()
+    for total in (3.0, 3.5, 4.0):
+        history.record('jimeng_t2i_v31', 1.0, total)
+    schedule = PollSchedule('jimeng_t2i_v31', policy=NO_JITTER, history=history)
+    # 首次查询在预计完成时间附近
+    assert 3.0 <= schedule.next_delay() <= 3.5
+    schedule.attempt = 1
+    schedule.started_at -= 1.0
+    schedule.update('generating')
+    assert 2.0 <= schedule.next_delay() <= 2.6
+
+
+def test_finish_records_history():
+    """任务完成后写入耗时历史"""
+    history = LatencyHistory()
+    schedule = PollSchedule('jimeng_t2v_v30', policy=NO_JITTER, history=history)
+    schedule.started_at -= 10.0
+    schedule.update('generating')
+    schedule.finish()
+    assert history.count('jimeng_t2v_v30') == 1
+    assert history.queue_quantile('jimeng_t2v_v30') >= 10.0
+
+
+def test_iteration_respects_timeout():
+    """超过总时长后停止迭代"""
+    policy = PollPolicy(first_delay=0.01, min_interval=0.01, max_interval=0.02, backoff=2.0, jitter=0.0, timeout=0.1)
+    schedule = PollSchedule('jimeng_t2i_v31', policy=policy, history=LatencyHistory())
+    attempts = list(schedule)
+    print(f"超时前共查询 {len(attempts)} 次")
+    assert 1 <= len(attempts) <= 10
+    assert schedule.expired()
+
+
+def test_predict_time_to_done():
+    """有历史数据时按分位数预测，否则使用模型族典型耗时"""
+    history = LatencyHistory()
+    assert predict_time_to_done('jimeng_t2v_v30', history=history) == get_policy('jimeng_t2v_v30').typical_duration
+    for total in (40.0, 50.0, 60.0, 70.0, 80.0):
+        history.record('jimeng_t2v_v30', 5.0, total)
+    assert predict_time_to_done('jimeng_t2v_v30', elapsed=30.0, history=history) == 50.0
+    assert predict_time_to_done('jimeng_t2v_v30', elapsed=500.0, history=history) == 0.0
+
+
+def test_deadline_detaches_slow_tasks():
+    """剩余预算小于预计耗时的任务提前返回，短任务仍同步等待"""
+    history = LatencyHistory()
+    history.preload([('jimeng_t2v_v30', 180.0), ('jimeng_t2i_v31', 6.0)])
+    deadline = Deadline(100)
+    video = PollSchedule('jimeng_t2v_v30', history=history, timeout=deadline.poll_timeout('jimeng_t2v_v30'))
+    image = PollSchedule('jimeng_t2i_v31', history=history, timeout=deadline.poll_timeout('jimeng_t2i_v31'))
+    assert deadline.exceeded_by(video) is not None
+    assert deadline.exceeded_by(image) is None
+    assert video.timeout <= 100
+
+    # 0 表示不限制
+    unlimited = Deadline(0)
+    assert unlimited.exceeded_by(video) is None
+    assert unlimited.poll_timeout('jimeng_t2v_v30') == get_policy('jimeng_t2v_v30').timeout
+
+
+if __name__ == '__main__':
+    test_req_key_family()
+    test_in_queue_backoff()
+    test_generating_uses_history()
+    test_finish_records_history()
+    test_iteration_respects_timeout()
+    test_predict_time_to_done()
+    test_deadline_detaches_slow_tasks()
+    print("PollSchedule 测试通过")
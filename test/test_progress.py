@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证轮询进度消息的合并输出
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行测试：pytest test/test_progress.py
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.polling import LatencyHistory, PollSchedule
+from utils.progress import ProgressReporter
+
+
+def test_emits_only_on_transition_or_interval():
+    """状态不变时按最小间隔合并，状态变化时立即输出"""
+    progress = ProgressReporter(min_interval=0.05, show_eta=False)
+    assert progress.update('in_queue', 1) == "任务排队中... (第1次查询)"
+    assert progress.update('in_queue', 2) is None
+    assert progress.update('in_queue', 3) is None
+    assert progress.update('generating', 4) == "任务生成中... (第4次查询)"
+    assert progress.update('generating', 5) is None
+    time.sleep(0.06)
+    assert progress.update('generating', 6) == "任务生成中... (第6次查询)"
+    assert (progress.emitted, progress.suppressed) == (3, 3)
+
+
+def test_zero_interval_reports_every_poll():
+    """最小间隔为 0 时每次查询都输出"""
+    progress = ProgressReporter(min_interval=0, show_eta=False)
+    messages = [progress.update('generating', attempt) for attempt in range(1, 4)]
+    assert all(messages)
+
+
+def test_eta_uses_latency_history():
+    """附带已等待时间，并按历史耗时的中位数给出预计剩余时间"""
+    history = LatencyHistory()
+    for _ in range(5):
+        history.record('jimeng_t2v_v30', 10.0, 90.0)
+    schedule = PollSchedule('jimeng_t2v_v30', history=history)
+    progress = ProgressReporter(schedule, min_interval=30, show_eta=True)
+    message = progress.update('generating', 1)
+    assert message.startswith("任务生成中... (第1次查询，已等待0秒，预计还需约1分")
+    assert progress.update('done', 2).startswith("任务状态: done (第2次查询，已等待")
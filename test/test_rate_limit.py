@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证按凭证的限流、并发名额与限流重试
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行测试：pytest test/test_rate_limit.py
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.async_client import background_loop
+from utils.rate_limit import RateLimiter, TaskSlots, TokenBucket
+
+
+def test_token_bucket_waits_after_burst():
+    """突发额度用完后按速率排队"""
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert 0.05 < bucket.reserve() <= 0.1
+    assert 0.15 < bucket.reserve() <= 0.2
+    assert TokenBucket(rate=0, burst=1).reserve() == 0.0
+
+
+def test_throttled_submit_is_retried():
+    """限流错误码自动退避重试，直至成功"""
+    limiter = RateLimiter(submit_qps=0, query_qps=0, base_delay=0.01, max_delay=0.02)
+    responses = [{'code': 50429, 'message': 'qps limit'}, {'code': 50430, 'message': 'concurrency limit'},
+                 {'code': 10000, 'data': {'task_id': 'task-1'}}]
+    calls = []
+
+    def send():
+        calls.append(1)
+        return responses[len(calls) - 1]
+
+    response = limiter.call('cred', 'CVSync2AsyncSubmitTask', {'req_key': 'jimeng_t2i_v31'}, send)
+    assert response['code'] == 10000
+    assert len(calls) == 3
+
+
+def test_retries_are_bounded():
+    """超过重试次数后返回最后一次的限流响应"""
+    limiter = RateLimiter(submit_qps=0, query_qps=0, max_retries=2, base_delay=0.01, max_delay=0.02)
+    calls = []
+
+    def send():
+        calls.append(1)
+        return {'code': 50429, 'message': 'qps limit'}
+
+    response = limiter.call('cred', 'CVSync2AsyncGetResult', {'task_id': 'task-1'}, send)
+    assert response['code'] == 50429
+    assert len(calls) == 3
+
+
+def test_task_slots_released_when_task_ends():
+    """并发名额在查询到任务结束后释放"""
+    limiter = RateLimiter(submit_qps=0, query_qps=0, slot_wait=0.05, slots=TaskSlots(default_limit=1))
+    form = {'req_key': 'jimeng_t2v_v30'}
+    response = limiter.call('cred', 'CVSync2AsyncSubmitTask', form, lambda: {'code': 10000, 'data': {'task_id': 't1'}})
+    assert response['code'] == 10000
+    assert limiter.slots.running('cred', 'jimeng_t2v_v30') == 1
+
+    # 名额已满时等待超时，不发送请求
+    sent = []
+    response = limiter.call('cred', 'CVSync2AsyncSubmitTask', form, lambda: sent.append(1))
+    assert response['code'] == 50430 and not sent
+
+    # 其他凭证不受影响
+    response = limiter.call('other', 'CVSync2AsyncSubmitTask', form, lambda: {'code': 10000, 'data': {'task_id': 't2'}})
+    assert response['code'] == 10000
+
+    limiter.call('cred', 'CVSync2AsyncGetResult', {'req_key': 'jimeng_t2v_v30', 'task_id': 't1'},
+                 lambda: {'code': 10000, 'data': {'status': 'generating'}})
+    assert limiter.slots.running('cred', 'jimeng_t2v_v30') == 1
+    limiter.call('cred', 'CVSync2AsyncGetResult', {'req_key': 'jimeng_t2v_v30', 'task_id': 't1'},
+                 lambda: {'code': 10000, 'data': {'status': 'done'}})
+    assert limiter.slots.running('cred', 'jimeng_t2v_v30') == 0
+
+
+def test_task_slots_refreshed_while_task_runs():
+    """查询到任务仍在进行时续期名额，长时间轮询的任务不会因 ttl 提前释放名额"""
+    limiter = RateLimiter(submit_qps=0, query_qps=0, slots=TaskSlots(default_limit=1, ttl=0.2))
+    form = {'req_key': 'jimeng_t2v_v30'}
+    limiter.call('cred', 'CVSync2AsyncSubmitTask', form, lambda: {'code': 10000, 'data': {'task_id': 't1'}})
+    query = {'req_key': 'jimeng_t2v_v30', 'task_id': 't1'}
+    for _ in range(3):
+        time.sleep(0.1)
+        limiter.call('cred', 'CVSync2AsyncGetResult', query, lambda: {'code': 10000, 'data': {'status': 'generating'}})
+    assert limiter.slots.running('cred', 'jimeng_t2v_v30') == 1
+
+    # 不再被查询的任务在 ttl 后释放
+    time.sleep(0.25)
+    assert limiter.slots.running('cred', 'jimeng_t2v_v30') == 0
+
+
+def test_cv_process_classified_by_req_key():
+    """CVProcess 的 cv_submit_task 占用 task_type 的名额，cv_get_result 按查询计入配额并在任务结束时释放名额"""
+    # 提交配额只够一次提交，查询若被计入提交配额会一直等待
+    limiter = RateLimiter(submit_qps=0.001, submit_burst=1, query_qps=0, slot_wait=0.05,
+                          slots=TaskSlots(default_limit=1))
+    submit = {'req_key': 'cv_submit_task', 'task_type': 'jimeng_motion_imitation_L', 'request_body': '{}'}
+    limiter.call('cred', 'CVProcess', submit, lambda: {'code': 10000, 'data': {'task_id': 'm1'}})
+    assert limiter.slots.running('cred', 'jimeng_motion_imitation_L') == 1
+    assert limiter.call('cred', 'CVProcess', submit, lambda: {'code': 10000})['code'] == 50430
+
+    query = {'req_key': 'cv_get_result', 'task_id': 'm1'}
+    started = time.monotonic()
+    limiter.call('cred', 'CVProcess', query, lambda: {'code': 10000, 'data': {'status': 'generating'}})
+    limiter.call('cred', 'CVProcess', query, lambda: {'code': 10000, 'data': {'status': 'done'}})
+    assert time.monotonic() - started < 1
+    assert limiter.slots.running('cred', 'jimeng_motion_imitation_L') == 0
+
+
+def test_failed_submit_releases_slot():
+    """提交失败或请求异常时立即归还名额"""
+    limiter = RateLimiter(submit_qps=0, query_qps=0, max_retries=0, slots=TaskSlots(default_limit=1))
+    form = {'req_key': 'jimeng_t2i_v31'}
+    limiter.call('cred', 'CVSync2AsyncSubmitTask', form, lambda: {'code': 50400, 'message': 'bad request'})
+    assert limiter.slots.running('cred', 'jimeng_t2i_v31') == 0
+
+    def broken():
+        raise ConnectionError('reset')
+
+    try:
+        limiter.call('cred', 'CVSync2AsyncSubmitTask', form, broken)
+    except ConnectionError:
+        pass
+    assert limiter.slots.running('cred', 'jimeng_t2i_v31') == 0
+
+
+def test_async_calls_share_query_bucket():
+    """事件循环中的查询同样按令牌桶限速"""
+    limiter = RateLimiter(query_qps=20, query_burst=1)
+
+    async def send():
+        return {'code': 10000, 'data': {'status': 'generating'}}
+
+    async def burst():
+        for _ in range(4):
+            await limiter.call_async('cred', 'CVSync2AsyncGetResult', {'task_id': 't1'}, send)
+
+    started = time.monotonic()
+    background_loop.run(burst())
+    # 首个请求使用突发额度，其余 3 个每个间隔 50ms
+    assert time.monotonic() - started >= 0.14
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证声明式请求 schema 的请求构建
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行测试：pytest test/test_request_schema.py
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.request_builders import (build_image_to_image_request, build_sync_text_to_image_request,
+                                    build_text_to_image_request, build_text_to_video_request, compile_all)
+
+
+def test_defaults_come_from_yaml():
+    """未传入的参数使用 YAML 默认值，seed 为 -1 时不写入"""
+    compile_all()
+    req_key, form_data, req_json = build_text_to_image_request({'prompt': '一只猫', 'seed': -1})
+    assert req_key == 'jimeng_t2i_v31'
+    assert form_data == {'req_key': 'jimeng_t2i_v31', 'prompt': '一只猫', 'width': 1024, 'height': 1024,
+                         'use_pre_llm': True, 'use_sr': True, 'return_url': True}
+    assert json.loads(req_json) == {'return_url': True}
+
+    req_key, form_data, _ = build_text_to_video_request({'prompt': '海浪', 'req_key': 'unknown'})
+    assert req_key == 'jimeng_t2v_v30'
+    assert 'seed' not in form_data
+
+
+def test_validation_errors():
+    """必填、成对参数与取值范围的错误消息"""
+    with pytest.raises(ValueError, match='prompt is required'):
+        build_text_to_image_request({'prompt': ''})
+    with pytest.raises(ValueError, match='For 4.0 model, width and height must be specified together or not at all'):
+        build_text_to_image_request({'prompt': 'x', 'model_version': '4.0', 'width': 1024})
+    with pytest.raises(ValueError, match='Scale value for 4.0 model must be between 0.0 and 1.0'):
+        build_text_to_image_request({'prompt': 'x', 'model_version': '4.0', 'scale': 2})
+    with pytest.raises(ValueError, match='Invalid value for seed'):
+        build_text_to_image_request({'prompt': 'x', 'seed': 'abc'})
+
+
+def test_groups_and_image_input():
+    """水印写入 req_json 或提交参数，AIGC 元数据编码为 JSON 字符串，图片输入按类型路由"""
+    _, form_data, req_json = build_text_to_image_request({'prompt': 'x', 'add_logo': True, 'position': 3})
+    assert json.loads(req_json)['logo_info']['position'] == 3
+    assert 'logo_info' not in form_data
+
+    _, form_data, _ = build_sync_text_to_image_request({
+        'prompt': 'x', 'add_logo': True, 'logo_position': 2, 'logo_text_content': '',
+        'add_aigc_meta': True, 'producer_id': 'p1',
+    })
+    assert form_data['logo_info'] == {'add_logo': True, 'position': 2, 'language': 0, 'opacity': 1.0}
+    assert json.loads(form_data['aigc_meta']) == {'producer_id': 'p1'}
+    _, form_data, _ = build_sync_text_to_image_request({'prompt': 'x', 'add_aigc_meta': True})
+    assert 'aigc_meta' not in form_data
+
+    _, form_data, _ = build_image_to_image_request({'prompt': 'x', 'image_input': 'https://example.com/a.png'})
+    assert form_data['image_urls'] == ['https://example.com/a.png']
+    _, form_data, _ = build_image_to_image_request({'prompt': 'x', 'image_input': 'aGVsbG8='})
+    assert form_data['binary_data_base64'] == ['aGVsbG8=']
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证确定性请求的结果缓存
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行测试：pytest test/test_result_cache.py
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.result_cache import ResultCache, request_fingerprint, result_expires_at
+
+
+def test_fingerprint_is_canonical():
+    """字段顺序、空值与易变字段不影响指纹，凭证命名空间会影响指纹"""
+    first = request_fingerprint({'req_key': 'jimeng_t2i_v31', 'prompt': '猫', 'seed': 42},
+                                '{"return_url": true}', namespace='ns')
+    second = request_fingerprint({'seed': 42, 'prompt': '猫', 'req_key': 'jimeng_t2i_v31', 'request_id': 'x'},
+                                 '{ "return_url" : true }', namespace='ns')
+    assert first == second
+    assert first != request_fingerprint({'req_key': 'jimeng_t2i_v31', 'prompt': '猫', 'seed': 43},
+                                        '{"return_url": true}', namespace='ns')
+    assert first != request_fingerprint({'req_key': 'jimeng_t2i_v31', 'prompt': '猫', 'seed': 42},
+                                        '{"return_url": true}', namespace='other')
+
+
+def test_ttl_respects_url_expiry():
+    """缓存过期时间不晚于链接的失效时间"""
+    expires = int(time.time()) + 600
+    value = {'image_urls': [f"https://p9-aiop-sign.byteimg.com/a.png?x-expires={expires}&x-signature=abc"]}
+    assert result_expires_at(value, 86400) <= expires
+    assert result_expires_at({'binary_data_base64': ['aGVsbG8=']}, 100) <= time.time() + 100
+
+
+def test_memory_byte_budget():
+    """超过字节预算时淘汰最久未使用的条目"""
+    cache = ResultCache(max_bytes=200)
+    cache.put('a', {'binary_data_base64': ['x' * 80]})
+    cache.put('b', {'binary_data_base64': ['y' * 80]})
+    assert cache.get('a') is None
+    assert cache.get('b') is not None
+
+
+def test_expired_urls_not_cached():
+    """已失效的链接不写入缓存"""
+    cache = ResultCache()
+    cache.put('k', {'image_urls': ['https://example.com/a.png?x-expires=1000000000']})
+    assert cache.get('k') is None
+
+
+def test_disk_tier(tmp_path):
+    """磁盘层在新实例中依然可以命中"""
+    ResultCache(disk_dir=str(tmp_path)).put('k' * 64, {'image_urls': ['https://example.com/a.png']})
+    value = ResultCache(disk_dir=str(tmp_path)).get('k' * 64)
+    assert value == {'image_urls': ['https://example.com/a.png']}
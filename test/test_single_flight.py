@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证相同请求的提交去重
+
+使用方法：
+1. 无需 VolcEngine 凭证
+2. 运行测试：pytest test/test_single_flight.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.single_flight import SingleFlight
+
+
+def test_followers_share_leader_task():
+    """并发的相同请求只提交一次"""
+    flight = SingleFlight()
+    calls = []
+
+    def submit():
+        calls.append(1)
+        time.sleep(0.05)
+        return {'code': 10000, 'data': {'task_id': 'task-1'}}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.submit('key', submit, ttl=60)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert {response['data']['task_id'] for response, _ in results} == {'task-1'}
+    assert sum(1 for _, submitted in results if submitted) == 1
+    assert flight.in_flight() == 1
+
+    flight.release('key')
+    assert flight.in_flight() == 0
+
+
+def test_failed_submit_not_reused():
+    """提交失败的响应不会被后续请求复用"""
+    flight = SingleFlight()
+    response, submitted = flight.submit('key', lambda: {'code': 50429, 'message': 'limit'}, ttl=60)
+    assert submitted and response['code'] == 50429
+    response, submitted = flight.submit('key', lambda: {'code': 10000, 'data': {'task_id': 'task-2'}}, ttl=60)
+    assert submitted and response['data']['task_id'] == 'task-2'
+
+
+def test_entry_expires_after_ttl():
+    """超过复用时长后重新提交"""
+    flight = SingleFlight()
+    flight.submit('key', lambda: {'code': 10000, 'data': {'task_id': 'task-3'}}, ttl=0.01)
+    time.sleep(0.02)
+    _, submitted = flight.submit('key', lambda: {'code': 10000, 'data': {'task_id': 'task-4'}}, ttl=60)
+    assert submitted
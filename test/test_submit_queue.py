@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证区分交互与批量流量的提交调度
+
+使用方法：
+1. 无需 VolcEngine 凭证，提交由测试函数代替，运行中的任务由 TaskSlots 名额模拟
+2. 运行测试：pytest test/test_submit_queue.py
+"""
+
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.rate_limit import TaskSlots
+from utils.submit_queue import BATCH, INTERACTIVE, SubmissionScheduler, resolve_priority
+
+
+def _occupy(slots: TaskSlots, count: int) -> list[int]:
+    return [slots.try_acquire('running', 'jimeng_t2i_v31') for _ in range(count)]
+
+
+def _start(scheduler: SubmissionScheduler, slots: TaskSlots, order: list, tenant: str, priority: str,
+           weight: int = 1, leases: Optional[list] = None) -> threading.Thread:
+    """在线程中排队提交，放行后占用一个运行名额并记录放行顺序"""
+    def send():
+        lease = slots.try_acquire(tenant, 'jimeng_t2i_v31')
+        if leases is not None:
+            leases.append(lease)
+        order.append((tenant, priority))
+        return {'code': 10000, 'data': {'task_id': f"{tenant}-{len(order)}"}}
+
+    thread = threading.Thread(target=scheduler.submit, args=(tenant, priority, send, weight), daemon=True)
+    thread.start()
+    return thread
+
+
+def _wait_queued(scheduler: SubmissionScheduler, priority: str, depth: int) -> None:
+    deadline = time.monotonic() + 5
+    while scheduler.depth(priority) < depth:
+        assert time.monotonic() < deadline, "requests were not queued"
+        time.sleep(0.01)
+
+
+def _release(slots: TaskSlots, leases: list[int], order: list, expected: int) -> None:
+    """释放一个运行名额并等待下一个请求被放行"""
+    slots.release(leases.pop())
+    deadline = time.monotonic() + 5
+    while len(order) < expected:
+        assert time.monotonic() < deadline, "no request was admitted"
+        time.sleep(0.01)
+
+
+def test_passthrough_without_capacity():
+    """未设置容量时直接提交，不排队"""
+    scheduler = SubmissionScheduler(capacity=0, slots=TaskSlots())
+    assert scheduler.submit('tenant', BATCH, lambda: {'code': 10000}) == {'code': 10000}
+
+
+def test_interactive_uses_reserved_capacity():
+    """批量任务占满可用名额时交互请求仍可立即提交"""
+    slots = TaskSlots()
+    scheduler = SubmissionScheduler(capacity=4, interactive_reserve=1, max_wait={INTERACTIVE: 1, BATCH: 0.3},
+                                    slots=slots)
+    _occupy(slots, 3)
+    started = time.monotonic()
+    response = scheduler.submit('batch', BATCH, lambda: {'code': 10000})
+    assert response['code'] == 50430
+    assert response['ResponseMetadata']['Error']['Code'] == 'SubmissionQueueFull'
+    assert time.monotonic() - started >= 0.3
+    assert scheduler.submit('chat', INTERACTIVE, lambda: {'code': 10000}) == {'code': 10000}
+
+
+def test_interactive_admitted_before_batch():
+    """名额释放时先放行排队中的交互请求"""
+    slots = TaskSlots()
+    scheduler = SubmissionScheduler(capacity=2, interactive_reserve=0, slots=slots)
+    leases = _occupy(slots, 2)
+    order: list = []
+    threads = [_start(scheduler, slots, order, 'batch', BATCH)]
+    _wait_queued(scheduler, BATCH, 1)
+    threads.append(_start(scheduler, slots, order, 'chat', INTERACTIVE))
+    _wait_queued(scheduler, INTERACTIVE, 1)
+
+    _release(slots, leases, order, 1)
+    _release(slots, leases, order, 2)
+    for thread in threads:
+        thread.join(5)
+    assert order == [('chat', INTERACTIVE), ('batch', BATCH)]
+
+
+def test_weighted_fairness_between_tenants():
+    """同一优先级内按权重轮流放行，排在前面的租户不能独占名额"""
+    slots = TaskSlots()
+    scheduler = SubmissionScheduler(capacity=1, interactive_reserve=0, slots=slots)
+    leases = _occupy(slots, 1)
+    order: list = []
+    threads = []
+    for _ in range(4):
+        threads.append(_start(scheduler, slots, order, 'heavy', BATCH, weight=1, leases=leases))
+        _wait_queued(scheduler, BATCH, len(threads))
+    for _ in range(4):
+        threads.append(_start(scheduler, slots, order, 'pool', BATCH, weight=2, leases=leases))
+        _wait_queued(scheduler, BATCH, len(threads))
+
+    for expected in range(1, 9):
+        _release(slots, leases, order, expected)
+    for thread in threads:
+        thread.join(5)
+    # 权重为 2 的租户在前 6 个名额中获得 4 个
+    tenants = [tenant for tenant, _ in order[:6]]
+    assert tenants.count('pool') == 4 and tenants.count('heavy') == 2
+
+
+def test_shed_when_queue_is_full():
+    """排队数达到上限时立即拒绝"""
+    slots = TaskSlots()
+    scheduler = SubmissionScheduler(capacity=1, interactive_reserve=0, max_depth={INTERACTIVE: 1, BATCH: 1},
+                                    max_wait={INTERACTIVE: 1, BATCH: 1}, slots=slots)
+    _occupy(slots, 1)
+    order: list = []
+    thread = _start(scheduler, slots, order, 'chat', INTERACTIVE)
+    _wait_queued(scheduler, INTERACTIVE, 1)
+    started = time.monotonic()
+    response = scheduler.submit('chat', INTERACTIVE, lambda: {'code': 10000})
+    assert response['code'] == 50430 and 'queue is full' in response['message']
+    assert time.monotonic() - started < 0.5
+    thread.join(5)
+    assert order == [] and scheduler.depth(INTERACTIVE) == 0
+
+
+def test_resolve_priority(monkeypatch):
+    """参数指定优先于环境变量，都未指定时使用工具默认值"""
+    monkeypatch.delenv('DREAMAI_PRIORITY_TEXT_TO_VIDEO', raising=False)
+    assert resolve_priority('text_to_image', {}) == INTERACTIVE
+    assert resolve_priority('text_to_video', {}) == BATCH
+    monkeypatch.setenv('DREAMAI_PRIORITY_TEXT_TO_VIDEO', INTERACTIVE)
+    assert resolve_priority('text_to_video', {}) == INTERACTIVE
+    assert resolve_priority('text_to_video', {'priority': BATCH}) == BATCH
+    assert resolve_priority('text_to_image', {'priority': 'urgent'}) == INTERACTIVE
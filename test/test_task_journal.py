@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证任务日志与超时任务的后台补偿轮询
+
+使用方法：
+1. 无需 VolcEngine 凭证，补偿轮询测试复用 test_task_poller 中的本地接口服务
+2. 运行测试：pytest test/test_task_journal.py
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import utils.polling
+import utils.task_poller
+from test_task_poller import FAST, start_fake_server
+from utils.async_client import background_loop, get_async_client
+from utils.polling import LatencyHistory, PollSchedule
+from utils.reconciler import TaskReconciler
+from utils.task_journal import TaskJournal
+from utils.task_poller import SharedPoller
+
+
+def test_record_and_update(tmp_path):
+    """提交记录可按 task_id 查回，完成后不再出现在未完成列表中"""
+    journal = TaskJournal(str(tmp_path / 'journal.db'))
+    journal.record_submit('cred', 'task-1', 'jimeng_t2i_v31', '{"return_url": true}')
+    journal.record_submit('cred', 'task-2', 'jimeng_t2v_v30', None)
+
+    record = journal.get('task-1')
+    assert record['req_key'] == 'jimeng_t2i_v31'
+    assert record['req_json'] == '{"return_url": true}'
+    assert record['status'] == 'submitted'
+    assert journal.get('task-1', credential='other') is None
+
+    journal.update_status('cred', 'task-1', 'done', {'status': 'done', 'binary_data_base64': ['aGk=']})
+    assert [r['task_id'] for r in journal.pending('cred', submitted_before=time.time() + 1)] == ['task-2']
+    # base64 数据不写入日志
+    assert 'aGk=' not in journal.get('task-1')['result']
+
+
+def test_disabled_journal_is_noop():
+    """未配置路径时所有操作为空操作"""
+    journal = TaskJournal(None)
+    assert not journal.enabled
+    journal.record_submit('cred', 'task-1', 'jimeng_t2i_v31')
+    assert journal.get('task-1') is None
+    assert journal.pending('cred') == []
+
+
+def test_adopted_task_polled_to_completion(tmp_path, monkeypatch):
+    """无订阅方的接管任务在后台轮询至结束，并把状态写回日志"""
+    journal = TaskJournal(str(tmp_path / 'journal.db'))
+    monkeypatch.setattr(utils.task_poller, 'task_journal', journal)
+    server = start_fake_server('journal_ak', 'journal_sk')
+    try:
+        client = get_async_client('journal_ak', 'journal_sk')
+        submit = background_loop.run(client.cv_sync2async_submit_task({'req_key': 'jimeng_t2i_v31', 'prompt': 'owl'}))
+        task_id = submit['data']['task_id']
+        journal.record_submit(client.fingerprint, task_id, 'jimeng_t2i_v31')
+
+        poller = SharedPoller(tick=0.01)
+        poller.watch_detached(client, 'jimeng_t2i_v31', task_id,
+                              schedule=PollSchedule('jimeng_t2i_v31', policy=FAST, history=LatencyHistory()))
+        deadline = time.monotonic() + 5
+        while journal.get(task_id)['status'] != 'done' and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert journal.get(task_id)['status'] == 'done'
+        assert 'image_urls' in journal.get(task_id)['result']
+        assert poller.watching() == 0
+    finally:
+        server.shutdown()
+
+
+def test_reconcile_once_per_credential(tmp_path):
+    """同一凭证只触发一次补偿"""
+    journal = TaskJournal(str(tmp_path / 'journal.db'))
+    reconciler = TaskReconciler(journal, SharedPoller(tick=0.01))
+    reconciler.reconcile('reconcile_ak', 'reconcile_sk')
+    reconciler.reconcile('reconcile_ak', 'reconcile_sk')
+    assert len(reconciler._seen) == 1
+
+
+def test_completed_durations(tmp_path):
+    """已完成任务的耗时可用于预热耗时模型"""
+    journal = TaskJournal(str(tmp_path / 'journal.db'))
+    journal.record_submit('cred', 'task-1', 'jimeng_t2v_v30')
+    journal.record_submit('cred', 'task-2', 'jimeng_t2v_v30')
+    journal.update_status('cred', 'task-1', 'done', {'status': 'done'}, timed=True)
+    # 手动查询才发现完成的任务不计入耗时
+    journal.update_status('cred', 'task-2', 'done', {'status': 'done'})
+    durations = journal.completed_durations()
+    assert [req_key for req_key, _ in durations] == ['jimeng_t2v_v30']
+    assert durations[0][1] >= 0
+
+
+def test_adopted_tasks_record_latency_from_submit(monkeypatch, tmp_path):
+    """重启后首次查询即已完成的任务不记录耗时；中途转入后台的任务耗时从提交时算起"""
+    from test_task_poller import ScriptedClient
+
+    monkeypatch.setenv('DREAMAI_POLL_IMAGE_FIRST_DELAY', '0.01')
+    monkeypatch.setenv('DREAMAI_POLL_IMAGE_MIN_INTERVAL', '0.01')
+    journal = TaskJournal(str(tmp_path / 'journal.db'))
+    history = LatencyHistory()
+    monkeypatch.setattr(utils.task_poller, 'task_journal', journal)
+    monkeypatch.setattr(utils.polling, 'latency_history', history)
+    reconciler = TaskReconciler(journal, SharedPoller(tick=0.01))
+
+    journal.record_submit('orphan_fp', 'orphan-task', 'jimeng_t2i_v31')
+    reconciler.adopt(ScriptedClient('orphan_fp', ['done']), 'jimeng_t2i_v31', 'orphan-task')
+
+    journal.record_submit('detach_fp', 'detach-task', 'jimeng_t2i_v31')
+    schedule = PollSchedule('jimeng_t2i_v31', policy=FAST, history=history)
+    schedule.started_at -= 5
+    schedule.update('in_queue')
+    reconciler.detach(ScriptedClient('detach_fp', ['generating', 'done']), 'jimeng_t2i_v31', 'detach-task',
+                      schedule=schedule)
+
+    deadline = time.monotonic() + 5
+    while journal.get('orphan-task')['status'] != 'done' or journal.get('detach-task')['status'] != 'done':
+        assert time.monotonic() < deadline, "adopted tasks were not polled to completion"
+        time.sleep(0.02)
+    assert history.count('jimeng_t2i_v31') == 1
+    assert history.total_quantile('jimeng_t2i_v31') >= 5
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证异步客户端与事件循环轮询
+
+使用方法：
+1. 无需 VolcEngine 凭证，测试会在本地启动一个简易的视觉接口服务
+2. 运行测试：pytest test/test_task_poller.py
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tools.text_to_image
+import utils.polling
+import utils.task_poller
+from tools.text_to_image import TextToImageTool
+from utils.async_client import background_loop, get_async_client
+from utils.client_pool import get_visual_service
+from utils.polling import LatencyHistory, PollPolicy, PollSchedule
+from utils.reconciler import TaskReconciler
+from utils.task_journal import TaskJournal
+from utils.task_poller import SharedPoller, TimerWheel, iter_task_results, shared_poller
+
+FAST = PollPolicy(first_delay=0.01, min_interval=0.01, max_interval=0.02, backoff=1.5, jitter=0.0, timeout=5)
+
+
+class FakeVisualHandler(BaseHTTPRequestHandler):
+    """依次返回 in_queue、generating、done 的简易接口"""
+    statuses = ['in_queue', 'generating', 'done']
+    queries: dict = {}
+    requests: list = []
+
+    def do_POST(self):
+        action = parse_qs(urlparse(self.path).query)['Action'][0]
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        FakeVisualHandler.requests.append((action, body, self.headers.get('Authorization')))
+        if action == 'CVSync2AsyncSubmitTask':
+            result = {'code': 10000, 'data': {'task_id': f"task-{len(FakeVisualHandler.requests)}"}}
+        else:
+            count = FakeVisualHandler.queries.get(body['task_id'], 0)
+            FakeVisualHandler.queries[body['task_id']] = count + 1
+            status = self.statuses[min(count, len(self.statuses) - 1)]
+            data = {'status': status}
+            if status == 'done':
+                data['image_urls'] = ['https://example.com/a.png']
+            result = {'code': 10000, 'data': data}
+        payload = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class MockRuntime:
+    """模拟 runtime 对象"""
+    def __init__(self, access_key: str, secret_key: str):
+        self.credentials = {
+            'volcengine_access_key': access_key,
+            'volcengine_secret_key': secret_key
+        }
+
+
+class MockSession:
+    """模拟 session 对象"""
+    def __init__(self):
+        pass
+
+
+def start_fake_server(access_key: str, secret_key: str) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeVisualHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    service = get_visual_service(access_key, secret_key)
+    service.set_host(f"127.0.0.1:{server.server_address[1]}")
+    service.set_scheme('http')
+    return server
+
+
+def test_iter_task_results():
+    """后台事件循环轮询到 done 后停止，并记录耗时"""
+    server = start_fake_server('poller_ak', 'poller_sk')
+    try:
+        client = get_async_client('poller_ak', 'poller_sk')
+        submit = background_loop.run(client.cv_sync2async_submit_task({'req_key': 'jimeng_t2i_v31', 'prompt': 'cat'}))
+        task_id = submit['data']['task_id']
+        history = LatencyHistory()
+        schedule = PollSchedule('jimeng_t2i_v31', policy=FAST, history=history)
+        results = list(iter_task_results(client, 'jimeng_t2i_v31', task_id, schedule=schedule))
+        statuses = [response['data']['status'] for _, response in results]
+        assert statuses == ['in_queue', 'generating', 'done']
+        assert history.count('jimeng_t2i_v31') == 1
+        # 请求经过 SignerV4 签名
+        assert all(auth and auth.startswith('HMAC-SHA256') for _, _, auth in FakeVisualHandler.requests)
+    finally:
+        server.shutdown()
+
+
+class ErrorStatusHandler(BaseHTTPRequestHandler):
+    """按请求体中的 status 返回对应的 HTTP 状态码与响应体"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        payload = body['payload'].encode('utf-8')
+        self.send_response(body['status'])
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_non_200_json_body_is_returned():
+    """非 200 响应体为 JSON 时与 PooledVisualService 一样按 dict 返回，不是 JSON 时抛出异常"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ErrorStatusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        service = get_visual_service('status_ak', 'status_sk')
+        service.set_host(f"127.0.0.1:{server.server_address[1]}")
+        service.set_scheme('http')
+        client = get_async_client('status_ak', 'status_sk')
+        error = {'code': 50413, 'message': 'Post Text Risk Not Pass', 'data': None}
+        response = background_loop.run(client._send('CVProcess', {'status': 400, 'payload': json.dumps(error)}))
+        assert response == error
+        with pytest.raises(Exception, match='upstream unavailable'):
+            background_loop.run(client._send('CVProcess', {'status': 502, 'payload': 'upstream unavailable'}))
+    finally:
+        server.shutdown()
+
+
+def test_timer_wheel():
+    """时间轮按到期时间返回条目"""
+    wheel = TimerWheel(tick=0.01, slots=8)
+    wheel.add('soon', 0.0)
+    wheel.add('later', 0.2)
+    time.sleep(0.03)
+    assert wheel.advance() == ['soon']
+    time.sleep(0.2)
+    # 超过一整圈的延迟同样能正确到期
+    assert wheel.advance() == ['later']
+    assert len(wheel) == 0
+
+
+def test_shared_poller_coalesces_subscribers():
+    """同一任务的多个订阅方与手动查询共享同一次轮询"""
+    server = start_fake_server('shared_ak', 'shared_sk')
+    try:
+        client = get_async_client('shared_ak', 'shared_sk')
+        submit = background_loop.run(client.cv_sync2async_submit_task({'req_key': 'jimeng_t2i_v31', 'prompt': 'dog'}))
+        task_id = submit['data']['task_id']
+        poller = SharedPoller(tick=0.01)
+        first = poller.watch(client, 'jimeng_t2i_v31', task_id,
+                             schedule=PollSchedule('jimeng_t2i_v31', policy=FAST, history=LatencyHistory()))
+        second = poller.watch(client, 'jimeng_t2i_v31', task_id,
+                              schedule=PollSchedule('jimeng_t2i_v31', policy=FAST, history=LatencyHistory()))
+        manual = poller.fetch(client, 'jimeng_t2i_v31', task_id)
+        first_statuses = [response['data']['status'] for _, response in first]
+        second_statuses = [response['data']['status'] for _, response in second]
+        print(f"查询次数: {FakeVisualHandler.queries[task_id]}, 订阅结果: {first_statuses}")
+        assert first_statuses == second_statuses
+        assert first_statuses[-1] == 'done'
+        assert manual['data']['status'] in ('in_queue', 'generating', 'done')
+        # 两个订阅方与一次手动查询合计只产生 3 次查询
+        assert FakeVisualHandler.queries[task_id] == 3
+        assert poller.watching() == 0
+    finally:
+        server.shutdown()
+
+
+class ScriptedClient:
+    """按脚本依次返回任务状态或抛出异常的异步客户端，脚本用完后重复最后一步"""
+
+    def __init__(self, fingerprint: str, script: list):
+        self.fingerprint = fingerprint
+        self.script = list(script)
+        self.queries: list[dict] = []
+
+    async def cv_sync2async_get_result(self, form: dict) -> dict:
+        self.queries.append(form)
+        step = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+        if isinstance(step, Exception):
+            raise step
+        data = {'status': step}
+        if step == 'done':
+            data['req_json'] = form.get('req_json')
+        return {'code': 10000, 'data': data}
+
+
+def test_subscribers_with_different_req_json_both_get_done(monkeypatch, tmp_path):
+    """req_json 不同的订阅方在任务完成后各自取到按自己参数返回的结果"""
+    monkeypatch.setattr(utils.task_poller, 'task_journal', TaskJournal(str(tmp_path / 'journal.db')))
+    client = ScriptedClient('own_fp', ['in_queue', 'done'])
+    poller = SharedPoller(tick=0.01)
+    plain = poller.watch(client, 'jimeng_t2i_v31', 'own-task', '{"logo_info": {"add_logo": false}}',
+                         schedule=PollSchedule('jimeng_t2i_v31', policy=FAST, history=LatencyHistory()))
+    logo = poller.watch(client, 'jimeng_t2i_v31', 'own-task', '{"logo_info": {"add_logo": true}}',
+                        schedule=PollSchedule('jimeng_t2i_v31', policy=FAST, history=LatencyHistory()))
+    plain_results = [response['data'] for _, response in plain]
+    logo_results = [response['data'] for _, response in logo]
+    assert plain_results[-1] == {'status': 'done', 'req_json': '{"logo_info": {"add_logo": false}}'}
+    assert logo_results[-1] == {'status': 'done', 'req_json': '{"logo_info": {"add_logo": true}}'}
+
+
+def test_transient_query_errors_are_retried(monkeypatch, tmp_path):
+    """偶发的查询错误按退避重试，连续多次失败才通知订阅方，后台跟踪的任务继续轮询"""
+    journal = TaskJournal(str(tmp_path / 'journal.db'))
+    monkeypatch.setattr(utils.task_poller, 'task_journal', journal)
+    poller = SharedPoller(tick=0.01, max_errors=3)
+
+    flaky = ScriptedClient('flaky_fp', [ConnectionError('reset'), TimeoutError('timed out'), 'in_queue', 'done'])
+    results = list(poller.watch(flaky, 'jimeng_t2i_v31', 'flaky-task',
+                                schedule=PollSchedule('jimeng_t2i_v31', policy=FAST, history=LatencyHistory())))
+    assert [response['data']['status'] for _, response in results] == ['in_queue', 'done']
+
+    broken = ScriptedClient('broken_fp', [ConnectionError('reset')] * 3 + ['done'])
+    with pytest.raises(ConnectionError):
+        list(poller.watch(broken, 'jimeng_t2i_v31', 'broken-task',
+                          schedule=PollSchedule('jimeng_t2i_v31', policy=FAST, history=LatencyHistory())))
+
+    journal.record_submit('detached_fp', 'detached-task', 'jimeng_t2i_v31')
+    detached = ScriptedClient('detached_fp', [ConnectionError('reset')] * 5 + ['done'])
+    poller.watch_detached(detached, 'jimeng_t2i_v31', 'detached-task',
+                          schedule=PollSchedule('jimeng_t2i_v31', policy=FAST, history=LatencyHistory()))
+    deadline = time.monotonic() + 5
+    while journal.get('detached-task')['status'] != 'done':
+        assert time.monotonic() < deadline, "detached task stopped polling after errors"
+        time.sleep(0.02)
+
+
+class CVProcessClient:
+    """只提供 CVProcess 接口的异步客户端，返回带 ResponseMetadata 的原始响应"""
+
+    def __init__(self, fingerprint: str, statuses: list[str]):
+        self.fingerprint = fingerprint
+        self.statuses = list(statuses)
+        self.forms: list[dict] = []
+
+    async def cv_process(self, form: dict) -> dict:
+        self.forms.append(form)
+        if form['task_id'] == 'missing-task':
+            return {'ResponseMetadata': {'Error': {'Code': 'NotFound', 'CodeN': 50404, 'Message': 'no such task'}}}
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return {'ResponseMetadata': {}, 'Result': {'code': 10000, 'data': {'status': status}}}
+
+
+def test_cv_process_tasks_polled_through_cv_process(monkeypatch, tmp_path):
+    """动作模仿任务通过 CVProcess 的 cv_get_result 查询，响应展开为 CVSync2AsyncGetResult 的格式"""
+    journal = TaskJournal(str(tmp_path / 'journal.db'))
+    monkeypatch.setattr(utils.task_poller, 'task_journal', journal)
+    client = CVProcessClient('motion_fp', ['in_queue', 'generating', 'done'])
+    journal.record_submit('motion_fp', 'motion-task', 'jimeng_motion_imitation_L')
+    poller = SharedPoller(tick=0.01)
+    results = list(poller.watch(client, 'jimeng_motion_imitation_L', 'motion-task',
+                                schedule=PollSchedule('jimeng_motion_imitation_L', policy=FAST,
+                                                      history=LatencyHistory())))
+    assert [response['data']['status'] for _, response in results] == ['in_queue', 'generating', 'done']
+    assert client.forms[0] == {'req_key': 'cv_get_result', 'task_id': 'motion-task'}
+    assert journal.get('motion-task')['status'] == 'done'
+
+    response = poller.fetch(client, 'jimeng_motion_imitation_L', 'missing-task')
+    assert response['code'] == 50404 and response['data'] is None
+    assert 'no such task' in response['message']
+
+
+def test_text_to_image_tool_streams_messages(monkeypatch, tmp_path):
+    """TextToImageTool 通过事件循环轮询并流式输出消息"""
+    monkeypatch.setenv('DREAMAI_POLL_IMAGE_FIRST_DELAY', '0.01')
+    monkeypatch.setenv('DREAMAI_POLL_IMAGE_MIN_INTERVAL', '0.01')
+    # 使用独立的任务日志与耗时历史，避免受本机其他运行记录影响
+    journal = TaskJournal(str(tmp_path / 'journal.db'))
+    monkeypatch.setattr(tools.text_to_image, 'task_journal', journal)
+    monkeypatch.setattr(tools.text_to_image, 'task_reconciler', TaskReconciler(journal, shared_poller))
+    monkeypatch.setattr(utils.task_poller, 'task_journal', journal)
+    monkeypatch.setattr(utils.polling, 'latency_history', LatencyHistory())
+    server = start_fake_server('tool_ak', 'tool_sk')
+    try:
+        tool = TextToImageTool(runtime=MockRuntime('tool_ak', 'tool_sk'), session=MockSession())
+        messages = list(tool._invoke({'prompt': '一只猫', 'seed': 42}))
+        json_messages = [m.message.json_object for m in messages if m.type == m.MessageType.JSON]
+        assert json_messages and json_messages[-1]['image_urls'] == ['https://example.com/a.png']
+    finally:
+        server.shutdown()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件：用于本地验证提交前的参考链接检查
+
+使用方法：
+1. 无需 VolcEngine 凭证，测试启动本地 HTTP 服务提供参考文件
+2. 运行测试：pytest test/test_url_preflight.py
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_visual_server import MockConfig, MockVisualServer
+from test_mock_visual_server import _isolate
+from test_task_poller import MockRuntime, MockSession
+from tools.text_to_image import TextToImageTool
+from utils.url_preflight import UrlPreflight
+
+# 路径 -> (HEAD 状态码, 内容类型, 大小)；HEAD 状态码为 405 时只能通过 GET 获取
+FILES = {
+    '/cat.png': (200, 'image/png', 2048),
+    '/large.png': (200, 'image/png', 50 * 1024 * 1024),
+    '/page.html': (200, 'text/html; charset=utf-8', 512),
+    '/no-head.mp4': (405, 'video/mp4', 4096),
+    '/slow.png': (200, 'image/png', 1024),
+}
+
+
+class ReferenceHandler(BaseHTTPRequestHandler):
+    requests: Counter = Counter()
+
+    def _respond(self, method: str):
+        path = self.path.split('?')[0]
+        ReferenceHandler.requests[(method, path)] += 1
+        entry = FILES.get(path)
+        if entry is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        head_status, content_type, size = entry
+        if path == '/slow.png':
+            time.sleep(0.5)
+        if method == 'HEAD' and head_status != 200:
+            self.send_response(head_status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if method == 'GET' and self.headers.get('Range') == 'bytes=0-0':
+            self.send_response(206)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Range', f"bytes 0-0/{size}")
+            self.send_header('Content-Length', '1')
+            self.end_headers()
+            self.wfile.write(b'\x00')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._respond('HEAD')
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ReferenceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_checks_urls_concurrently_and_caches_passes():
+    """并发检查全部链接并给出各自的错误；检查通过的链接在 ttl 内不再请求"""
+    server, base = _serve()
+    try:
+        ReferenceHandler.requests.clear()
+        preflight = UrlPreflight(timeout=2)
+        errors = preflight.check([
+            (f"{base}/cat.png", 'image'),
+            (f"{base}/large.png", 'image'),
+            (f"{base}/page.html", 'image'),
+            (f"{base}/missing.png", 'image'),
+            (f"{base}/no-head.mp4", 'video'),
+            (f"http://127.0.0.1:{_closed_port()}/a.png", 'image'),
+            ('aGVsbG8=', 'image'),
+        ])
+        assert len(errors) == 4
+        assert any('too large (50.0MB > 15.0MB)' in error for error in errors)
+        assert any('unexpected content type text/html' in error for error in errors)
+        assert any('HTTP 404' in error for error in errors)
+        assert any('not reachable' in error for error in errors)
+        # 不支持 HEAD 时改用 Range GET
+        assert ReferenceHandler.requests[('GET', '/no-head.mp4')] == 1
+
+        assert preflight.check([(f"{base}/cat.png", 'image'), (f"{base}/no-head.mp4", 'video')]) == []
+        assert ReferenceHandler.requests[('HEAD', '/cat.png')] == 1
+        assert preflight.check([(f"{base}/missing.png", 'image')]) != []
+        assert ReferenceHandler.requests[('HEAD', '/missing.png')] == 2
+    finally:
+        server.shutdown()
+
+
+def test_timeout_is_inconclusive():
+    """超时视为无法判断，放行但不缓存"""
+    server, base = _serve()
+    try:
+        ReferenceHandler.requests.clear()
+        preflight = UrlPreflight(timeout=0.1)
+        assert preflight.check([(f"{base}/slow.png", 'image')]) == []
+        assert preflight.check([(f"{base}/slow.png", 'image')]) == []
+        assert ReferenceHandler.requests[('HEAD', '/slow.png')] == 2
+    finally:
+        server.shutdown()
+
+
+def test_unexpected_errors_stay_per_url(monkeypatch):
+    """单个链接的意外异常不影响其他链接：格式错误的链接报错，其他异常视为无法判断"""
+    server, base = _serve()
+    try:
+        preflight = UrlPreflight(timeout=2)
+        fetch_headers = preflight._fetch_headers
+
+        async def flaky_fetch(url):
+            if url.endswith('/broken.png'):
+                raise RuntimeError('unexpected')
+            return await fetch_headers(url)
+
+        monkeypatch.setattr(preflight, '_fetch_headers', flaky_fetch)
+        errors = preflight.check([
+            (f"{base}/broken.png", 'image'),
+            ('http://\x00invalid/a.png', 'image'),
+            (f"{base}/missing.png", 'image'),
+        ])
+        assert len(errors) == 2
+        assert any('not a valid URL' in error for error in errors)
+        assert any('HTTP 404' in error for error in errors)
+    finally:
+        server.shutdown()
+
+
+def test_tool_rejects_broken_reference_before_submitting(monkeypatch, tmp_path):
+    """参考图无法访问时文生图 4.0 直接报错，不提交任务"""
+    server, base = _serve()
+    try:
+        with MockVisualServer(MockConfig()) as visual:
+            _isolate(monkeypatch, tmp_path, visual.endpoint)
+            tool = TextToImageTool(runtime=MockRuntime('preflight_ak', 'preflight_sk'), session=MockSession())
+            messages = list(tool._invoke({
+                'prompt': '一只猫', 'model_version': '4.0', 'image_urls': f"{base}/cat.png\n{base}/missing.png",
+            }))
+            assert messages[-1].message.text.startswith('Error: image URL returned HTTP 404')
+            assert visual.stats.requests['CVSync2AsyncSubmitTask'] == 0
+    finally:
+        server.shutdown()
@@ -0,0 +1,236 @@
+import queue
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.artifact_store import artifact_store
+from utils.client_pool import credential_fingerprint
+from utils.credential_check import credential_validator
+from utils.delivery import deliver_blobs
+from utils.key_pool import key_pool, parse_api_keys
+from utils.metrics import InvocationTimer
+from utils.polling import Deadline, PollSchedule, get_policy
+from utils.reconciler import task_reconciler
+from utils.request_builders import build_text_to_image_request
+from utils.result_cache import request_fingerprint, result_cache
+from utils.single_flight import single_flight
+from utils.submit_queue import resolve_priority
+from utils.task_journal import task_journal
+from utils.task_poller import iter_task_results
+
+# 单次调用最多生成的图片任务数
+MAX_BATCH_SIZE = 500
+
+# 并发数上限，与工具参数的取值范围一致
+MAX_CONCURRENCY = 32
+
+
+def _parse_seeds(seeds_str: str) -> list[int]:
+    return [int(seed.strip()) for seed in seeds_str.replace('\n', ',').split(',') if seed.strip()]
+
+
+class BatchTextToImageTool(Tool):
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # 记录整批调用的各阶段耗时；各任务的排队与生成相互重叠，不单独拆分
+        timer = InvocationTimer('batch_text_to_image')
+        try:
+            # 获取凭证
+            access_key = self.runtime.credentials.get('volcengine_access_key')
+            secret_key = self.runtime.credentials.get('volcengine_secret_key')
+
+            if not access_key or not secret_key:
+                yield self.create_text_message("Error: VolcEngine credentials not found")
+                return
+
+            # 凭证已被验证为无效时直接报错，不再构建参数并发送必然失败的请求
+            credential_error = credential_validator.cached_error(access_key, secret_key)
+            if credential_error:
+                yield self.create_text_message(f"Error: {credential_error}")
+                return
+
+            # 本次调用的时间预算，预计无法按时完成的任务提前返回任务句柄
+            deadline = Deadline(tool_parameters.get('deadline_seconds'))
+
+            # 凭证池：主凭证与 provider 中配置的额外凭证
+            api_keys = parse_api_keys(self.runtime.credentials)
+            
+            # 恢复各凭证在插件重启前未完成的任务
+            for api_key in api_keys:
+                task_reconciler.reconcile(api_key.access_key, api_key.secret_key)
+
+            # 解析提示词与随机种子，生成 提示词×种子 的任务列表
+            prompts = [line.strip() for line in (tool_parameters.get('prompts') or '').split('\n') if line.strip()]
+            if not prompts:
+                yield self.create_text_message("Error: prompts is required")
+                return
+
+            try:
+                seeds = _parse_seeds(tool_parameters.get('seeds') or '') or [-1]
+            except ValueError:
+                yield self.create_text_message("Error: seeds must be comma separated integers")
+                return
+
+            if len(prompts) * len(seeds) > MAX_BATCH_SIZE:
+                yield self.create_text_message(f"Error: at most {MAX_BATCH_SIZE} images per batch, got {len(prompts) * len(seeds)}")
+                return
+
+            # 先构建全部请求，参数有误时不提交任何任务
+            items = []
+            try:
+                with timer.phase('build'):
+                    for prompt in prompts:
+                        for seed in seeds:
+                            req_key, form_data, req_json = build_text_to_image_request({**tool_parameters, 'prompt': prompt, 'seed': seed})
+                            items.append({
+                                "index": len(items),
+                                "prompt": prompt,
+                                "seed": seed,
+                                "req_key": req_key,
+                                "form_data": form_data,
+                                "req_json": req_json,
+                                "store_artifacts": bool(tool_parameters.get('store_artifacts')),
+                                "priority": resolve_priority('batch_text_to_image', tool_parameters),
+                            })
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+            timer.req_key = items[0]['req_key']
+
+            concurrency = min(max(int(tool_parameters.get('concurrency') or 8), 1), MAX_CONCURRENCY)
+
+            yield self.create_text_message(f"开始批量生成，共{len(items)}个任务，并发数{concurrency}")
+
+            # 按完成顺序输出结果
+            completed: queue.Queue = queue.Queue()
+            counts = {"done": 0, "failed": 0, "pending": 0}
+            executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='dreamai-batch')
+            try:
+                for item in items:
+                    executor.submit(self._run_item, deadline, item).add_done_callback(
+                        lambda future, item=item: completed.put(self._future_result(future, item)))
+
+                for finished in range(1, len(items) + 1):
+                    result = completed.get()
+                    counts[result['status']] += 1
+                    progress = f"[{finished}/{len(items)}] 第{result['index'] + 1}个任务"
+                    if result['status'] == 'done':
+                        image_count = len(result.get('image_urls') or result.get('binary_data_base64') or [])
+                        yield self.create_text_message(f"{progress}生成成功，共{image_count}张图片")
+                        if result.get('binary_data_base64'):
+                            # 图片以 blob 消息输出，JSON 中只保留引用
+                            with timer.phase('delivery'):
+                                result['images'] = yield from deliver_blobs(
+                                    self, result.pop('binary_data_base64'), 'image/png', f"image_{result['index'] + 1}")
+                            timer.add_references(result['images'])
+                        timer.add_references(result.get('artifacts'))
+                    elif result['status'] == 'pending':
+                        yield self.create_text_message(f"{progress}未能在本次调用内完成，已转入后台跟踪")
+                    else:
+                        yield self.create_text_message(f"{progress}失败: {result.get('error')}")
+                    yield self.create_json_message(result)
+            finally:
+                # 调用方提前断开时不再提交排队中的任务
+                executor.shutdown(wait=False, cancel_futures=True)
+
+            yield self.create_json_message({
+                "total": len(items),
+                "succeeded": counts['done'],
+                "failed": counts['failed'],
+                "pending": counts['pending'],
+            })
+            # 全部成功记为 success，没有失败但有任务转入后台时记为 detached，其余记为 failed
+            if counts['done'] == len(items):
+                timer.outcome = 'success'
+            elif counts['failed'] == 0:
+                timer.outcome = 'detached'
+        except Exception as e:
+            timer.outcome = 'error'
+            yield self.create_text_message(f"Error: {str(e)}")
+        finally:
+            timer.finish()
+
+    @staticmethod
+    def _future_result(future, item: dict) -> dict:
+        try:
+            return future.result()
+        except Exception as e:
+            return {"index": item['index'], "prompt": item['prompt'], "seed": item['seed'],
+                    "status": "failed", "error": str(e)}
+
+    def _run_item(self, deadline: Deadline, item: dict) -> dict:
+        """提交单个任务并等待结果，在线程池中执行；所有任务的轮询由共享轮询器统一调度"""
+        credentials = self.runtime.credentials
+        req_key, form_data, req_json = item['req_key'], item['form_data'], item['req_json']
+        result = {"index": item['index'], "prompt": item['prompt'], "seed": item['seed'], "req_key": req_key}
+
+        # 显式指定seed时生成结果是确定的，优先读取结果缓存
+        cache_key = None
+        if item['seed'] != -1:
+            namespace = credential_fingerprint(credentials['volcengine_access_key'], credentials['volcengine_secret_key'])
+            cache_key = request_fingerprint(form_data, req_json, namespace=namespace)
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                result = {**result, **cached, "status": "done", "cache_hit": True}
+                if cached.get('image_urls') and item.get('store_artifacts'):
+                    result['artifacts'] = artifact_store.store_urls(cached['image_urls'])
+                return result
+
+        # 第一步：按凭证池策略提交任务，相同请求正在进行时复用其task_id
+        submit = lambda: key_pool.submit(credentials, form_data, priority=item['priority'])
+        if cache_key:
+            submit_resp, _ = single_flight.submit(cache_key, submit, ttl=get_policy(req_key).timeout)
+        else:
+            submit_resp = submit()
+
+        if submit_resp.get('code') != 10000:
+            return {**result, "status": "failed", "error": f"提交任务失败: {submit_resp.get('message', 'Unknown error')}"}
+
+        task_id = submit_resp.get('data', {}).get('task_id')
+        if not task_id:
+            return {**result, "status": "failed", "error": "提交任务失败: 未获取到task_id"}
+        result['task_id'] = task_id
+
+        # 任务固定在创建它的凭证上
+        async_client = key_pool.client_for_task(credentials, task_id)
+
+        # 记录任务，轮询超时或插件重启后仍可继续跟踪
+        task_journal.record_submit(async_client.fingerprint, task_id, req_key, req_json)
+
+        # 第二步：通过共享轮询器等待任务结果
+        schedule = PollSchedule(req_key, timeout=deadline.poll_timeout(req_key))
+
+        for attempt, result_resp in iter_task_results(async_client, req_key, task_id, req_json, schedule=schedule):
+            if result_resp.get('code') != 10000:
+                single_flight.release(cache_key)
+                return {**result, "status": "failed", "error": f"查询任务失败: {result_resp.get('message', 'Unknown error')}"}
+
+            data = result_resp.get('data', {})
+            status = data.get('status')
+
+            # 剩余预算不足以等到预计完成时间时停止等待
+            if status in ['in_queue', 'generating'] and deadline.exceeded_by(schedule) is not None:
+                break
+
+            if status == 'done':
+                if form_data['return_url'] and data.get('image_urls'):
+                    images = {"image_urls": data['image_urls']}
+                elif data.get('binary_data_base64'):
+                    images = {"binary_data_base64": data['binary_data_base64']}
+                else:
+                    return {**result, "status": "failed", "error": "任务完成，但未找到图片数据"}
+                if cache_key:
+                    result_cache.put(cache_key, {"task_id": task_id, "req_key": req_key, **images})
+                if images.get('image_urls') and item.get('store_artifacts'):
+                    # 在工作线程中下载到本地内容寻址存储，链接失效后仍可读取
+                    result['artifacts'] = artifact_store.store_urls(images['image_urls'])
+                return {**result, **images, "status": "done", "cache_hit": False}
+            elif status in ['not_found', 'expired']:
+                single_flight.release(cache_key)
+                return {**result, "status": "failed", "error": f"任务状态异常: {status}"}
+
+        # 超出时间预算或轮询超时后由后台继续跟踪，结果写入任务日志
+        handle = task_reconciler.detach(async_client, req_key, task_id, req_json, schedule)
+        return {**result, **handle, "status": "pending"}
@@ -4,11 +4,21 @@ from typing import Any
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from volcengine.visual.VisualService import VisualService
+
+from utils.credential_check import credential_validator
+from utils.delivery import deliver_blobs
+from utils.key_pool import key_pool
+from utils.metrics import InvocationTimer
+from utils.polling import PollSchedule
+from utils.progress import ProgressReporter
+from utils.task_journal import task_journal
+from utils.task_poller import TERMINAL_STATUSES, fetch_task_result, iter_task_results
 
 
 class CVGetResultTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # 记录各阶段耗时，调用结束时汇总到进程级指标
+        timer = InvocationTimer('cv_get_result')
         try:
             # 获取凭证
             access_key = self.runtime.credentials.get('volcengine_access_key')
@@ -18,15 +28,35 @@ class CVGetResultTool(Tool):
                 yield self.create_text_message("Error: VolcEngine credentials not found")
                 return
             
+            # 凭证已被验证为无效时直接报错，不再构建参数并发送必然失败的请求
+            credential_error = credential_validator.cached_error(access_key, secret_key)
+            if credential_error:
+                yield self.create_text_message(f"Error: {credential_error}")
+                return
+            
             # 获取参数
             req_key = tool_parameters.get('req_key')
             task_id = tool_parameters.get('task_id')
             req_json = tool_parameters.get('req_json')
             
-            if not req_key or not task_id:
-                yield self.create_text_message("Error: req_key and task_id are required")
+            if not task_id:
+                yield self.create_text_message("Error: task_id is required")
                 return
             
+            # 获取创建该任务的凭证对应的异步客户端
+            async_client = key_pool.client_for_task(self.runtime.credentials, task_id)
+            
+            # 从任务日志补全提交时的 req_key 与 req_json
+            record = task_journal.get(task_id, async_client.fingerprint)
+            if record:
+                req_key = req_key or record['req_key']
+                req_json = req_json or record['req_json']
+            
+            if not req_key:
+                yield self.create_text_message("Error: req_key is required for tasks not found in the task journal")
+                return
+            timer.req_key = req_key
+            
             # 构建请求数据
             form_data = {
                 'req_key': req_key,
@@ -42,22 +72,62 @@ class CVGetResultTool(Tool):
                     yield self.create_text_message("Error: Invalid JSON format in req_json parameter")
                     return
             
-            # 创建VisualService实例
-            visual_service = VisualService()
-            visual_service.set_ak(access_key)
-            visual_service.set_sk(secret_key)
-            
             yield self.create_text_message("Retrieving task result...")
             
-            # 调用cv_get_result API
-            response = visual_service.cv_sync2async_get_result(form_data)
+            # 查询任务结果，若该任务正在被其他调用轮询则直接复用其查询
+            with timer.phase('poll'):
+                response = fetch_task_result(async_client, req_key, task_id, form_data.get('req_json'))
+                status = (response.get('data') or {}).get('status')
+                timer.observe_status(status)
+                
+                # 指定等待时长时继续轮询，直至任务结束或等待超时
+                wait_seconds = float(tool_parameters.get('wait_seconds') or 0)
+                if wait_seconds > 0 and response.get('code') == 10000 and status not in TERMINAL_STATUSES:
+                    schedule = PollSchedule(req_key, timeout=wait_seconds)
+                    progress = ProgressReporter(schedule)
+                    for attempt, result_resp in iter_task_results(async_client, req_key, task_id,
+                                                                  form_data.get('req_json'), schedule=schedule):
+                        response = result_resp
+                        status = (response.get('data') or {}).get('status')
+                        timer.observe_status(status)
+                        # 进度消息只在状态变化或超过最小间隔时输出
+                        message = progress.update(status, attempt)
+                        if message:
+                            yield self.create_text_message(message)
+            
+            if status:
+                task_journal.update_status(async_client.fingerprint, task_id, status, response.get('data'))
+            
+            # 生成结果以 blob 消息输出，JSON 中只保留引用
+            data = response.get('data')
+            if isinstance(data, dict) and data.get('binary_data_base64'):
+                data = dict(data)
+                with timer.phase('delivery'):
+                    data['files'] = yield from deliver_blobs(self, data.pop('binary_data_base64'), name=task_id)
+                timer.add_references(data['files'])
+                response = {**response, "data": data}
             
             # 返回结果
-            yield self.create_json_message({
+            result = {
                 "status": "success",
                 "task_id": task_id,
                 "result": response
-            })
+            }
+            if record:
+                result["journal"] = {
+                    "req_key": record['req_key'],
+                    "submitted_at": record['submitted_at'],
+                    "status": status or record['status']
+                }
+            yield self.create_json_message(result)
+            # 任务已完成记为 success，仍在进行中记为 pending，查询失败或任务异常记为 failed
+            if response.get('code') == 10000 and status == 'done':
+                timer.outcome = 'success'
+            elif response.get('code') == 10000 and status not in TERMINAL_STATUSES:
+                timer.outcome = 'pending'
             
         except Exception as e:
-            yield self.create_text_message(f"Error: {str(e)}")
\ No newline at end of file
+            timer.outcome = 'error'
+            yield self.create_text_message(f"Error: {str(e)}")
+        finally:
+            timer.finish()
\ No newline at end of file
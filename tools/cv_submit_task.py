@@ -4,7 +4,10 @@ from typing import Any
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from volcengine.visual.VisualService import VisualService
+
+from utils.client_pool import credential_fingerprint, get_visual_service
+from utils.credential_check import credential_validator
+from utils.task_journal import task_journal
 
 
 class CVSubmitTaskTool(Tool):
@@ -18,6 +21,12 @@ class CVSubmitTaskTool(Tool):
                 yield self.create_text_message("Error: VolcEngine credentials not found")
                 return
             
+            # 凭证已被验证为无效时直接报错，不再构建参数并发送必然失败的请求
+            credential_error = credential_validator.cached_error(access_key, secret_key)
+            if credential_error:
+                yield self.create_text_message(f"Error: {credential_error}")
+                return
+            
             # 获取参数
             req_key = tool_parameters.get('req_key')
             request_body = tool_parameters.get('request_body')
@@ -34,16 +43,20 @@ class CVSubmitTaskTool(Tool):
                 yield self.create_text_message("Error: Invalid JSON format in request_body")
                 return
             
-            # 创建VisualService实例
-            visual_service = VisualService()
-            visual_service.set_ak(access_key)
-            visual_service.set_sk(secret_key)
+            # 从客户端池获取VisualService
+            visual_service = get_visual_service(access_key, secret_key)
             
             yield self.create_text_message("Submitting async task...")
             
             # 调用cv_submit_task API
             response = visual_service.cv_submit_task(form_data)
             
+            # 记录任务，之后可通过 cv_get_result 仅凭 task_id 查询，插件重启后也能找回 req_key
+            result = response.get('Result', response) if isinstance(response, dict) else {}
+            task_id = (result.get('data') or {}).get('task_id') if result.get('code') == 10000 else None
+            if task_id:
+                task_journal.record_submit(credential_fingerprint(access_key, secret_key), task_id, req_key)
+            
             # 返回结果
             yield self.create_json_message({
                 "status": "success",
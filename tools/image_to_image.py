@@ -1,16 +1,33 @@
-import json
 import base64
-import time
 from collections.abc import Generator
 from typing import Any
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from volcengine.visual.VisualService import VisualService
+
+from utils.artifact_store import artifact_store
+from utils.client_pool import credential_fingerprint
+from utils.credential_check import credential_validator
+from utils.delivery import deliver_blobs
+from utils.image_preprocess import image_preprocessor
+from utils.key_pool import key_pool, parse_api_keys
+from utils.metrics import InvocationTimer
+from utils.polling import Deadline, PollSchedule, get_policy
+from utils.progress import ProgressReporter
+from utils.reconciler import task_reconciler
+from utils.request_builders import build_image_to_image_request
+from utils.result_cache import request_fingerprint, result_cache
+from utils.single_flight import single_flight
+from utils.submit_queue import resolve_priority
+from utils.task_journal import task_journal
+from utils.task_poller import iter_task_results
+from utils.url_preflight import url_preflight
 
 
 class ImageToImageTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # 记录各阶段耗时，调用结束时汇总到进程级指标
+        timer = InvocationTimer('image_to_image')
         try:
             # 获取凭证
             access_key = self.runtime.credentials.get('volcengine_access_key')
@@ -20,89 +37,89 @@ class ImageToImageTool(Tool):
                 yield self.create_text_message("Error: VolcEngine credentials not found")
                 return
             
-            # 获取必需参数
-            prompt = tool_parameters.get('prompt')
-            if not prompt:
-                yield self.create_text_message("Error: prompt is required")
+            # 凭证已被验证为无效时直接报错，不再构建参数并发送必然失败的请求
+            credential_error = credential_validator.cached_error(access_key, secret_key)
+            if credential_error:
+                yield self.create_text_message(f"Error: {credential_error}")
                 return
             
-            image_input = tool_parameters.get('image_input')
-            if not image_input:
-                yield self.create_text_message("Error: image_input is required")
-                return
+            # 本次调用的时间预算，预计无法按时完成的任务提前返回任务句柄
+            deadline = Deadline(tool_parameters.get('deadline_seconds'))
+            
+            # 凭证池：主凭证与 provider 中配置的额外凭证
+            api_keys = parse_api_keys(self.runtime.credentials)
+            
+            # 恢复各凭证在插件重启前未完成的任务
+            for api_key in api_keys:
+                task_reconciler.reconcile(api_key.access_key, api_key.secret_key)
             
-            req_key = "jimeng_i2i_v30"
             # 构建请求数据
-            form_data = {
-                'req_key': req_key,  # 即梦图生图3.0智能参考
-                'prompt': prompt
-            }
-            
-            # 处理图片输入：binary_data_base64 和 image_urls 二选一
-            if image_input.startswith('http'):
-                # URL格式
-                form_data['image_urls'] = [image_input]
-            else:
-                # Base64格式
-                form_data['binary_data_base64'] = [image_input]
-            
-            # 添加可选参数
+            try:
+                with timer.phase('build'):
+                    req_key, form_data, req_json = build_image_to_image_request(tool_parameters)
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+            timer.req_key = req_key
+            
+            # 开启预处理时 base64 输入图像在本地缩小到模型实际使用的分辨率并重新编码，减少上传量；
+            # 重新编码有损，未指定 preprocess_image 时使用 DREAMAI_IMAGE_PREPROCESS（默认关闭）
+            if form_data.get('binary_data_base64'):
+                with timer.phase('build'):
+                    form_data['binary_data_base64'] = [
+                        image_preprocessor.process(image, form_data.get('width'), form_data.get('height'),
+                                                   enabled=tool_parameters.get('preprocess_image'))
+                        for image in form_data['binary_data_base64']
+                    ]
+            
             seed = tool_parameters.get('seed', -1)
+            return_url = form_data['return_url']
+            
+            # 显式指定seed时生成结果是确定的，优先读取结果缓存
+            cache_key = None
             if seed != -1:
-                form_data['seed'] = int(seed)
-            
-            # 编辑强度
-            scale = tool_parameters.get('scale', 0.5)
-            form_data['scale'] = float(scale)
-            
-            # 宽高参数（需同时设置才生效）
-            width = tool_parameters.get('width')
-            height = tool_parameters.get('height')
-            if width is not None and height is not None:
-                form_data['width'] = int(width)
-                form_data['height'] = int(height)
-            
-            use_pre_llm = tool_parameters.get('use_pre_llm', True)
-            form_data['use_pre_llm'] = bool(use_pre_llm)
-            
-            use_sr = tool_parameters.get('use_sr', True)
-            form_data['use_sr'] = bool(use_sr)
-            
-            return_url = tool_parameters.get('return_url', True)
-            form_data['return_url'] = bool(return_url)
-            
-            # 处理水印参数
-            add_logo = tool_parameters.get('add_logo', False)
-            position = tool_parameters.get('position', 0)
-            language = tool_parameters.get('language', 0)
-            opacity = tool_parameters.get('opacity', 1.0)
-            logo_text_content = tool_parameters.get('logo_text_content', '')
-            
-            # 构建req_json参数（用于查询任务时传递）
-            req_json_data = {
-                "return_url": return_url
-            }
-            
-            if add_logo:
-                req_json_data["logo_info"] = {
-                    "add_logo": add_logo,
-                    "position": int(position),
-                    "language": int(language),
-                    "opacity": float(opacity)
-                }
-                if logo_text_content:
-                    req_json_data["logo_info"]["logo_text_content"] = logo_text_content
-            
-            req_json = json.dumps(req_json_data)
-            
-            # 初始化VisualService
-            visual_service = VisualService()
-            visual_service.set_ak(access_key)
-            visual_service.set_sk(secret_key)
+                cache_key = request_fingerprint(form_data, req_json, namespace=credential_fingerprint(access_key, secret_key))
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    with timer.phase('delivery'):
+                        for image_url in cached.get('image_urls') or []:
+                            yield self.create_image_message(image_url=image_url)
+                        if cached.get('binary_data_base64'):
+                            images = yield from deliver_blobs(self, cached['binary_data_base64'], 'image/png', 'image')
+                            timer.add_references(images)
+                        image_count = len(cached.get('image_urls') or cached.get('binary_data_base64') or [])
+                        yield self.create_text_message(f"命中结果缓存！共{image_count}张图片")
+                        cached = {key: value for key, value in cached.items() if key != 'binary_data_base64'}
+                        if cached.get('image_urls') and tool_parameters.get('store_artifacts'):
+                            cached['artifacts'] = artifact_store.store_urls(cached['image_urls'])
+                            timer.add_references(cached['artifacts'])
+                        yield self.create_json_message({**cached, "cache_hit": True})
+                    timer.outcome = 'cache_hit'
+                    return
+            
+            # 提交前并发检查参考链接，无法访问、类型不符或过大时直接报错，不必等到服务端排队后才失败
+            with timer.phase('preflight'):
+                errors = url_preflight.check([(url, 'image') for url in form_data.get('image_urls') or []])
+            if errors:
+                yield self.create_text_message(f"Error: {'; '.join(errors)}")
+                return
             
             # 第一步：提交任务
+            priority = resolve_priority('image_to_image', tool_parameters)
             yield self.create_text_message("正在提交图生图任务...")
-            submit_response = visual_service.cv_sync2async_submit_task(form_data)
+            submitted = True
+            with timer.phase('submit'):
+                if cache_key:
+                    # 相同请求正在进行时复用其task_id，不再重复提交
+                    submit_response, submitted = single_flight.submit(
+                        cache_key,
+                        lambda: key_pool.submit(self.runtime.credentials, form_data, priority=priority),
+                        ttl=get_policy(req_key).timeout,
+                    )
+                else:
+                    submit_response = key_pool.submit(self.runtime.credentials, form_data, priority=priority)
+            if not submitted:
+                yield self.create_text_message("检测到相同的请求正在执行，复用其任务结果")
             
             # 检查响应是否有错误
             if 'code' in submit_response and submit_response.get('code') != 10000:
@@ -114,60 +131,97 @@ class ImageToImageTool(Tool):
             if not task_id:
                 yield self.create_text_message("提交任务失败: 未获取到task_id")
                 return
+            timer.submitted()
+            
+            # 任务固定在创建它的凭证上，提交与轮询均在后台事件循环上执行
+            async_client = key_pool.client_for_task(self.runtime.credentials, task_id)
+            
+            # 记录任务，轮询超时或插件重启后仍可继续跟踪
+            task_journal.record_submit(async_client.fingerprint, task_id, req_key, req_json)
             
             yield self.create_text_message(f"任务已提交，task_id: {task_id}，开始轮询结果...")
             
             # 第二步：轮询任务结果
-            max_attempts = 60  # 最多轮询5分钟
-            attempt = 0
+            # 根据任务状态与历史耗时动态调整查询间隔
+            schedule = PollSchedule(req_key, timeout=deadline.poll_timeout(req_key))
+            
+            if deadline.exceeded_by(schedule) is not None:
+                handle = task_reconciler.detach(async_client, req_key, task_id, req_json, schedule)
+                yield self.create_text_message(f"任务预计需要约{int(handle['eta_seconds'])}秒，超出本次调用的时间预算，已转入后台跟踪，请稍后使用 cv_get_result 查询结果")
+                yield self.create_json_message(handle)
+                timer.outcome = 'detached'
+                return
             
-            while attempt < max_attempts:
-                time.sleep(5)  # 等待5秒
-                attempt += 1
-                
-                # 查询任务结果
-                query_params = {"task_id": task_id, "req_key": req_key}
-                if req_json:
-                    query_params["req_json"] = req_json
-                result_response = visual_service.cv_sync2async_get_result(query_params)
-                
+            progress = ProgressReporter(schedule)
+            for attempt, result_response in iter_task_results(async_client, req_key, task_id, req_json, schedule=schedule):
                 # 检查响应是否有错误
                 if 'code' in result_response and result_response.get('code') != 10000:
+                    single_flight.release(cache_key)
                     yield self.create_text_message(f"查询任务失败: {result_response.get('message', 'Unknown error')}")
                     return
                 
                 data = result_response.get('data', {})
                 status = data.get('status')
+                timer.observe_status(status)
                 
-                if status == 'in_queue':
-                    yield self.create_text_message(f"任务排队中... (第{attempt}次查询)")
-                    continue
-                elif status == 'generating':
-                    yield self.create_text_message(f"任务生成中... (第{attempt}次查询)")
+                # 剩余预算不足以等到预计完成时间时停止等待
+                if status in ['in_queue', 'generating'] and deadline.exceeded_by(schedule) is not None:
+                    break
+                
+                if status in ['in_queue', 'generating']:
+                    # 进度消息只在状态变化或超过最小间隔时输出
+                    message = progress.update(status, attempt)
+                    if message:
+                        yield self.create_text_message(message)
                     continue
                 elif status == 'done':
                     # 任务完成，处理结果
-                    if return_url and data.get('image_urls'):
-                        image_urls = data['image_urls']
-                        for i, image_url in enumerate(image_urls):
-                            yield self.create_image_message(image_url=image_url)
-                        yield self.create_text_message(f"图片生成成功！共生成{len(image_urls)}张图片")
-                    elif data.get('binary_data_base64'):
-                        binary_data_list = data['binary_data_base64']
-                        for i, binary_data in enumerate(binary_data_list):
-                            yield self.create_blob_message(blob=binary_data, meta={'mime_type': 'image/png'})
-                        yield self.create_text_message(f"图片生成成功！共生成{len(binary_data_list)}张图片")
-                    else:
-                        yield self.create_text_message("任务完成，但未找到图片数据")
+                    with timer.phase('delivery'):
+                        if return_url and data.get('image_urls'):
+                            image_urls = data['image_urls']
+                            if cache_key:
+                                result_cache.put(cache_key, {"task_id": task_id, "req_key": req_key, "image_urls": image_urls})
+                            for i, image_url in enumerate(image_urls):
+                                yield self.create_image_message(image_url=image_url)
+                            yield self.create_text_message(f"图片生成成功！共生成{len(image_urls)}张图片")
+                            if tool_parameters.get('store_artifacts'):
+                                # 下载到本地内容寻址存储，链接失效后仍可读取
+                                artifacts = artifact_store.store_urls(image_urls)
+                                timer.add_references(artifacts)
+                                yield self.create_json_message({
+                                    "task_id": task_id,
+                                    "req_key": req_key,
+                                    "image_urls": image_urls,
+                                    "artifacts": artifacts,
+                                })
+                            timer.outcome = 'success'
+                        elif data.get('binary_data_base64'):
+                            binary_data_list = data['binary_data_base64']
+                            if cache_key:
+                                result_cache.put(cache_key, {"task_id": task_id, "req_key": req_key, "binary_data_base64": binary_data_list})
+                            images = yield from deliver_blobs(self, binary_data_list, 'image/png', 'image')
+                            timer.add_references(images)
+                            yield self.create_text_message(f"图片生成成功！共生成{len(binary_data_list)}张图片")
+                            timer.outcome = 'success'
+                        else:
+                            yield self.create_text_message("任务完成，但未找到图片数据")
                     return
                 elif status in ['not_found', 'expired']:
+                    single_flight.release(cache_key)
                     yield self.create_text_message(f"任务状态异常: {status}，停止查询")
                     return
                 else:
                     yield self.create_text_message(f"未知任务状态: {status}")
                     continue
             
-            yield self.create_text_message("任务轮询超时，请稍后手动查询结果")
+            # 超出时间预算或轮询超时后由后台继续跟踪，结果写入任务日志
+            handle = task_reconciler.detach(async_client, req_key, task_id, req_json, schedule)
+            yield self.create_text_message("任务未能在本次调用内完成，已转入后台继续跟踪，请稍后使用 cv_get_result 查询结果")
+            yield self.create_json_message(handle)
+            timer.outcome = 'detached'
                 
         except Exception as e:
-            yield self.create_text_message(f"Error: {str(e)}")
\ No newline at end of file
+            timer.outcome = 'error'
+            yield self.create_text_message(f"Error: {str(e)}")
+        finally:
+            timer.finish()
\ No newline at end of file
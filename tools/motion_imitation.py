@@ -1,15 +1,28 @@
 import json
-import time
 from collections.abc import Generator
 from typing import Any
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from volcengine.visual.VisualService import VisualService
+
+from utils.credential_check import credential_validator
+from utils.delivery import deliver_blobs
+from utils.key_pool import key_pool, parse_api_keys
+from utils.metrics import InvocationTimer
+from utils.polling import Deadline, PollSchedule
+from utils.progress import ProgressReporter
+from utils.reconciler import task_reconciler
+from utils.request_builders import build_motion_imitation_request
+from utils.submit_queue import resolve_priority
+from utils.task_journal import task_journal
+from utils.task_poller import iter_task_results
+from utils.url_preflight import url_preflight
 
 
 class MotionImitationTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # 记录各阶段耗时，调用结束时汇总到进程级指标
+        timer = InvocationTimer('motion_imitation')
         try:
             # 获取凭证
             access_key = self.runtime.credentials.get('volcengine_access_key')
@@ -19,142 +32,120 @@ class MotionImitationTool(Tool):
                 yield self.create_text_message("Error: VolcEngine credentials not found")
                 return
             
-            # 获取必需参数
-            source_image = tool_parameters.get('source_image')
-            if not source_image:
-                yield self.create_text_message("Error: source_image is required")
-                return
-            
-            motion_video = tool_parameters.get('motion_video')
-            if not motion_video:
-                yield self.create_text_message("Error: motion_video is required")
+            # 凭证已被验证为无效时直接报错，不再构建参数并发送必然失败的请求
+            credential_error = credential_validator.cached_error(access_key, secret_key)
+            if credential_error:
+                yield self.create_text_message(f"Error: {credential_error}")
                 return
             
-            # 构建请求数据
-            form_data = {
-                'req_key': 'jimeng_motion_imitation_L',  # 动作模仿
-                'source_image': source_image,
-                'motion_video': motion_video
-            }
-            
-            # 添加可选参数
-            seed = tool_parameters.get('seed', -1)
-            if seed != -1:
-                form_data['seed'] = int(seed)
-            
-            # 视频时长（秒）
-            duration = tool_parameters.get('duration', 4)
-            form_data['duration'] = int(duration)
-            
-            # 帧率
-            fps = tool_parameters.get('fps', 24)
-            form_data['fps'] = int(fps)
+            # 本次调用的时间预算，预计无法按时完成的任务提前返回任务句柄
+            deadline = Deadline(tool_parameters.get('deadline_seconds'))
             
-            # 宽高比
-            aspect_ratio = tool_parameters.get('aspect_ratio', '16:9')
-            form_data['aspect_ratio'] = aspect_ratio
+            # 凭证池：主凭证与 provider 中配置的额外凭证
+            api_keys = parse_api_keys(self.runtime.credentials)
             
-            # 动作强度
-            motion_strength = tool_parameters.get('motion_strength', 0.8)
-            form_data['motion_strength'] = float(motion_strength)
+            # 恢复各凭证在插件重启前未完成的任务
+            for api_key in api_keys:
+                task_reconciler.reconcile(api_key.access_key, api_key.secret_key)
             
-            # 面部保真度
-            face_fidelity = tool_parameters.get('face_fidelity', 0.8)
-            form_data['face_fidelity'] = float(face_fidelity)
-            
-            # 身体保真度
-            body_fidelity = tool_parameters.get('body_fidelity', 0.8)
-            form_data['body_fidelity'] = float(body_fidelity)
-            
-            # 背景保持
-            preserve_background = tool_parameters.get('preserve_background', True)
-            form_data['preserve_background'] = bool(preserve_background)
-            
-            # 平滑度
-            smoothness = tool_parameters.get('smoothness', 0.5)
-            form_data['smoothness'] = float(smoothness)
-            
-            return_url = tool_parameters.get('return_url', True)
-            form_data['return_url'] = bool(return_url)
-            
-            # 初始化VisualService
-            visual_service = VisualService()
-            visual_service.set_ak(access_key)
-            visual_service.set_sk(secret_key)
+            # 构建请求数据
+            try:
+                with timer.phase('build'):
+                    req_key, form_data, _ = build_motion_imitation_request(tool_parameters)
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+            timer.req_key = req_key
+            return_url = form_data['return_url']
+            
+            # 提交前并发检查参考链接，无法访问、类型不符或过大时直接报错，不必等到服务端排队后才失败
+            with timer.phase('preflight'):
+                errors = url_preflight.check([(form_data['source_image'], 'image'), (form_data['motion_video'], 'video')])
+            if errors:
+                yield self.create_text_message(f"Error: {'; '.join(errors)}")
+                return
             
             # 第一步：提交任务
             yield self.create_text_message("正在提交动作模仿任务...")
             submit_data = {
                 'req_key': 'cv_submit_task',
-                'task_type': 'jimeng_motion_imitation_L',
+                'task_type': req_key,
                 'request_body': json.dumps(form_data)
             }
             
-            submit_resp = visual_service.cv_process(submit_data)
+            # 按优先级排队等待提交名额，由凭证池选择凭证，被限流时切换到下一组
+            with timer.phase('submit'):
+                submit_resp = key_pool.submit(self.runtime.credentials, submit_data,
+                                              priority=resolve_priority('motion_imitation', tool_parameters),
+                                              api='CVProcess')
             
-            if submit_resp['ResponseMetadata']['Error']:
-                error_msg = submit_resp['ResponseMetadata']['Error']
+            # CVProcess 直接返回 {code, message, data}；网关错误（如鉴权失败）只有 ResponseMetadata.Error
+            if submit_resp.get('code') != 10000:
+                error_msg = submit_resp.get('message') or (submit_resp.get('ResponseMetadata') or {}).get('Error') or 'Unknown error'
                 yield self.create_text_message(f"提交任务失败: {error_msg}")
                 return
             
-            submit_result = submit_resp['Result']
-            if submit_result.get('code') != 10000:
-                error_msg = submit_result.get('message', 'Unknown error')
-                yield self.create_text_message(f"提交任务失败: {error_msg}")
-                return
-            
-            task_id = submit_result.get('data', {}).get('task_id')
+            task_id = (submit_resp.get('data') or {}).get('task_id')
             if not task_id:
                 yield self.create_text_message("提交任务失败: 未获取到task_id")
                 return
+            timer.submitted()
             
-            yield self.create_text_message(f"任务已提交，task_id: {task_id}，开始轮询结果...")
+            # 任务固定在创建它的凭证上，轮询时路由回同一账号
+            async_client = key_pool.client_for_task(self.runtime.credentials, task_id)
+            
+            # 记录任务，超出时间预算或插件重启后仍可继续跟踪，也可通过 cv_get_result 查询
+            task_journal.record_submit(async_client.fingerprint, task_id, req_key)
             
             # 第二步：轮询任务结果
-            max_attempts = 120  # 视频生成时间较长，最多轮询10分钟
-            attempt = 0
+            # 根据任务状态与历史耗时动态调整查询间隔
+            schedule = PollSchedule(req_key, timeout=deadline.poll_timeout(req_key))
+            
+            if deadline.exceeded_by(schedule) is not None:
+                handle = task_reconciler.detach(async_client, req_key, task_id, schedule=schedule)
+                yield self.create_text_message(f"任务预计需要约{int(handle['eta_seconds'])}秒，超出本次调用的时间预算，已转入后台跟踪，请稍后使用 cv_get_result 查询结果")
+                yield self.create_json_message(handle)
+                timer.outcome = 'detached'
+                return
             
-            while attempt < max_attempts:
-                time.sleep(5)  # 等待5秒
-                attempt += 1
-                
-                # 查询任务结果
-                query_data = {
-                    'req_key': 'cv_get_result',
-                    'task_id': task_id
-                }
-                
-                result_resp = visual_service.cv_process(query_data)
-                
-                if result_resp['ResponseMetadata']['Error']:
-                    yield self.create_text_message(f"查询任务失败: {result_resp['ResponseMetadata']['Error']}")
-                    return
-                
-                result_data = result_resp['Result']
-                if result_data.get('code') != 10000:
-                    yield self.create_text_message(f"查询任务失败: {result_data.get('message', 'Unknown error')}")
+            yield self.create_text_message(f"任务已提交，task_id: {task_id}，开始轮询结果...")
+            
+            progress = ProgressReporter(schedule)
+            # 由共享轮询器在后台事件循环上轮询，状态变化与完成耗时写入任务日志
+            for attempt, result_resp in iter_task_results(async_client, req_key, task_id, schedule=schedule):
+                if result_resp.get('code') != 10000:
+                    yield self.create_text_message(f"查询任务失败: {result_resp.get('message', 'Unknown error')}")
                     return
                 
-                data = result_data.get('data', {})
+                data = result_resp.get('data') or {}
                 status = data.get('status')
+                timer.observe_status(status)
                 
-                if status == 'in_queue':
-                    yield self.create_text_message(f"任务排队中... (第{attempt}次查询)")
-                    continue
-                elif status == 'generating':
-                    yield self.create_text_message(f"任务生成中... (第{attempt}次查询)")
+                # 剩余预算不足以等到预计完成时间时停止等待
+                if status in ['in_queue', 'generating'] and deadline.exceeded_by(schedule) is not None:
+                    break
+                
+                if status in ['in_queue', 'generating']:
+                    # 进度消息只在状态变化或超过最小间隔时输出
+                    message = progress.update(status, attempt)
+                    if message:
+                        yield self.create_text_message(message)
                     continue
                 elif status == 'done':
                     # 任务完成，处理结果
-                    if return_url and 'video_url' in data:
-                        video_url = data['video_url']
-                        yield self.create_text_message(f"动作模仿视频生成成功!\nVideo URL: {video_url}")
-                    elif 'binary_data_base64' in data:
-                        binary_data = data['binary_data_base64']
-                        yield self.create_blob_message(blob=binary_data, meta={'mime_type': 'video/mp4'})
-                        yield self.create_text_message("动作模仿视频生成成功!")
-                    else:
-                        yield self.create_text_message("任务完成，但未找到视频数据")
+                    with timer.phase('delivery'):
+                        if return_url and 'video_url' in data:
+                            video_url = data['video_url']
+                            yield self.create_text_message(f"动作模仿视频生成成功!\nVideo URL: {video_url}")
+                            timer.outcome = 'success'
+                        elif 'binary_data_base64' in data:
+                            # base64 解码为字节后以 blob 消息输出
+                            videos = yield from deliver_blobs(self, data['binary_data_base64'], 'video/mp4', 'video')
+                            timer.add_references(videos)
+                            yield self.create_text_message("动作模仿视频生成成功!")
+                            timer.outcome = 'success'
+                        else:
+                            yield self.create_text_message("任务完成，但未找到视频数据")
                     return
                 elif status in ['not_found', 'expired']:
                     yield self.create_text_message(f"任务状态异常: {status}，停止查询")
@@ -163,7 +154,14 @@ class MotionImitationTool(Tool):
                     yield self.create_text_message(f"未知任务状态: {status}")
                     continue
             
-            yield self.create_text_message("任务轮询超时，请稍后手动查询结果")
+            # 超出时间预算或轮询超时后由后台继续跟踪，结果写入任务日志
+            handle = task_reconciler.detach(async_client, req_key, task_id, schedule=schedule)
+            yield self.create_text_message("任务未能在本次调用内完成，已转入后台继续跟踪，请稍后使用 cv_get_result 查询结果")
+            yield self.create_json_message(handle)
+            timer.outcome = 'detached'
                 
         except Exception as e:
-            yield self.create_text_message(f"Error: {str(e)}")
\ No newline at end of file
+            timer.outcome = 'error'
+            yield self.create_text_message(f"Error: {str(e)}")
+        finally:
+            timer.finish()
\ No newline at end of file
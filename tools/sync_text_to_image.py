@@ -1,14 +1,21 @@
-import json
 from collections.abc import Generator
 from typing import Any
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from volcengine.visual.VisualService import VisualService
+
+from utils.client_pool import credential_fingerprint, get_visual_service
+from utils.credential_check import credential_validator
+from utils.delivery import deliver_blobs
+from utils.metrics import InvocationTimer
+from utils.request_builders import build_sync_text_to_image_request
+from utils.result_cache import request_fingerprint, result_cache
 
 
 class SyncTextToImageTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # 记录各阶段耗时，调用结束时汇总到进程级指标
+        timer = InvocationTimer('sync_text_to_image')
         try:
             # 获取凭证
             access_key = self.runtime.credentials.get('volcengine_access_key')
@@ -18,81 +25,50 @@ class SyncTextToImageTool(Tool):
                 yield self.create_text_message("Error: VolcEngine credentials not found")
                 return
             
-            # 获取必需参数
-            prompt = tool_parameters.get('prompt')
-            if not prompt:
-                yield self.create_text_message("Error: prompt is required")
+            # 凭证已被验证为无效时直接报错，不再构建参数并发送必然失败的请求
+            credential_error = credential_validator.cached_error(access_key, secret_key)
+            if credential_error:
+                yield self.create_text_message(f"Error: {credential_error}")
                 return
             
-            # 构建请求数据
-            form_data = {
-                'req_key': 'jimeng_high_aes_general_v21_L',  # 固定值：即梦AI-文生图2.1
-                'prompt': prompt
-            }
-            
-            # 添加可选参数
+            # 构建请求数据：即梦AI-文生图2.1，水印与AIGC元数据直接写入提交参数
+            try:
+                with timer.phase('build'):
+                    req_key, form_data, _ = build_sync_text_to_image_request(tool_parameters)
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+            timer.req_key = req_key
+            prompt = form_data['prompt']
             seed = tool_parameters.get('seed', -1)
-            if seed != -1:
-                form_data['seed'] = int(seed)
-            
-            width = tool_parameters.get('width', 512)
-            height = tool_parameters.get('height', 512)
-            form_data['width'] = int(width)
-            form_data['height'] = int(height)
-            
-            use_pre_llm = tool_parameters.get('use_pre_llm', True)
-            form_data['use_pre_llm'] = bool(use_pre_llm)
+            width, height = form_data['width'], form_data['height']
+            use_pre_llm, use_sr = form_data['use_pre_llm'], form_data['use_sr']
+            return_url = form_data['return_url']
             
-            use_sr = tool_parameters.get('use_sr', True)
-            form_data['use_sr'] = bool(use_sr)
-            
-            return_url = tool_parameters.get('return_url', True)
-            form_data['return_url'] = bool(return_url)
-            
-            # 处理水印参数
-            add_logo = tool_parameters.get('add_logo', False)
-            if add_logo:
-                logo_info = {
-                    'add_logo': True,
-                    'position': int(tool_parameters.get('logo_position', 0)),
-                    'language': int(tool_parameters.get('logo_language', 0)),
-                    'opacity': float(tool_parameters.get('logo_opacity', 1.0))
-                }
-                logo_text_content = tool_parameters.get('logo_text_content')
-                if logo_text_content:
-                    logo_info['logo_text_content'] = logo_text_content
-                form_data['logo_info'] = logo_info
-            
-            # 处理AIGC元数据参数
-            add_aigc_meta = tool_parameters.get('add_aigc_meta', False)
-            
-            if add_aigc_meta:
-                aigc_meta = {}
-                content_producer = tool_parameters.get('content_producer')
-                if content_producer:
-                    aigc_meta['content_producer'] = content_producer
-                producer_id = tool_parameters.get('producer_id')
-                if producer_id:
-                    aigc_meta['producer_id'] = producer_id
-                content_propagator = tool_parameters.get('content_propagator')
-                if content_propagator:
-                    aigc_meta['content_propagator'] = content_propagator
-                propagate_id = tool_parameters.get('propagate_id')
-                if propagate_id:
-                    aigc_meta['propagate_id'] = propagate_id
-                
-                if aigc_meta:
-                    form_data['aigc_meta'] = json.dumps(aigc_meta)
-            
-            # 创建VisualService实例
-            visual_service = VisualService()
-            visual_service.set_ak(access_key)
-            visual_service.set_sk(secret_key)
+            # 显式指定seed时生成结果是确定的，优先读取结果缓存
+            cache_key = None
+            if seed != -1:
+                cache_key = request_fingerprint(form_data, namespace=credential_fingerprint(access_key, secret_key))
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    yield self.create_text_message("✅ Image served from result cache")
+                    cached = dict(cached)
+                    with timer.phase('delivery'):
+                        if cached.get('image_base64'):
+                            cached['images'] = yield from deliver_blobs(self, cached.pop('image_base64'), 'image/png', 'image')
+                            timer.add_references(cached['images'])
+                        yield self.create_json_message({**cached, "cache_hit": True})
+                    timer.outcome = 'cache_hit'
+                    return
+            
+            # 从客户端池获取VisualService
+            visual_service = get_visual_service(access_key, secret_key)
             
             yield self.create_text_message(f"Generating image with prompt: {prompt[:50]}{'...' if len(prompt) > 50 else ''}")
             
-            # 调用cv_process API
-            response = visual_service.cv_process(form_data)
+            # 调用cv_process API，同步接口的请求耗时即生成耗时
+            with timer.phase('generation'):
+                response = visual_service.cv_process(form_data)
             
             # 解析响应结果
             result_data = {
@@ -107,7 +83,8 @@ class SyncTextToImageTool(Tool):
                     "use_sr": use_sr,
                     "return_url": return_url
                 },
-                "raw_response": response
+                "raw_response": response,
+                "cache_hit": False
             }
             
             # 提取关键字段
@@ -118,8 +95,13 @@ class SyncTextToImageTool(Tool):
                         data = response['data']
                         # 提取base64图片数据
                         if 'binary_data_base64' in data:
-                            result_data['image_base64'] = data['binary_data_base64']
+                            # 从原始响应中取出，raw_response 不再携带 base64 数据
+                            image_base64 = data.pop('binary_data_base64')
                             yield self.create_text_message("✅ Image generated successfully with base64 data")
+                            # 图片以 blob 消息输出，JSON 中只保留引用
+                            with timer.phase('delivery'):
+                                result_data['images'] = yield from deliver_blobs(self, image_base64, 'image/png', 'image')
+                            timer.add_references(result_data['images'])
                         
                         # 提取图片URL
                         if 'image_urls' in data and data['image_urls']:
@@ -131,6 +113,13 @@ class SyncTextToImageTool(Tool):
                             result_data['task_id'] = data['task_id']
                         if 'req_id' in data:
                             result_data['req_id'] = data['req_id']
+                    
+                    if cache_key:
+                        cache_entry = {key: value for key, value in result_data.items() if key != 'images'}
+                        if 'images' in result_data:
+                            cache_entry['image_base64'] = image_base64
+                        result_cache.put(cache_key, cache_entry)
+                    timer.outcome = 'success'
                 else:
                     result_data['success'] = False
                     result_data['error_code'] = response.get('code', 'unknown')
@@ -141,4 +130,7 @@ class SyncTextToImageTool(Tool):
             yield self.create_json_message(result_data)
             
         except Exception as e:
-            yield self.create_text_message(f"Error: {str(e)}")
\ No newline at end of file
+            timer.outcome = 'error'
+            yield self.create_text_message(f"Error: {str(e)}")
+        finally:
+            timer.finish()
\ No newline at end of file
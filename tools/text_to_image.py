@@ -1,15 +1,34 @@
-import json
-import time
+import logging
 from collections.abc import Generator
 from typing import Any
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from volcengine.visual.VisualService import VisualService
+
+from utils.artifact_store import artifact_store
+from utils.client_pool import credential_fingerprint
+from utils.credential_check import credential_validator
+from utils.delivery import deliver_blobs
+from utils.hedging import task_hedger
+from utils.key_pool import key_pool, parse_api_keys
+from utils.metrics import InvocationTimer
+from utils.polling import Deadline, PollSchedule, get_policy
+from utils.progress import ProgressReporter
+from utils.reconciler import task_reconciler
+from utils.request_builders import build_text_to_image_request
+from utils.result_cache import request_fingerprint, result_cache
+from utils.single_flight import single_flight
+from utils.submit_queue import resolve_priority
+from utils.task_journal import task_journal
+from utils.url_preflight import url_preflight
+
+logger = logging.getLogger(__name__)
 
 
 class TextToImageTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # 记录各阶段耗时，调用结束时汇总到进程级指标
+        timer = InvocationTimer('text_to_image')
         try:
             # 获取凭证
             access_key = self.runtime.credentials.get('volcengine_access_key')
@@ -19,144 +38,79 @@ class TextToImageTool(Tool):
                 yield self.create_text_message("Error: VolcEngine credentials not found")
                 return
             
-            # 获取必需参数
-            prompt = tool_parameters.get('prompt')
-            if not prompt:
-                yield self.create_text_message("Error: prompt is required")
+            # 凭证已被验证为无效时直接报错，不再构建参数并发送必然失败的请求
+            credential_error = credential_validator.cached_error(access_key, secret_key)
+            if credential_error:
+                yield self.create_text_message(f"Error: {credential_error}")
                 return
             
-            # 获取模型版本，默认使用3.1
-            model_version = tool_parameters.get('model_version', '3.1')
+            # 本次调用的时间预算，预计无法按时完成的任务提前返回任务句柄
+            deadline = Deadline(tool_parameters.get('deadline_seconds'))
+            
+            # 凭证池：主凭证与 provider 中配置的额外凭证
+            api_keys = parse_api_keys(self.runtime.credentials)
             
-            # 根据模型版本设置req_key
-            if model_version == '3.0':
-                req_key = 'jimeng_t2i_v30'  # 即梦文生图3.0
-            elif model_version == 'doubao_3.0':
-                # 豆包3.0模型使用固定的req_key
-                req_key = 'high_aes_general_v30l_zt2i'
-            elif model_version == '4.0':
-                req_key = 'jimeng_t2i_v40'  # 即梦文生图4.0
-            else:
-                req_key = 'jimeng_t2i_v31'  # 即梦文生图3.1
+            # 恢复各凭证在插件重启前未完成的任务
+            for api_key in api_keys:
+                task_reconciler.reconcile(api_key.access_key, api_key.secret_key)
             
             # 构建请求数据
-            form_data = {
-                'req_key': req_key,
-                'prompt': prompt
-            }
+            try:
+                with timer.phase('build'):
+                    req_key, form_data, req_json = build_text_to_image_request(tool_parameters)
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+            timer.req_key = req_key
             
-            # 添加可选参数
             seed = tool_parameters.get('seed', -1)
+            return_url = form_data['return_url']
+            
+            # 显式指定seed时生成结果是确定的，优先读取结果缓存
+            cache_key = None
             if seed != -1:
-                form_data['seed'] = int(seed)
-            
-            # 处理图片链接参数（4.0版本支持）
-            image_urls_str = tool_parameters.get('image_urls')
-            if image_urls_str and model_version == '4.0':
-                # 将换行分割的字符串转换为数组
-                image_urls = [url.strip() for url in image_urls_str.split('\n') if url.strip()]
-                if image_urls:
-                    form_data['image_urls'] = image_urls
-            
-            # 处理尺寸参数
-            if model_version == '4.0':
-                # 4.0版本支持size参数
-                size = tool_parameters.get('size')
-                if size:
-                    form_data['size'] = int(size)
-                
-                # 4.0版本的宽高参数需要同时传入或都不传
-                width = tool_parameters.get('width')
-                height = tool_parameters.get('height')
-                if width is not None and height is not None:
-                    form_data['width'] = int(width)
-                    form_data['height'] = int(height)
-                elif width is not None or height is not None:
-                    yield self.create_text_message("Error: For 4.0 model, width and height must be specified together or not at all")
+                cache_key = request_fingerprint(form_data, req_json, namespace=credential_fingerprint(access_key, secret_key))
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    image_count = len(cached.get('image_urls') or cached.get('binary_data_base64') or [])
+                    yield self.create_text_message(f"命中结果缓存！共{image_count}张图片")
+                    cached = dict(cached)
+                    with timer.phase('delivery'):
+                        if cached.get('image_urls') and tool_parameters.get('store_artifacts'):
+                            cached['artifacts'] = artifact_store.store_urls(cached['image_urls'])
+                            timer.add_references(cached['artifacts'])
+                        if cached.get('binary_data_base64'):
+                            # 图片以 blob 消息输出，JSON 中只保留引用
+                            cached['images'] = yield from deliver_blobs(self, cached.pop('binary_data_base64'), 'image/png', 'image')
+                            timer.add_references(cached['images'])
+                        yield self.create_json_message({**cached, "cache_hit": True})
+                    timer.outcome = 'cache_hit'
                     return
-            else:
-                # 其他版本使用传统的宽高参数
-                width = tool_parameters.get('width', 1024)
-                height = tool_parameters.get('height', 1024)
-                form_data['width'] = int(width)
-                form_data['height'] = int(height)
-            
-            use_pre_llm = tool_parameters.get('use_pre_llm', True)
-            form_data['use_pre_llm'] = bool(use_pre_llm)
-            
-            use_sr = tool_parameters.get('use_sr', True)
-            form_data['use_sr'] = bool(use_sr)
-            
-            return_url = tool_parameters.get('return_url', True)
-            form_data['return_url'] = bool(return_url)
-            
-            # scale参数处理（支持豆包3.0和4.0）
-            if model_version in ['doubao_3.0', '4.0'] and 'scale' in tool_parameters:
-                scale_value = float(tool_parameters['scale'])
-                # 根据模型版本验证范围
-                if model_version == 'doubao_3.0':
-                    if scale_value < 1.0 or scale_value > 10.0:
-                        yield self.create_text_message("Error: Scale value for Doubao 3.0 must be between 1.0 and 10.0")
-                        return
-                elif model_version == '4.0':
-                    if scale_value < 0.0 or scale_value > 1.0:
-                        yield self.create_text_message("Error: Scale value for DreamAI 4.0 must be between 0.0 and 1.0")
-                        return
-                form_data['scale'] = scale_value
-            elif model_version == 'doubao_3.0':
-                form_data['scale'] = 2.5  # 默认值
-            elif model_version == '4.0':
-                form_data['scale'] = 0.5  # 默认值
-            
-            # 4.0版本特有参数
-            if model_version == '4.0':
-                # 强制生成单图参数
-                force_single = tool_parameters.get('force_single', False)
-                form_data['force_single'] = bool(force_single)
-                
-                # 宽高比范围参数
-                min_ratio = tool_parameters.get('min_ratio')
-                if min_ratio is not None:
-                    form_data['min_ratio'] = float(min_ratio)
-                
-                max_ratio = tool_parameters.get('max_ratio')
-                if max_ratio is not None:
-                    form_data['max_ratio'] = float(max_ratio)
-            
-            # 处理水印参数
-            add_logo = tool_parameters.get('add_logo', False)
-            position = tool_parameters.get('position', 0)
-            language = tool_parameters.get('language', 0)
-            opacity = tool_parameters.get('opacity', 1.0)
-            logo_text_content = tool_parameters.get('logo_text_content', '')
-            
-            # 构建req_json参数（用于查询任务时传递）
-            req_json_data = {
-                "return_url": return_url
-            }
-            
-            if add_logo:
-                req_json_data["logo_info"] = {
-                    "add_logo": add_logo,
-                    "position": int(position),
-                    "language": int(language),
-                    "opacity": float(opacity)
-                }
-                if logo_text_content:
-                    req_json_data["logo_info"]["logo_text_content"] = logo_text_content
-            
-            req_json = json.dumps(req_json_data)
-            
-            # 初始化VisualService
-            visual_service = VisualService()
-            visual_service.set_ak(access_key)
-            visual_service.set_sk(secret_key)
+            
+            # 提交前并发检查参考链接，无法访问、类型不符或过大时直接报错，不必等到服务端排队后才失败
+            with timer.phase('preflight'):
+                errors = url_preflight.check([(url, 'image') for url in form_data.get('image_urls') or []])
+            if errors:
+                yield self.create_text_message(f"Error: {'; '.join(errors)}")
+                return
             
             # 第一步：提交任务
+            priority = resolve_priority('text_to_image', tool_parameters)
             yield self.create_text_message("正在提交文生图任务...")
-            # 打印提交请求参数
-            print(f"提交请求参数: {form_data}")
-            submit_resp = visual_service.cv_sync2async_submit_task(form_data)
+            logger.debug("提交请求参数: %s", form_data)
+            submitted = True
+            with timer.phase('submit'):
+                if cache_key:
+                    # 相同请求正在进行时复用其task_id，不再重复提交
+                    submit_resp, submitted = single_flight.submit(
+                        cache_key,
+                        lambda: key_pool.submit(self.runtime.credentials, form_data, priority=priority),
+                        ttl=get_policy(req_key).timeout,
+                    )
+                else:
+                    submit_resp = key_pool.submit(self.runtime.credentials, form_data, priority=priority)
+            if not submitted:
+                yield self.create_text_message("检测到相同的请求正在执行，复用其任务结果")
             
             # 检查响应是否有错误
             if 'code' in submit_resp and submit_resp.get('code') != 10000:
@@ -176,70 +130,117 @@ class TextToImageTool(Tool):
             if not task_id:
                 yield self.create_text_message("提交任务失败: 未获取到task_id")
                 return
+            timer.submitted()
+            
+            # 任务固定在创建它的凭证上，提交与轮询均在后台事件循环上执行
+            async_client = key_pool.client_for_task(self.runtime.credentials, task_id)
+            
+            # 记录任务，轮询超时或插件重启后仍可继续跟踪
+            task_journal.record_submit(async_client.fingerprint, task_id, req_key, req_json)
             
             yield self.create_text_message(f"任务已提交，task_id: {task_id}，开始轮询结果...")
             
             # 第二步：轮询任务结果
-            max_attempts = 60  # 最多轮询5分钟
-            attempt = 0
+            # 根据任务状态与历史耗时动态调整查询间隔
+            schedule = PollSchedule(req_key, timeout=deadline.poll_timeout(req_key))
+            
+            if deadline.exceeded_by(schedule) is not None:
+                handle = task_reconciler.detach(async_client, req_key, task_id, req_json, schedule)
+                yield self.create_text_message(f"任务预计需要约{int(handle['eta_seconds'])}秒，超出本次调用的时间预算，已转入后台跟踪，请稍后使用 cv_get_result 查询结果")
+                yield self.create_json_message(handle)
+                timer.outcome = 'detached'
+                return
             
-            while attempt < max_attempts:
-                time.sleep(5)  # 等待5秒
-                attempt += 1
-                
-                # 查询任务结果
-                query_params = {"task_id": task_id, "req_key": req_key}
-                if req_json:
-                    query_params["req_json"] = req_json
-                result_resp = visual_service.cv_sync2async_get_result(query_params)
-                
+            progress = ProgressReporter(schedule)
+            # 开启对冲时，排队远超历史耗时的任务会再提交一次，两个任务中先完成者的结果返回
+            # 复用他人任务时不对冲，由提交该任务的调用决定
+            resubmit = None
+            if submitted:
+                resubmit = lambda: key_pool.submit(self.runtime.credentials, form_data, priority=priority)
+            results = task_hedger.race(
+                async_client, req_key, task_id, req_json, schedule, resubmit=resubmit,
+                client_for=lambda hedge_task_id: key_pool.client_for_task(self.runtime.credentials, hedge_task_id),
+            )
+            for attempt, result_resp in results:
                 # 检查响应是否有错误
                 if 'code' in result_resp and result_resp.get('code') != 10000:
                     error_msg = result_resp.get('message', 'Unknown error')
+                    single_flight.release(cache_key)
                     yield self.create_text_message(f"查询任务失败: {error_msg}")
                     return
                 
                 data = result_resp.get('data', {})
                 status = data.get('status')
+                timer.observe_status(status)
                 
-                if status == 'in_queue':
-                    yield self.create_text_message(f"任务排队中... (第{attempt}次查询)")
-                    continue
-                elif status == 'generating':
-                    yield self.create_text_message(f"任务生成中... (第{attempt}次查询)")
+                # 剩余预算不足以等到预计完成时间时停止等待
+                if status in ['in_queue', 'generating'] and deadline.exceeded_by(schedule) is not None:
+                    break
+                
+                if status in ['in_queue', 'generating']:
+                    # 进度消息只在状态变化或超过最小间隔时输出
+                    message = progress.update(status, attempt)
+                    if message:
+                        yield self.create_text_message(message)
                     continue
                 elif status == 'done':
-                     # 任务完成，处理结果
-                     if return_url and data.get('image_urls'):
-                        image_urls = data['image_urls']
-                        yield self.create_text_message(f"图片生成成功！共生成{len(image_urls)}张图片")
-                        data_resp = {
-                            "task_id": task_id,
-                            "req_key": req_key,
-                            "image_urls": image_urls,
-                        }
-                        yield self.create_json_message(data_resp)
-                     elif data.get('binary_data_base64'):
-                        binary_data_list = data['binary_data_base64']
-                        yield self.create_text_message(f"图片生成成功！共生成{len(binary_data_list)}张图片")
+                    # 任务完成，处理结果；对冲任务先完成时返回其 task_id
+                    task_id = results.task_id
+                    with timer.phase('delivery'):
+                        if return_url and data.get('image_urls'):
+                            image_urls = data['image_urls']
+                            yield self.create_text_message(f"图片生成成功！共生成{len(image_urls)}张图片")
+                            data_resp = {
+                                "task_id": task_id,
+                                "req_key": req_key,
+                                "image_urls": image_urls,
+                                "cache_hit": False,
+                            }
+                            if cache_key:
+                                result_cache.put(cache_key, data_resp)
+                            if tool_parameters.get('store_artifacts'):
+                                # 下载到本地内容寻址存储，链接失效后仍可读取
+                                data_resp = {**data_resp, "artifacts": artifact_store.store_urls(image_urls)}
+                                timer.add_references(data_resp['artifacts'])
+                            yield self.create_json_message(data_resp)
+                            timer.outcome = 'success'
+                        elif data.get('binary_data_base64'):
+                            binary_data_list = data['binary_data_base64']
+                            yield self.create_text_message(f"图片生成成功！共生成{len(binary_data_list)}张图片")
 
-                        data_resp = {
-                            "task_id": task_id,
-                            "req_key": req_key,
-                            "binary_data_base64": binary_data_list,
-                        }
-                        yield self.create_json_message(data_resp)
-                     else:
-                         yield self.create_text_message("任务完成，但未找到图片数据")
-                     return
+                            if cache_key:
+                                result_cache.put(cache_key, {"task_id": task_id, "req_key": req_key, "binary_data_base64": binary_data_list})
+
+                            # 图片逐个解码为 blob 消息输出，JSON 中只保留引用
+                            images = yield from deliver_blobs(self, binary_data_list, 'image/png', 'image')
+                            timer.add_references(images)
+                            data_resp = {
+                                "task_id": task_id,
+                                "req_key": req_key,
+                                "images": images,
+                                "cache_hit": False,
+                            }
+                            yield self.create_json_message(data_resp)
+                            timer.outcome = 'success'
+                        else:
+                            yield self.create_text_message("任务完成，但未找到图片数据")
+                    return
                 elif status in ['not_found', 'expired']:
+                    single_flight.release(cache_key)
                     yield self.create_text_message(f"任务状态异常: {status}，停止查询")
                     return
                 else:
                     yield self.create_text_message(f"未知任务状态: {status}")
                     continue
             
-            yield self.create_text_message("任务轮询超时，请稍后手动查询结果")
+            # 超出时间预算或轮询超时后由后台继续跟踪，结果写入任务日志
+            handle = task_reconciler.detach(results.client, req_key, results.task_id, req_json, schedule)
+            yield self.create_text_message("任务未能在本次调用内完成，已转入后台继续跟踪，请稍后使用 cv_get_result 查询结果")
+            yield self.create_json_message(handle)
+            timer.outcome = 'detached'
                 
         except Exception as e:
-            yield self.create_text_message(f"Error: {str(e)}")
\ No newline at end of file
+            timer.outcome = 'error'
+            yield self.create_text_message(f"Error: {str(e)}")
+        finally:
+            timer.finish()
\ No newline at end of file
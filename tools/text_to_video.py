@@ -1,15 +1,29 @@
-import json
-import time
+import logging
 from collections.abc import Generator
 from typing import Any
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from volcengine.visual.VisualService import VisualService
+
+from utils.artifact_store import artifact_store
+from utils.credential_check import credential_validator
+from utils.key_pool import key_pool, parse_api_keys
+from utils.metrics import InvocationTimer
+from utils.polling import Deadline, PollSchedule
+from utils.progress import ProgressReporter
+from utils.reconciler import task_reconciler
+from utils.request_builders import build_text_to_video_request
+from utils.submit_queue import resolve_priority
+from utils.task_journal import task_journal
+from utils.task_poller import iter_task_results
+
+logger = logging.getLogger(__name__)
 
 
 class TextToVideoTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # 记录各阶段耗时，调用结束时汇总到进程级指标
+        timer = InvocationTimer('text_to_video')
         try:
             # 获取凭证
             access_key = self.runtime.credentials.get('volcengine_access_key')
@@ -19,42 +33,37 @@ class TextToVideoTool(Tool):
                 yield self.create_text_message("Error: VolcEngine credentials not found")
                 return
             
-            # 获取必需参数
-            prompt = tool_parameters.get('prompt')
-            if not prompt:
-                yield self.create_text_message("Error: prompt is required")
+            # 凭证已被验证为无效时直接报错，不再构建参数并发送必然失败的请求
+            credential_error = credential_validator.cached_error(access_key, secret_key)
+            if credential_error:
+                yield self.create_text_message(f"Error: {credential_error}")
                 return
             
-            # 获取视频质量参数，默认使用720P
-            req_key = tool_parameters.get('req_key', 'jimeng_t2v_v30')
-            
-            # 构建请求数据
-            form_data = {
-                'req_key': req_key,
-                'prompt': prompt
-            }
-            
-            # 添加可选参数
-            seed = tool_parameters.get('seed', -1)
-            if seed != -1:
-                form_data['seed'] = int(seed)
+            # 本次调用的时间预算，预计无法按时完成的任务提前返回任务句柄
+            deadline = Deadline(tool_parameters.get('deadline_seconds'))
             
-            frames = tool_parameters.get('frames', 121)
-            form_data['frames'] = int(frames)
+            # 凭证池：主凭证与 provider 中配置的额外凭证
+            api_keys = parse_api_keys(self.runtime.credentials)
             
-            aspect_ratio = tool_parameters.get('aspect_ratio', '16:9')
-            form_data['aspect_ratio'] = str(aspect_ratio)
+            # 恢复各凭证在插件重启前未完成的任务
+            for api_key in api_keys:
+                task_reconciler.reconcile(api_key.access_key, api_key.secret_key)
             
-            # 初始化VisualService
-            visual_service = VisualService()
-            visual_service.set_ak(access_key)
-            visual_service.set_sk(secret_key)
+            # 构建请求数据，视频质量由 req_key 选择，默认使用720P
+            try:
+                with timer.phase('build'):
+                    req_key, form_data, _ = build_text_to_video_request(tool_parameters)
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+            timer.req_key = req_key
             
             # 第一步：提交任务
             yield self.create_text_message("正在提交文生视频任务...")
-            # 打印提交请求参数
-            print(f"提交请求参数: {form_data}")
-            submit_resp = visual_service.cv_sync2async_submit_task(form_data)
+            logger.debug("提交请求参数: %s", form_data)
+            with timer.phase('submit'):
+                submit_resp = key_pool.submit(self.runtime.credentials, form_data,
+                                              priority=resolve_priority('text_to_video', tool_parameters))
             
             # 检查响应是否有错误
             if 'code' in submit_resp and submit_resp.get('code') != 10000:
@@ -74,21 +83,29 @@ class TextToVideoTool(Tool):
             if not task_id:
                 yield self.create_text_message("提交任务失败: 未获取到task_id")
                 return
+            timer.submitted()
+            
+            # 任务固定在创建它的凭证上，提交与轮询均在后台事件循环上执行
+            async_client = key_pool.client_for_task(self.runtime.credentials, task_id)
             
-            yield self.create_text_message(f"任务已提交，task_id: {task_id}，开始轮询结果，最多轮询10分钟")
+            # 记录任务，轮询超时或插件重启后仍可继续跟踪
+            task_journal.record_submit(async_client.fingerprint, task_id, req_key, None)
             
             # 第二步：轮询任务结果
-            max_attempts = 120  # 视频生成时间较长，最多轮询10分钟
-            attempt = 0
+            # 根据任务状态与历史耗时动态调整查询间隔
+            schedule = PollSchedule(req_key, timeout=deadline.poll_timeout(req_key))
+            
+            if deadline.exceeded_by(schedule) is not None:
+                handle = task_reconciler.detach(async_client, req_key, task_id, None, schedule)
+                yield self.create_text_message(f"任务预计需要约{int(handle['eta_seconds'])}秒，超出本次调用的时间预算，已转入后台跟踪，请稍后使用 cv_get_result 查询结果")
+                yield self.create_json_message(handle)
+                timer.outcome = 'detached'
+                return
             
-            while attempt < max_attempts:
-                time.sleep(5)  # 等待5秒
-                attempt += 1
-                
-                # 查询任务结果
-                query_params = {"task_id": task_id, "req_key": req_key}
-                result_resp = visual_service.cv_sync2async_get_result(query_params)
-                
+            yield self.create_text_message(f"任务已提交，task_id: {task_id}，开始轮询结果，最多等待{int(schedule.timeout)}秒")
+            
+            progress = ProgressReporter(schedule)
+            for attempt, result_resp in iter_task_results(async_client, req_key, task_id, schedule=schedule):
                 # 检查响应是否有错误
                 if 'code' in result_resp and result_resp.get('code') != 10000:
                     error_msg = result_resp.get('message', 'Unknown error')
@@ -97,29 +114,40 @@ class TextToVideoTool(Tool):
                 
                 data = result_resp.get('data', {})
                 status = data.get('status')
+                timer.observe_status(status)
                 
-                if status == 'in_queue':
-                    yield self.create_text_message(f"第{attempt}次轮询，任务排队中\n")
-                    continue
-                elif status == 'generating':
-                    yield self.create_text_message(f"第{attempt}次轮询，任务生成中\n")
+                # 剩余预算不足以等到预计完成时间时停止等待
+                if status in ['in_queue', 'generating'] and deadline.exceeded_by(schedule) is not None:
+                    break
+                
+                if status in ['in_queue', 'generating']:
+                    # 进度消息只在状态变化或超过最小间隔时输出
+                    message = progress.update(status, attempt)
+                    if message:
+                        yield self.create_text_message(message)
                     continue
                 elif status == 'done':
-                     # 任务完成，处理结果
-                     if data.get('video_url'):
-                         video_url = data['video_url']
-                         yield self.create_text_message(f"视频生成成功！地址: {video_url}")
+                    # 任务完成，处理结果
+                    with timer.phase('delivery'):
+                        if data.get('video_url'):
+                            video_url = data['video_url']
+                            yield self.create_text_message(f"视频生成成功！地址: {video_url}")
 
-                         # 返回结果
-                         data_resp = {
-                            "task_id": task_id,
-                            "req_key": req_key,
-                            "video_url": video_url,
-                         }
-                         yield self.create_json_message(data_resp)
-                     else:
-                         yield self.create_text_message("任务完成，但未找到视频数据")
-                     return
+                            # 返回结果
+                            data_resp = {
+                                "task_id": task_id,
+                                "req_key": req_key,
+                                "video_url": video_url,
+                            }
+                            if tool_parameters.get('store_artifacts'):
+                                # 下载到本地内容寻址存储，链接失效后仍可读取
+                                data_resp['artifacts'] = artifact_store.store_urls([video_url])
+                                timer.add_references(data_resp['artifacts'])
+                            yield self.create_json_message(data_resp)
+                            timer.outcome = 'success'
+                        else:
+                            yield self.create_text_message("任务完成，但未找到视频数据")
+                    return
                 elif status in ['not_found', 'expired']:
                     yield self.create_text_message(f"任务状态异常: {status}，停止查询")
                     return
@@ -127,7 +155,13 @@ class TextToVideoTool(Tool):
                     yield self.create_text_message(f"未知任务状态: {status}")
                     continue
 
-            yield self.create_text_message("任务轮询超时，请稍后手动查询结果")
-            yield self.create_json_message({ "task_id": task_id, "req_key": req_key })
+            # 超出时间预算或轮询超时后由后台继续跟踪，结果写入任务日志
+            handle = task_reconciler.detach(async_client, req_key, task_id, None, schedule)
+            yield self.create_text_message("任务未能在本次调用内完成，已转入后台继续跟踪，请稍后使用 cv_get_result 查询结果")
+            yield self.create_json_message(handle)
+            timer.outcome = 'detached'
         except Exception as e:
-            yield self.create_text_message(f"Error: {str(e)}")
\ No newline at end of file
+            timer.outcome = 'error'
+            yield self.create_text_message(f"Error: {str(e)}")
+        finally:
+            timer.finish()
\ No newline at end of file
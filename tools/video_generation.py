@@ -1,15 +1,28 @@
-import json
-import time
 from collections.abc import Generator
 from typing import Any
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from volcengine.visual.VisualService import VisualService
+
+from utils.artifact_store import artifact_store
+from utils.credential_check import credential_validator
+from utils.delivery import deliver_blobs
+from utils.key_pool import key_pool, parse_api_keys
+from utils.metrics import InvocationTimer
+from utils.polling import Deadline, PollSchedule
+from utils.progress import ProgressReporter
+from utils.reconciler import task_reconciler
+from utils.request_builders import build_video_generation_request
+from utils.submit_queue import resolve_priority
+from utils.task_journal import task_journal
+from utils.task_poller import iter_task_results
+from utils.url_preflight import url_preflight
 
 
 class VideoGenerationTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # 记录各阶段耗时，调用结束时汇总到进程级指标
+        timer = InvocationTimer('video_generation')
         try:
             # 获取凭证
             access_key = self.runtime.credentials.get('volcengine_access_key')
@@ -19,158 +32,145 @@ class VideoGenerationTool(Tool):
                 yield self.create_text_message("Error: VolcEngine credentials not found")
                 return
             
-            # 获取必需参数
-            prompt = tool_parameters.get('prompt')
-            if not prompt:
-                yield self.create_text_message("Error: prompt is required")
+            # 凭证已被验证为无效时直接报错，不再构建参数并发送必然失败的请求
+            credential_error = credential_validator.cached_error(access_key, secret_key)
+            if credential_error:
+                yield self.create_text_message(f"Error: {credential_error}")
                 return
             
-            # 获取视频质量，默认使用Pro
-            video_quality = tool_parameters.get('video_quality', 'pro')
+            # 本次调用的时间预算，预计无法按时完成的任务提前返回任务句柄
+            deadline = Deadline(tool_parameters.get('deadline_seconds'))
             
-            # 根据视频质量设置req_key
-            if video_quality == 'pro':
-                req_key = 'jimeng_video_v30_pro_L'  # 即梦AI-视频生成3.0 Pro
-            elif video_quality == '720p':
-                req_key = 'jimeng_video_v30_720p_L'  # 即梦AI-视频生成3.0 720P
-            elif video_quality == '1080p':
-                req_key = 'jimeng_video_v30_1080p_L'  # 即梦AI-视频生成3.0 1080P
-            else:
-                req_key = 'jimeng_video_v30_pro_L'  # 默认使用Pro
-            
-            # 构建请求数据
-            form_data = {
-                'req_key': req_key,
-                'prompt': prompt
-            }
-            
-            # 添加可选参数
-            seed = tool_parameters.get('seed', -1)
-            if seed != -1:
-                form_data['seed'] = int(seed)
-            
-            # 视频时长（秒）
-            duration = tool_parameters.get('duration', 4)
-            form_data['duration'] = int(duration)
-            
-            # 帧率
-            fps = tool_parameters.get('fps', 24)
-            form_data['fps'] = int(fps)
-            
-            # 宽高比
-            aspect_ratio = tool_parameters.get('aspect_ratio', '16:9')
-            form_data['aspect_ratio'] = aspect_ratio
-            
-            # 运动强度
-            motion_strength = tool_parameters.get('motion_strength', 'medium')
-            form_data['motion_strength'] = motion_strength
-            
-            # 摄像机运动
-            camera_motion = tool_parameters.get('camera_motion', 'none')
-            form_data['camera_motion'] = camera_motion
-            
-            # 参考图像（可选）
-            reference_image = tool_parameters.get('reference_image')
-            if reference_image:
-                form_data['reference_image'] = reference_image
-                
-                # 参考强度
-                reference_strength = tool_parameters.get('reference_strength', 0.5)
-                form_data['reference_strength'] = float(reference_strength)
+            # 凭证池：主凭证与 provider 中配置的额外凭证
+            api_keys = parse_api_keys(self.runtime.credentials)
             
-            use_pre_llm = tool_parameters.get('use_pre_llm', True)
-            form_data['use_pre_llm'] = bool(use_pre_llm)
+            # 恢复各凭证在插件重启前未完成的任务
+            for api_key in api_keys:
+                task_reconciler.reconcile(api_key.access_key, api_key.secret_key)
             
-            return_url = tool_parameters.get('return_url', True)
-            form_data['return_url'] = bool(return_url)
+            # 构建请求数据，视频质量决定 req_key，默认使用Pro
+            try:
+                with timer.phase('build'):
+                    req_key, form_data, _ = build_video_generation_request(tool_parameters)
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+            timer.req_key = req_key
+            video_quality = tool_parameters.get('video_quality', 'pro')
+            return_url = form_data['return_url']
             
-            # 初始化VisualService
-            visual_service = VisualService()
-            visual_service.set_ak(access_key)
-            visual_service.set_sk(secret_key)
+            # 提交前并发检查参考链接，无法访问、类型不符或过大时直接报错，不必等到服务端排队后才失败
+            with timer.phase('preflight'):
+                errors = url_preflight.check([(form_data.get('reference_image'), 'image')])
+            if errors:
+                yield self.create_text_message(f"Error: {'; '.join(errors)}")
+                return
             
             # 第一步：提交任务
             yield self.create_text_message(f"正在提交{video_quality}视频生成任务...")
             
-            # 调用异步提交API
-            submit_resp = visual_service.cv_sync2async_submit_task(form_data)
+            # 按优先级排队等待提交名额，由凭证池选择凭证，被限流时切换到下一组
+            with timer.phase('submit'):
+                submit_resp = key_pool.submit(self.runtime.credentials, form_data,
+                                              priority=resolve_priority('video_generation', tool_parameters))
             
-            if submit_resp['ResponseMetadata']['Error']:
-                error_msg = submit_resp['ResponseMetadata']['Error']
-                yield self.create_text_message(f"API Error: {error_msg}")
-                return
-            
-            # 解析提交响应
-            submit_result = submit_resp['Result']
-            
-            if submit_result.get('code') != 10000:
-                error_msg = submit_result.get('message', 'Unknown error')
+            # 提交接口直接返回 {code, message, data}；网关错误（如鉴权失败）只有 ResponseMetadata.Error
+            if submit_resp.get('code') != 10000:
+                error_msg = submit_resp.get('message') or (submit_resp.get('ResponseMetadata') or {}).get('Error') or 'Unknown error'
                 yield self.create_text_message(f"Task submission failed: {error_msg}")
                 return
             
             # 获取任务ID
-            task_data = submit_result.get('data', {})
+            task_data = submit_resp.get('data') or {}
             task_id = task_data.get('task_id')
             
             if not task_id:
                 yield self.create_text_message("Task submission failed: No task_id received")
                 return
+            timer.submitted()
             
-            yield self.create_text_message(f"任务已提交，task_id: {task_id}，开始轮询结果...")
+            # 任务固定在创建它的凭证上，轮询时路由回同一账号
+            async_client = key_pool.client_for_task(self.runtime.credentials, task_id)
+            
+            # 记录任务，超出时间预算或插件重启后仍可继续跟踪，也可通过 cv_get_result 查询
+            task_journal.record_submit(async_client.fingerprint, task_id, req_key)
             
             # 第二步：轮询任务结果
-            max_attempts = 120  # 视频生成时间较长，最多轮询10分钟
-            attempt = 0
+            # 根据任务状态与历史耗时动态调整查询间隔
+            schedule = PollSchedule(req_key, timeout=deadline.poll_timeout(req_key))
+            
+            if deadline.exceeded_by(schedule) is not None:
+                handle = task_reconciler.detach(async_client, req_key, task_id, schedule=schedule)
+                yield self.create_text_message(f"任务预计需要约{int(handle['eta_seconds'])}秒，超出本次调用的时间预算，已转入后台跟踪，请稍后使用 cv_get_result 查询结果")
+                yield self.create_json_message(handle)
+                timer.outcome = 'detached'
+                return
             
-            while attempt < max_attempts:
-                time.sleep(5)  # 等待5秒
-                attempt += 1
-                
-                # 查询任务结果
-                query_data = {'task_id': task_id}
-                result_resp = visual_service.cv_sync2async_get_result(query_data)
-                
-                if result_resp['ResponseMetadata']['Error']:
-                    error_msg = result_resp['ResponseMetadata']['Error']
-                    yield self.create_text_message(f"Query task failed: {error_msg}")
-                    return
-                
-                result = result_resp['Result']
-                
-                if result.get('code') != 10000:
-                    error_msg = result.get('message', 'Unknown error')
+            yield self.create_text_message(f"任务已提交，task_id: {task_id}，开始轮询结果...")
+            
+            progress = ProgressReporter(schedule)
+            # 由共享轮询器在后台事件循环上轮询，状态变化与完成耗时写入任务日志
+            for attempt, result_resp in iter_task_results(async_client, req_key, task_id, schedule=schedule):
+                if result_resp.get('code') != 10000:
+                    error_msg = result_resp.get('message', 'Unknown error')
                     yield self.create_text_message(f"Query task failed: {error_msg}")
                     return
                 
-                data = result.get('data', {})
+                data = result_resp.get('data') or {}
                 status = data.get('status')
+                timer.observe_status(status)
                 
-                if status == 'in_queue':
-                    yield self.create_text_message(f"任务排队中... (第{attempt}次查询)")
-                    continue
-                elif status == 'generating':
-                    yield self.create_text_message(f"任务生成中... (第{attempt}次查询)")
+                # 剩余预算不足以等到预计完成时间时停止等待
+                if status in ['in_queue', 'generating'] and deadline.exceeded_by(schedule) is not None:
+                    break
+                
+                if status in ['in_queue', 'generating']:
+                    # 进度消息只在状态变化或超过最小间隔时输出
+                    message = progress.update(status, attempt)
+                    if message:
+                        yield self.create_text_message(message)
                     continue
                 elif status == 'done':
                     # 任务完成，处理结果
-                    if return_url and 'video_url' in data:
-                        video_url = data['video_url']
-                        yield self.create_text_message(f"Video generated successfully using {video_quality} quality!\nVideo URL: {video_url}")
-                    elif 'binary_data_base64' in data:
-                        binary_data = data['binary_data_base64']
-                        yield self.create_blob_message(blob=binary_data, meta={'mime_type': 'video/mp4'})
-                        yield self.create_text_message(f"Video generated successfully using {video_quality} quality!")
-                    else:
-                        yield self.create_text_message("任务完成，但未找到视频数据")
+                    with timer.phase('delivery'):
+                        if return_url and 'video_url' in data:
+                            video_url = data['video_url']
+                            yield self.create_text_message(f"Video generated successfully using {video_quality} quality!\nVideo URL: {video_url}")
+                            if tool_parameters.get('store_artifacts'):
+                                # 下载到本地内容寻址存储，链接失效后仍可读取
+                                artifacts = artifact_store.store_urls([video_url])
+                                timer.add_references(artifacts)
+                                yield self.create_json_message({
+                                    "task_id": task_id,
+                                    "req_key": req_key,
+                                    "video_url": video_url,
+                                    "artifacts": artifacts,
+                                })
+                            timer.outcome = 'success'
+                        elif 'binary_data_base64' in data:
+                            # base64 解码为字节后以 blob 消息输出
+                            videos = yield from deliver_blobs(self, data['binary_data_base64'], 'video/mp4', 'video')
+                            timer.add_references(videos)
+                            yield self.create_text_message(f"Video generated successfully using {video_quality} quality!")
+                            timer.outcome = 'success'
+                        else:
+                            yield self.create_text_message("任务完成，但未找到视频数据")
                     return
-                elif status in ['failed', 'expired']:
+                elif status in ['failed', 'not_found', 'expired']:
                     yield self.create_text_message(f"任务状态异常: {status}，停止查询")
                     return
                 else:
                     yield self.create_text_message(f"未知任务状态: {status}")
                     continue
             
-            yield self.create_text_message("任务轮询超时，请稍后手动查询结果")
+            # 超出时间预算或轮询超时后由后台继续跟踪，结果写入任务日志
+            handle = task_reconciler.detach(async_client, req_key, task_id, schedule=schedule)
+            yield self.create_text_message("任务未能在本次调用内完成，已转入后台继续跟踪，请稍后使用 cv_get_result 查询结果")
+            yield self.create_json_message(handle)
+            timer.outcome = 'detached'
                 
         except Exception as e:
-            yield self.create_text_message(f"Error: {str(e)}")
\ No newline at end of file
+            timer.outcome = 'error'
+            yield self.create_text_message(f"Error: {str(e)}")
+        finally:
+            timer.finish()
\ No newline at end of file
@@ -0,0 +1 @@
+"""即梦AI插件公共组件"""
@@ -0,0 +1,265 @@
+"""
+生成结果的本地内容寻址存储
+
+接口返回的 image_urls / video_url 是短期有效的签名链接，下游节点会反复下载。开启后
+每个链接只下载一次：流式写入磁盘（内存占用与文件大小无关），按内容的 SHA-256 存放，
+总大小超出预算时按最近访问时间淘汰。工具在原链接之外返回稳定的本地引用，之后的读取
+直接读本地文件或 mmap。
+
+目录结构（根目录默认在系统临时目录下，可通过 DREAMAI_ARTIFACT_DIR 指定）::
+
+    objects/ab/<sha256>        文件内容
+    urls/cd/<sha256(链接)>.json 链接到内容的索引，签名与过期时间参数不参与计算
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import httpx
+
+from utils.delivery import DEFAULT_MIME_TYPE, sniff_mime_type
+
+logger = logging.getLogger(__name__)
+
+
+def _default_root() -> str:
+    return os.path.join(tempfile.gettempdir(), 'dreamai', 'artifacts')
+
+
+# 每次签发都会变化的查询参数（签名、过期时间），不参与索引键计算
+SIGNATURE_PARAM_PREFIXES = ('x-tos-', 'x-amz-')
+SIGNATURE_PARAMS = ('expires', 'signature', 'x-expires', 'x-signature')
+
+
+def _is_signature_param(name: str) -> bool:
+    name = name.lower()
+    return name in SIGNATURE_PARAMS or name.startswith(SIGNATURE_PARAM_PREFIXES)
+
+
+def url_key(url: str) -> str:
+    """链接的索引键：去掉签名与过期时间参数后的 SHA-256，其余查询参数（如图片处理参数）保留"""
+    parts = urlsplit(url)
+    query = urlencode([(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if not _is_signature_param(name)])
+    key = f"{parts.scheme}://{parts.netloc}{parts.path}"
+    if query:
+        key += f"?{query}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class ArtifactStore:
+    """按 SHA-256 寻址、按总字节数做 LRU 淘汰的本地文件存储"""
+
+    def __init__(self, root: str, max_bytes: int = 1024 * 1024 * 1024, chunk_size: int = 64 * 1024,
+                 timeout: float = 60.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._objects: Optional[OrderedDict[str, int]] = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._url_locks: dict[str, threading.Lock] = {}
+
+    # ---- 读取 ----
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.root, 'objects', sha256[:2], sha256)
+
+    def contains(self, sha256: str) -> bool:
+        return os.path.exists(self.object_path(sha256))
+
+    def read(self, sha256: str) -> bytes:
+        path = self.object_path(sha256)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self._touch(sha256)
+        return data
+
+    def open_mmap(self, sha256: str) -> mmap.mmap:
+        """以只读 mmap 打开文件，由调用方负责 close"""
+        path = self.object_path(sha256)
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._touch(sha256)
+        return mapped
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """链接已下载且文件仍在存储中时返回其引用"""
+        try:
+            with open(self._index_path(url_key(url)), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not self.contains(entry['sha256']):
+            return None
+        self._touch(entry['sha256'])
+        return self._reference(url, entry)
+
+    # ---- 写入 ----
+
+    def store_url(self, url: str) -> dict:
+        """
+        下载链接并存入本地，返回引用；同一链接已下载过时不再下载
+
+        :raises httpx.HTTPError: 下载失败
+        :raises ValueError: 文件超出存储总预算
+        """
+        key = url_key(url)
+        with self._lock:
+            url_lock = self._url_locks.setdefault(key, threading.Lock())
+        # 同一链接的并发请求只下载一次
+        with url_lock:
+            try:
+                reference = self.lookup(url)
+                if reference is not None:
+                    return reference
+                entry = self._download(url)
+                self._write_index(key, entry)
+                return self._reference(url, entry)
+            finally:
+                with self._lock:
+                    self._url_locks.pop(key, None)
+
+    def store_urls(self, urls: list[str]) -> list[dict]:
+        """逐个存储链接，失败的链接在引用中记录错误，不影响其他链接"""
+        references = []
+        for url in urls:
+            try:
+                references.append(self.store_url(url))
+            except Exception as e:
+                logger.warning("failed to store artifact %s: %s", url, e)
+                references.append({"url": url, "error": str(e)})
+        return references
+
+    def _download(self, url: str) -> dict:
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        try:
+            with os.fdopen(fd, 'wb') as f, httpx.stream('GET', url, timeout=self.timeout,
+                                                        follow_redirects=True) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('content-type', '').split(';')[0].strip()
+                for chunk in response.iter_bytes(self.chunk_size):
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError(f"Artifact exceeds store budget of {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            path = self.object_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 内容相同的文件只保留一份
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        if not content_type or content_type in (DEFAULT_MIME_TYPE, 'binary/octet-stream'):
+            content_type = sniff_mime_type(head)
+        self._add(sha256, size)
+        return {"sha256": sha256, "size": size, "mime_type": content_type}
+
+    def _index_path(self, key: str) -> str:
+        return os.path.join(self.root, 'urls', key[:2], f"{key}.json")
+
+    def _write_index(self, key: str, entry: dict) -> None:
+        path = self._index_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _reference(self, url: str, entry: dict) -> dict:
+        path = self.object_path(entry['sha256'])
+        return {
+            "url": url,
+            "sha256": entry['sha256'],
+            "size": entry['size'],
+            "mime_type": entry['mime_type'],
+            "path": path,
+            "uri": f"file://{path}",
+        }
+
+    # ---- LRU 淘汰 ----
+
+    def _load(self) -> None:
+        """首次使用时扫描已有文件，按修改时间（即最近访问时间）排序"""
+        objects = []
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, 'objects')):
+            for filename in filenames:
+                try:
+                    stat = os.stat(os.path.join(dirpath, filename))
+                except OSError:
+                    continue
+                objects.append((stat.st_mtime, filename, stat.st_size))
+        objects.sort()
+        self._objects = OrderedDict((sha256, size) for _, sha256, size in objects)
+        self._bytes = sum(self._objects.values())
+
+    def _touch(self, sha256: str) -> None:
+        try:
+            os.utime(self.object_path(sha256))
+        except OSError:
+            return
+        with self._lock:
+            if self._objects is not None and sha256 in self._objects:
+                self._objects.move_to_end(sha256)
+
+    def _add(self, sha256: str, size: int) -> None:
+        evicted = []
+        with self._lock:
+            if self._objects is None:
+                self._load()
+            else:
+                if sha256 in self._objects:
+                    self._bytes -= self._objects.pop(sha256)
+                self._objects[sha256] = size
+                self._bytes += size
+            self._objects.move_to_end(sha256)
+            while self._bytes > self.max_bytes and len(self._objects) > 1:
+                oldest, oldest_size = self._objects.popitem(last=False)
+                self._bytes -= oldest_size
+                evicted.append(oldest)
+        for oldest in evicted:
+            try:
+                os.remove(self.object_path(oldest))
+            except OSError:
+                pass
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            if self._objects is None:
+                self._load()
+            return self._bytes
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+artifact_store = ArtifactStore(
+    os.getenv('DREAMAI_ARTIFACT_DIR') or _default_root(),
+    max_bytes=int(_env_float('DREAMAI_ARTIFACT_MAX_BYTES', 1024 * 1024 * 1024)),
+)
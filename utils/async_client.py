@@ -0,0 +1,145 @@
+"""
+基于 asyncio 的火山引擎视觉接口客户端
+
+所有异步请求都运行在进程内唯一的后台事件循环上，单个线程即可同时跟踪
+大量进行中的任务；签名复用 VisualService 的请求构造与 SignerV4，与同步 SDK 保持一致。
+请求在发送前经过按凭证的限流，遇到限流错误码时在事件循环中退避重试；接口故障时由熔断器快速失败。
+"""
+import asyncio
+import json
+import threading
+import time
+from collections.abc import Coroutine
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Optional
+
+import httpx
+
+from utils.circuit_breaker import circuit_breakers
+from utils.client_pool import ClientPool, credential_fingerprint, get_visual_service
+from utils.metrics import api_request_seconds, api_response_bytes_total
+from utils.rate_limit import rate_limiter
+
+if TYPE_CHECKING:
+    from volcengine.visual.VisualService import VisualService
+
+
+class BackgroundLoop:
+    """在守护线程中运行的进程级事件循环"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    started = threading.Event()
+
+                    def run():
+                        asyncio.set_event_loop(loop)
+                        loop.call_soon(started.set)
+                        loop.run_forever()
+
+                    threading.Thread(target=run, name='dreamai-event-loop', daemon=True).start()
+                    started.wait()
+                    self._loop = loop
+        return self._loop
+
+    def submit(self, coro: Coroutine) -> Future:
+        """在后台事件循环上调度协程，返回线程安全的 Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """阻塞等待协程执行结果"""
+        return self.submit(coro).result(timeout)
+
+
+background_loop = BackgroundLoop()
+
+
+class AsyncVisualClient:
+    """与凭证绑定的异步客户端，接口与 VisualService 的同名方法保持一致"""
+
+    def __init__(self, service: 'VisualService'):
+        self.service = service
+        credentials = service.service_info.credentials
+        self.fingerprint = credential_fingerprint(credentials.ak, credentials.sk)
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def _get_http(self) -> httpx.AsyncClient:
+        # httpx.AsyncClient 绑定到创建它的事件循环，因此在后台循环中惰性创建
+        if self._http is None:
+            service_info = self.service.service_info
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(service_info.socket_timeout, connect=service_info.connection_timeout),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            )
+        return self._http
+
+    async def json_api(self, api: str, form: dict) -> dict:
+        host = self.service.service_info.host
+        return await rate_limiter.call_async(
+            self.fingerprint, api, form,
+            lambda: circuit_breakers.call_async(host, api, form, lambda: self._send(api, form)))
+
+    def sign(self, api: str, form: dict) -> Any:
+        """构造并签名 JSON 接口请求"""
+        # 服务实例创建时 SDK 已导入，这里只是取出已加载的模块
+        from volcengine.auth.SignerV4 import SignerV4
+
+        api_info = self.service.api_info.get(api)
+        if api_info is None:
+            raise Exception("no such api")
+        request = self.service.prepare_request(api_info, {})
+        request.headers['Content-Type'] = 'application/json'
+        request.body = json.dumps(form)
+        SignerV4.sign(request, self.service.service_info.credentials)
+        return request
+
+    async def _send(self, api: str, form: dict) -> dict:
+        request = self.sign(api, form)
+        started_at = time.monotonic()
+        response = await self._get_http().post(request.build(), headers=dict(request.headers), content=request.body)
+        api_request_seconds.observe(time.monotonic() - started_at, api=api)
+        api_response_bytes_total.inc(len(response.content), api=api)
+        if response.status_code == 200:
+            return response.json()
+        # 错误响应体为 JSON 时按 dict 返回，限流与鉴权错误由限流重试、熔断统计与调用方根据 code 处理；
+        # SDK 的 Service.json 在这种情况下会抛出异常，同步的 PooledVisualService 同样改为返回响应体
+        try:
+            return json.loads(response.text)
+        except ValueError:
+            raise Exception(response.text)
+
+    async def cv_sync2async_submit_task(self, form: dict) -> dict:
+        return await self.json_api("CVSync2AsyncSubmitTask", form)
+
+    async def cv_sync2async_get_result(self, form: dict) -> dict:
+        return await self.json_api("CVSync2AsyncGetResult", form)
+
+    async def cv_process(self, form: dict) -> dict:
+        return await self.json_api("CVProcess", form)
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+def _close_async_client(client: AsyncVisualClient) -> None:
+    background_loop.submit(client.aclose())
+
+
+async_client_pool = ClientPool(
+    lambda access_key, secret_key: AsyncVisualClient(get_visual_service(access_key, secret_key)),
+    on_evict=_close_async_client,
+)
+
+
+def get_async_client(access_key: str, secret_key: str) -> AsyncVisualClient:
+    """获取与凭证绑定、可复用的异步客户端"""
+    return async_client_pool.get(access_key, secret_key)
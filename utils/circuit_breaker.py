@@ -0,0 +1,259 @@
+"""
+接口故障时的熔断与快速失败
+
+火山引擎接口故障期间，每次调用仍会提交、排队并轮询到超时，每个工作进程被占用 5 到 10 分钟，
+故障持续时插件的工作进程会被逐个耗尽。这里按接口地址、以及按 (接口地址, req_key) 分别维护熔断器：
+
+- closed：正常放行，记录最近 window 次请求的结果；失败比例达到阈值时打开
+- open：新的提交直接返回熔断错误，不再发送请求；open_seconds 后进入 half_open
+- half_open：只放行 half_open_calls 个试探请求，全部成功后关闭，任一失败则重新打开
+
+请求抛出异常、返回服务端错误码（5050x）或耗时超过 slow_call_seconds 都记为失败；
+限流与参数错误不属于接口故障，记为成功。只拦截提交类接口，进行中任务的查询照常发送，
+其结果同样计入统计，已提交的任务不会因熔断丢失。
+
+- DREAMAI_BREAKER=off 关闭熔断
+- DREAMAI_BREAKER_WINDOW 统计的最近请求数，默认 20
+- DREAMAI_BREAKER_MIN_CALLS 窗口内至少有多少次请求才判断是否打开，默认 5
+- DREAMAI_BREAKER_FAILURE_RATE 打开熔断的失败比例，默认 0.5
+- DREAMAI_BREAKER_SLOW_SECONDS 超过该耗时的请求记为失败，默认 20
+- DREAMAI_BREAKER_OPEN_SECONDS 打开后多久开始试探，默认 30
+- DREAMAI_BREAKER_HALF_OPEN_CALLS 半开状态下的试探请求数，默认 1
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import Any, Optional
+
+from utils.metrics import circuit_rejections_total, circuit_transitions_total
+from utils.rate_limit import is_submission
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 熔断时返回的错误码，与火山引擎的 50500 内部错误区分
+CIRCUIT_OPEN_CODE = 50503
+
+# 火山引擎服务端错误码：50500 内部错误，50501 内部 RPC 错误
+SERVER_ERROR_CODES = (50500, 50501)
+
+
+def is_server_failure(response: Any) -> bool:
+    """响应是否表示接口故障（而不是限流或参数错误）"""
+    if not isinstance(response, dict):
+        return True
+    if response.get('code') in SERVER_ERROR_CODES:
+        return True
+    error = (response.get('ResponseMetadata') or {}).get('Error') or {}
+    return isinstance(error, dict) and str(error.get('Code', '')).startswith(('InternalError', 'ServiceUnavailable'))
+
+
+class CircuitBreaker:
+    """按最近请求的失败比例打开的熔断器，线程安全"""
+
+    def __init__(self, endpoint: str = '', req_key: str = '', window: int = 20, min_calls: int = 5,
+                 failure_rate: float = 0.5, open_seconds: float = 30.0, half_open_calls: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        self.endpoint = endpoint
+        self.req_key = req_key
+        self.min_calls = max(min_calls, 1)
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(half_open_calls, 1)
+        self._clock = clock
+        self._outcomes: deque = deque(maxlen=max(window, self.min_calls))
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._advance()
+            return self._state
+
+    def retry_after(self) -> float:
+        """距离开始试探还有多少秒"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_seconds - self._clock())
+
+    def acquire(self) -> Optional[bool]:
+        """
+        申请发送一次请求
+
+        :return: None 表示熔断中应直接失败；True 表示这是半开状态下的试探请求；False 表示正常请求
+        """
+        with self._lock:
+            self._advance()
+            if self._state == CLOSED:
+                return False
+            if self._state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            return None
+
+    def release(self, probe: bool) -> None:
+        """归还未实际发送的试探名额"""
+        if probe:
+            with self._lock:
+                self._probes = max(0, self._probes - 1)
+
+    def record(self, failed: bool, probe: bool = False) -> None:
+        """记录一次请求的结果；非试探请求在熔断打开期间的结果不影响状态"""
+        with self._lock:
+            if probe:
+                self._probes = max(0, self._probes - 1)
+                if self._state != HALF_OPEN:
+                    return
+                if failed:
+                    self._transition(OPEN)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._transition(CLOSED)
+                return
+            if self._state != CLOSED:
+                return
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= self.min_calls and \
+                    sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._transition(OPEN)
+
+    def _advance(self) -> None:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+
+    def _transition(self, state: str) -> None:
+        self._state = state
+        if state == OPEN:
+            self._opened_at = self._clock()
+            logger.warning("circuit opened for %s %s", self.endpoint, self.req_key or '*')
+        self._probes = 0
+        self._probe_successes = 0
+        if state == CLOSED:
+            self._outcomes.clear()
+        circuit_transitions_total.inc(endpoint=self.endpoint, req_key=self.req_key, state=state)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class CircuitBreakers:
+    """
+    按接口地址与 (接口地址, req_key) 维护熔断器
+
+    同步的 PooledVisualService 与异步的 AsyncVisualClient 在限流之后、实际发送请求时经过这里，
+    记录的耗时不包含限流等待。
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, slow_call_seconds: Optional[float] = None, **options):
+        if enabled is None:
+            enabled = os.getenv('DREAMAI_BREAKER', 'on').lower() not in ('', 'off', 'none', 'false', '0')
+        self.enabled = enabled
+        if slow_call_seconds is None:
+            slow_call_seconds = _env_float('DREAMAI_BREAKER_SLOW_SECONDS', 20)
+        self.slow_call_seconds = slow_call_seconds
+        self.options = options or {
+            'window': int(_env_float('DREAMAI_BREAKER_WINDOW', 20)),
+            'min_calls': int(_env_float('DREAMAI_BREAKER_MIN_CALLS', 5)),
+            'failure_rate': _env_float('DREAMAI_BREAKER_FAILURE_RATE', 0.5),
+            'open_seconds': _env_float('DREAMAI_BREAKER_OPEN_SECONDS', 30),
+            'half_open_calls': int(_env_float('DREAMAI_BREAKER_HALF_OPEN_CALLS', 1)),
+        }
+        self._breakers: dict[tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint: str, req_key: str = '') -> CircuitBreaker:
+        """接口地址的熔断器（req_key 为空）或某个 req_key 的熔断器"""
+        key = (endpoint, req_key)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = CircuitBreaker(endpoint, req_key, **self.options)
+                    self._breakers[key] = breaker
+        return breaker
+
+    def call(self, endpoint: str, api: str, form: dict, send: Callable[[], dict]) -> dict:
+        """同步发送请求"""
+        tickets, rejection = self._enter(endpoint, api, form)
+        if rejection is not None:
+            return rejection
+        started_at = time.monotonic()
+        try:
+            response = send()
+        except Exception:
+            self._exit(tickets, True)
+            raise
+        self._exit(tickets, self._failed(response, started_at))
+        return response
+
+    async def call_async(self, endpoint: str, api: str, form: dict, send: Callable[[], Awaitable[dict]]) -> dict:
+        """在事件循环中发送请求"""
+        tickets, rejection = self._enter(endpoint, api, form)
+        if rejection is not None:
+            return rejection
+        started_at = time.monotonic()
+        try:
+            response = await send()
+        except Exception:
+            self._exit(tickets, True)
+            raise
+        self._exit(tickets, self._failed(response, started_at))
+        return response
+
+    def _enter(self, endpoint: str, api: str, form: dict) -> tuple[list, Optional[dict]]:
+        if not self.enabled:
+            return [], None
+        req_key = form.get('req_key') or ''
+        breakers = [self.breaker(endpoint)]
+        if req_key:
+            breakers.append(self.breaker(endpoint, req_key))
+        if not is_submission(api, form):
+            return [(breaker, False) for breaker in breakers], None
+        tickets = []
+        for breaker in breakers:
+            probe = breaker.acquire()
+            if probe is None:
+                for acquired, acquired_probe in tickets:
+                    acquired.release(acquired_probe)
+                circuit_rejections_total.inc(endpoint=endpoint, req_key=req_key)
+                return [], self._rejection(breaker, req_key or endpoint)
+            tickets.append((breaker, probe))
+        return tickets, None
+
+    def _exit(self, tickets: list, failed: bool) -> None:
+        for breaker, probe in tickets:
+            breaker.record(failed, probe)
+
+    def _failed(self, response: Any, started_at: float) -> bool:
+        return is_server_failure(response) or time.monotonic() - started_at > self.slow_call_seconds
+
+    def _rejection(self, breaker: CircuitBreaker, target: str) -> dict:
+        message = (f"Service temporarily unavailable: recent requests for {target} are failing, "
+                   f"new tasks are rejected for {int(breaker.retry_after()) + 1}s (circuit open)")
+        return {
+            'code': CIRCUIT_OPEN_CODE,
+            'message': message,
+            'data': None,
+            'ResponseMetadata': {'Error': {'Code': 'CircuitOpen', 'Message': message}},
+        }
+
+
+# 进程级共享实例，阈值可通过环境变量调整
+circuit_breakers = CircuitBreakers()
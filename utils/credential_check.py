@@ -0,0 +1,153 @@
+"""
+凭证验证与验证结果缓存
+
+provider 保存凭证时向视觉接口发送一次签名的查询请求（查询一个不存在的任务，不创建任务也不消耗生成额度），
+根据网关是否返回鉴权错误判断凭证是否有效；设置 DREAMAI_VISUAL_ENDPOINT 时请求发往该地址，
+测试中可由本地模拟服务代替。
+
+验证结果按凭证指纹缓存：工具调用开始时查询缓存，已知无效的凭证直接报错，不再构建参数、
+上传输入并等待一次必然失败的提交；提交时遇到鉴权错误或成功响应也会更新缓存。
+网络错误等无法判断的情况不缓存，也不阻止保存凭证或调用。
+
+- DREAMAI_CREDENTIAL_CHECK=off 不发送验证请求，只校验凭证格式
+- DREAMAI_CREDENTIAL_TTL 有效结果的缓存时间（秒），默认 3600
+- DREAMAI_CREDENTIAL_INVALID_TTL 无效结果的缓存时间（秒），默认 300，账号开通权限后可较快恢复
+- DREAMAI_CREDENTIAL_CHECK_TIMEOUT 验证请求的超时（秒），默认 10
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from utils.async_client import background_loop, get_async_client
+from utils.client_pool import credential_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# 网关返回的鉴权错误码：密钥不存在、签名错误或账号未开通视觉服务
+AUTH_ERROR_CODES = ('InvalidAccessKey', 'InvalidCredential', 'SignatureDoesNotMatch', 'InvalidAuthorization',
+                    'AccessDenied')
+
+# 验证时查询的任务，不存在的 task_id 只会返回任务不存在
+PROBE_FORM = {'req_key': 'jimeng_t2i_v31', 'task_id': 'dreamai-credential-check'}
+
+
+@dataclass(frozen=True)
+class Verdict:
+    # True 有效，False 无效，None 无法判断
+    valid: Optional[bool]
+    message: str = ''
+
+
+def auth_error(response: Any) -> Optional[str]:
+    """响应为鉴权错误时返回错误描述，否则返回 None"""
+    if not isinstance(response, dict):
+        return None
+    error = (response.get('ResponseMetadata') or {}).get('Error')
+    if isinstance(error, dict) and error.get('Code') in AUTH_ERROR_CODES:
+        return f"{error['Code']}: {error.get('Message', '')}".rstrip(': ')
+    return None
+
+
+class CredentialValidator:
+    """验证凭证并按凭证指纹缓存结果"""
+
+    def __init__(self, enabled: bool = True, ttl: float = 3600.0, invalid_ttl: float = 300.0,
+                 timeout: float = 10.0):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.invalid_ttl = invalid_ttl
+        self.timeout = timeout
+        self._verdicts: dict[str, tuple[Verdict, float]] = {}
+        self._lock = threading.Lock()
+
+    def cached(self, fingerprint: str) -> Optional[Verdict]:
+        with self._lock:
+            entry = self._verdicts.get(fingerprint)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._verdicts[fingerprint]
+                return None
+            return entry[0]
+
+    def is_invalid(self, fingerprint: str) -> bool:
+        verdict = self.cached(fingerprint)
+        return verdict is not None and verdict.valid is False
+
+    def cached_error(self, access_key: str, secret_key: str) -> Optional[str]:
+        """凭证已知无效时返回给用户的错误消息"""
+        verdict = self.cached(credential_fingerprint(access_key, secret_key))
+        if verdict is None or verdict.valid is not False:
+            return None
+        return f"VolcEngine rejected the credentials ({verdict.message}), please update them in the plugin settings"
+
+    def record(self, fingerprint: str, response: Any) -> None:
+        """根据一次真实请求的响应更新缓存：鉴权错误记为无效，成功响应记为有效"""
+        error = auth_error(response)
+        if error:
+            self._store(fingerprint, Verdict(False, error))
+        elif isinstance(response, dict) and response.get('code') == 10000:
+            self._store(fingerprint, Verdict(True))
+
+    def validate(self, keys: list[tuple[str, str]], refresh: bool = False) -> list[Verdict]:
+        """并发验证多组 (access_key, secret_key)，refresh 为 False 时优先使用缓存"""
+        if not self.enabled:
+            return [Verdict(None, 'credential check disabled') for _ in keys]
+        verdicts: list[Optional[Verdict]] = [
+            None if refresh else self.cached(credential_fingerprint(access_key, secret_key))
+            for access_key, secret_key in keys
+        ]
+        pending = [index for index, verdict in enumerate(verdicts) if verdict is None]
+        if pending:
+            try:
+                results = background_loop.run(self._probe_all([keys[index] for index in pending]),
+                                              timeout=self.timeout + 1)
+            except TimeoutError:
+                results = [Verdict(None, 'credential check timed out')] * len(pending)
+            for index, verdict in zip(pending, results):
+                verdicts[index] = verdict
+                if verdict.valid is not None:
+                    self._store(credential_fingerprint(*keys[index]), verdict)
+        return verdicts
+
+    async def _probe_all(self, keys: list[tuple[str, str]]) -> list[Verdict]:
+        return await asyncio.gather(*(self._probe(access_key, secret_key) for access_key, secret_key in keys))
+
+    async def _probe(self, access_key: str, secret_key: str) -> Verdict:
+        client = get_async_client(access_key, secret_key)
+        try:
+            response = await asyncio.wait_for(client.cv_sync2async_get_result(dict(PROBE_FORM)), self.timeout)
+        except Exception as e:
+            logger.info("credential check failed for %s: %s", client.fingerprint, e)
+            return Verdict(None, str(e) or type(e).__name__)
+        error = auth_error(response)
+        return Verdict(False, error) if error else Verdict(True)
+
+    def _store(self, fingerprint: str, verdict: Verdict) -> None:
+        ttl = self.ttl if verdict.valid else self.invalid_ttl
+        with self._lock:
+            self._verdicts[fingerprint] = (verdict, time.monotonic() + ttl)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._verdicts.clear()
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+# 进程级共享实例
+credential_validator = CredentialValidator(
+    enabled=os.getenv('DREAMAI_CREDENTIAL_CHECK', 'on').lower() not in ('', 'off', 'none', 'false', '0'),
+    ttl=_env_float('DREAMAI_CREDENTIAL_TTL', 3600),
+    invalid_ttl=_env_float('DREAMAI_CREDENTIAL_INVALID_TTL', 300),
+    timeout=_env_float('DREAMAI_CREDENTIAL_CHECK_TIMEOUT', 10),
+)
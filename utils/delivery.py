@@ -0,0 +1,118 @@
+"""
+生成结果投递
+
+return_url 为 false 时接口以 binary_data_base64 返回生成结果。这里把 base64 按块解码为字节，
+根据文件头识别 MIME 类型后逐个以 blob 消息输出，JSON 消息中只保留文件引用（序号、文件名、类型、
+大小与 SHA-256），多兆字节的数据不再经过 JSON 编码与进程间传输的重复复制。
+"""
+import binascii
+import hashlib
+from collections.abc import Generator
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Union
+
+if TYPE_CHECKING:
+    from dify_plugin import Tool
+    from dify_plugin.entities.tool import ToolInvokeMessage
+
+# 每次解码的 base64 字符数，必须是 4 的倍数
+DECODE_CHUNK_CHARS = 1 << 20
+
+DEFAULT_MIME_TYPE = 'application/octet-stream'
+
+_EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+    'video/mp4': 'mp4',
+    'video/quicktime': 'mov',
+    'video/webm': 'webm',
+}
+
+
+def sniff_mime_type(head: bytes, default: str = DEFAULT_MIME_TYPE) -> str:
+    """根据文件头识别常见的图片与视频格式，无法识别时返回 default"""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[4:8] == b'ftyp':
+        return 'video/quicktime' if head[8:10] == b'qt' else 'video/mp4'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video/webm'
+    return default
+
+
+def decode_base64(data: Union[str, bytes], chunk_chars: int = DECODE_CHUNK_CHARS) -> bytes:
+    """
+    按块解码 base64，不生成整段数据的 ASCII 中间副本
+
+    兼容 data URL 前缀与缺失的末尾填充；数据中含换行等空白时退回整体解码。
+
+    :raises binascii.Error: 数据不是合法的 base64
+    """
+    if isinstance(data, bytes):
+        data = data.decode('ascii')
+    if data.startswith('data:'):
+        data = data.partition(',')[2]
+    if any(char in data for char in ('\n', '\r', ' ', '\t')):
+        data = ''.join(data.split())
+    if len(data) % 4:
+        data += '=' * (-len(data) % 4)
+
+    chunk_chars -= chunk_chars % 4
+    buffer = bytearray()
+    for start in range(0, len(data), chunk_chars):
+        buffer += binascii.a2b_base64(data[start:start + chunk_chars])
+    return bytes(buffer)
+
+
+@dataclass
+class Artifact:
+    """解码后的单个生成结果"""
+    index: int
+    blob: bytes
+    mime_type: str
+    filename: str
+
+    def reference(self) -> dict:
+        """写入 JSON 消息的引用信息"""
+        return {
+            "index": self.index,
+            "filename": self.filename,
+            "mime_type": self.mime_type,
+            "size": len(self.blob),
+            "sha256": hashlib.sha256(self.blob).hexdigest(),
+        }
+
+
+def iter_artifacts(encoded: Union[str, list], default_mime_type: str = DEFAULT_MIME_TYPE,
+                   name: str = 'result') -> Generator[Artifact, None, None]:
+    """逐个解码 base64 结果，同一时刻只持有一个解码后的文件"""
+    items = [encoded] if isinstance(encoded, (str, bytes)) else list(encoded or [])
+    for index, item in enumerate(items):
+        blob = decode_base64(item)
+        mime_type = sniff_mime_type(blob[:16], default_mime_type)
+        extension = _EXTENSIONS.get(mime_type, 'bin')
+        suffix = f"_{index + 1}" if len(items) > 1 else ''
+        yield Artifact(index, blob, mime_type, f"{name}{suffix}.{extension}")
+
+
+def deliver_blobs(tool: 'Tool', encoded: Union[str, list], default_mime_type: str = DEFAULT_MIME_TYPE,
+                  name: str = 'result') -> Generator['ToolInvokeMessage', None, list[dict[str, Any]]]:
+    """
+    以 blob 消息逐个输出 base64 结果，返回供 JSON 消息使用的引用列表
+
+    在工具的 _invoke 中使用：references = yield from deliver_blobs(self, data['binary_data_base64'])
+    """
+    references = []
+    for artifact in iter_artifacts(encoded, default_mime_type, name):
+        yield tool.create_blob_message(blob=artifact.blob,
+                                       meta={'mime_type': artifact.mime_type, 'filename': artifact.filename})
+        references.append(artifact.reference())
+    return references
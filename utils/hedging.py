@@ -0,0 +1,276 @@
+"""
+排队过久的图片任务的对冲提交（hedged request）
+
+服务端偶尔会让个别任务长时间停留在 in_queue，而同样的请求重新提交后很快就能完成。
+开启后，任务的排队时间超过该 req_key 历史排队耗时的分位数时再提交一个相同的任务，
+两个任务由共享轮询器同时轮询，先完成者的结果返回给调用方，另一个不再等待，
+交给 task_reconciler 在后台跟踪至结束（释放并发名额并写入任务日志）。
+
+对冲任务会额外消耗生成额度，因此按凭证限制额度：每次正常提交积累 budget 个对冲额度，
+每次对冲消耗 1 个，额度不足时不对冲；历史样本不足时无法判断排队是否异常，也不对冲。
+
+- DREAMAI_HEDGE=on 开启对冲，默认关闭
+- DREAMAI_HEDGE_QUANTILE 触发对冲的历史排队耗时分位数，默认 0.95
+- DREAMAI_HEDGE_MIN_SAMPLES 该 req_key 至少需要的历史样本数，默认 20
+- DREAMAI_HEDGE_MIN_DELAY 触发对冲的最短排队时间（秒），默认 5
+- DREAMAI_HEDGE_BUDGET 每次提交积累的对冲额度，默认 0.1（对冲任务最多约占提交数的 10%）
+- DREAMAI_HEDGE_BURST 每个凭证最多积累的对冲额度，默认 5
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable, Generator
+from typing import Any, Optional
+
+from utils.async_client import AsyncVisualClient
+from utils.metrics import hedge_races_total, hedges_total
+from utils.polling import LatencyHistory, PollSchedule, latency_history
+from utils.reconciler import task_reconciler
+from utils.task_journal import task_journal
+from utils.task_poller import SharedPoller, Subscription, shared_poller
+
+logger = logging.getLogger(__name__)
+
+# 轮询中的状态按进度排序，对冲后只产出进度不落后于其他任务的响应
+_PROGRESS = {'in_queue': 0, 'generating': 1}
+
+_FINISHED = object()
+
+
+class HedgeBudget:
+    """按凭证的对冲额度：每次提交存入 ratio，每次对冲消耗 1，最多积累 burst"""
+
+    def __init__(self, ratio: float = 0.1, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def deposit(self, fingerprint: str) -> None:
+        with self._lock:
+            self._tokens[fingerprint] = min(self._tokens.get(fingerprint, 0.0) + self.ratio, self.burst)
+
+    def try_spend(self, fingerprint: str) -> bool:
+        with self._lock:
+            tokens = self._tokens.get(fingerprint, 0.0)
+            if tokens < 1.0:
+                return False
+            self._tokens[fingerprint] = tokens - 1.0
+            return True
+
+    def tokens(self, fingerprint: str) -> float:
+        with self._lock:
+            return self._tokens.get(fingerprint, 0.0)
+
+
+class _Leg(Subscription):
+    """参与竞速的一个任务，轮询结果转发到竞速的共享队列"""
+
+    def __init__(self, events: queue.Queue, poller: SharedPoller, client: AsyncVisualClient, task_id: str,
+                 req_json: Optional[str], schedule: PollSchedule):
+        super().__init__(poller, req_json, schedule.remaining)
+        self.client = client
+        self.task_id = task_id
+        self.schedule = schedule
+        self.status: Optional[str] = None
+        self._race_events = events
+
+    def deliver(self, response: dict) -> None:
+        self.attempt += 1
+        self._race_events.put((self, response))
+
+    def fail(self, error: Exception) -> None:
+        self._race_events.put((self, error))
+
+    def finish(self) -> None:
+        self._race_events.put((self, _FINISHED))
+
+
+class HedgedRace:
+    """
+    同时轮询原任务与对冲任务，可迭代得到 (第几次查询, 响应)，用法与 iter_task_results 相同
+
+    client / task_id 指向最近一次产出响应的任务，任务完成时即为先完成的任务。
+    """
+
+    def __init__(self, hedger: 'TaskHedger', client: AsyncVisualClient, req_key: str, task_id: str,
+                 req_json: Optional[str], schedule: PollSchedule, threshold: Optional[float],
+                 resubmit: Optional[Callable[[], dict]], client_for: Optional[Callable[[str], AsyncVisualClient]]):
+        self.req_key = req_key
+        self.req_json = req_json
+        self.client = client
+        self.task_id = task_id
+        self.hedged = False
+        self.winner: Optional[_Leg] = None
+        self._hedger = hedger
+        self._resubmit = resubmit
+        self._client_for = client_for
+        self._events: queue.Queue = queue.Queue()
+        self._primary = self._watch(client, task_id, schedule)
+        self._legs = [self._primary]
+        self._deadline = self._primary.deadline
+        # 原任务排队到该时刻仍未开始生成时提交对冲任务
+        self._hedge_at = schedule.started_at + threshold if threshold is not None and resubmit else None
+        self._attempt = 0
+
+    def _watch(self, client: AsyncVisualClient, task_id: str, schedule: PollSchedule) -> _Leg:
+        leg = _Leg(self._events, self._hedger.poller, client, task_id, self.req_json, schedule)
+        self._hedger.poller.subscribe(leg, client, self.req_key, task_id, schedule)
+        return leg
+
+    def __iter__(self) -> Generator[tuple[int, dict[str, Any]], None, None]:
+        try:
+            while self._legs:
+                now = time.monotonic()
+                timeout = self._deadline - now
+                if timeout <= 0:
+                    return
+                if self._hedge_at is not None and self._primary.status == 'in_queue':
+                    timeout = min(timeout, max(self._hedge_at - now, 0.0))
+                try:
+                    leg, event = self._events.get(timeout=timeout)
+                except queue.Empty:
+                    self._maybe_hedge()
+                    continue
+                if leg not in self._legs:
+                    continue
+                if event is _FINISHED or isinstance(event, Exception):
+                    self._drop(leg)
+                    if isinstance(event, Exception) and not self._legs:
+                        raise event
+                    continue
+
+                status = (event.get('data') or {}).get('status')
+                if event.get('code') != 10000 or status in ('not_found', 'expired'):
+                    # 还有其他任务在轮询时忽略这个任务的失败，全部失败时才交给调用方
+                    self._drop(leg)
+                    if self._legs:
+                        continue
+                    self._attempt += 1
+                    self.client, self.task_id = leg.client, leg.task_id
+                    yield self._attempt, event
+                    return
+
+                if status == 'done':
+                    self._attempt += 1
+                    self.client, self.task_id = leg.client, leg.task_id
+                    self._win(leg)
+                    yield self._attempt, event
+                    return
+
+                leg.status = status
+                if leg is self._primary:
+                    self._maybe_hedge()
+                # 进度落后于其他任务的响应不产出，避免进度消息在排队与生成之间来回切换
+                if any(_PROGRESS.get(other.status, 0) > _PROGRESS.get(status, 0) for other in self._legs):
+                    continue
+                self._attempt += 1
+                self.client, self.task_id = leg.client, leg.task_id
+                yield self._attempt, event
+        finally:
+            self.close()
+
+    def _maybe_hedge(self) -> None:
+        if self._hedge_at is None or time.monotonic() < self._hedge_at:
+            return
+        if self._primary not in self._legs or self._primary.status != 'in_queue':
+            return
+        # 每个任务最多对冲一次
+        self._hedge_at = None
+        if not self._hedger.budget.try_spend(self._primary.client.fingerprint):
+            hedges_total.inc(req_key=self.req_key, outcome='no_budget')
+            return
+        try:
+            response = self._resubmit()
+        except Exception as e:
+            logger.info("hedged resubmission of %s failed: %s", self._primary.task_id, e)
+            response = {}
+        task_id = (response.get('data') or {}).get('task_id') if response.get('code') == 10000 else None
+        if not task_id:
+            hedges_total.inc(req_key=self.req_key, outcome='submit_failed')
+            return
+        client = self._client_for(task_id) if self._client_for else self._primary.client
+        task_journal.record_submit(client.fingerprint, task_id, self.req_key, self.req_json)
+        schedule = PollSchedule(self.req_key, timeout=max(self._deadline - time.monotonic(), 0.0))
+        self._legs.append(self._watch(client, task_id, schedule))
+        self.hedged = True
+        hedges_total.inc(req_key=self.req_key, outcome='launched')
+        logger.info("task %s queued longer than expected, hedged with %s", self._primary.task_id, task_id)
+
+    def _win(self, leg: _Leg) -> None:
+        self.winner = leg
+        if self.hedged:
+            winner = 'primary' if leg is self._primary else 'hedge'
+            hedge_races_total.inc(req_key=self.req_key, winner=winner)
+
+    def _drop(self, leg: _Leg) -> None:
+        self._legs.remove(leg)
+        leg.close()
+
+    def close(self) -> None:
+        """停止轮询；对冲过的任务中未完成者交给后台跟踪至结束"""
+        legs, self._legs = self._legs, []
+        if self.hedged and self.winner is None:
+            hedge_races_total.inc(req_key=self.req_key, winner='none')
+        for leg in legs:
+            if self.hedged and leg is not self.winner:
+                task_reconciler.adopt(leg.client, self.req_key, leg.task_id, self.req_json, leg.schedule)
+            leg.close()
+
+
+class TaskHedger:
+    """按 req_key 的历史排队耗时决定对冲时机，并按凭证限制对冲额度"""
+
+    def __init__(self, enabled: bool = False, quantile: float = 0.95, min_samples: int = 20,
+                 min_delay: float = 5.0, budget: Optional[HedgeBudget] = None,
+                 history: Optional[LatencyHistory] = None, poller: Optional[SharedPoller] = None):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget = budget or HedgeBudget()
+        self.history = history or latency_history
+        self.poller = poller or shared_poller
+
+    def threshold(self, req_key: str) -> Optional[float]:
+        """排队超过该秒数时对冲，未开启或历史样本不足时返回 None"""
+        if not self.enabled or self.history.count(req_key) < self.min_samples:
+            return None
+        return max(self.history.queue_quantile(req_key, self.quantile), self.min_delay)
+
+    def race(self, client: AsyncVisualClient, req_key: str, task_id: str, req_json: Optional[str] = None,
+             schedule: Optional[PollSchedule] = None, resubmit: Optional[Callable[[], dict]] = None,
+             client_for: Optional[Callable[[str], AsyncVisualClient]] = None) -> HedgedRace:
+        """
+        轮询任务结果，排队过久时通过 resubmit 提交对冲任务
+
+        :param resubmit: 再次提交相同请求，返回提交响应；为 None 时（如复用他人任务）不对冲
+        :param client_for: 对冲任务 task_id 对应的客户端，凭证池可能把对冲任务提交到其他凭证
+        """
+        schedule = schedule or PollSchedule(req_key)
+        if resubmit is not None and self.enabled:
+            self.budget.deposit(client.fingerprint)
+        return HedgedRace(self, client, req_key, task_id, req_json, schedule, self.threshold(req_key),
+                          resubmit, client_for)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+# 进程级共享实例
+task_hedger = TaskHedger(
+    enabled=os.getenv('DREAMAI_HEDGE', 'off').lower() in ('1', 'on', 'true', 'yes'),
+    quantile=_env_float('DREAMAI_HEDGE_QUANTILE', 0.95),
+    min_samples=int(_env_float('DREAMAI_HEDGE_MIN_SAMPLES', 20)),
+    min_delay=_env_float('DREAMAI_HEDGE_MIN_DELAY', 5),
+    budget=HedgeBudget(
+        ratio=_env_float('DREAMAI_HEDGE_BUDGET', 0.1),
+        burst=_env_float('DREAMAI_HEDGE_BURST', 5),
+    ),
+)
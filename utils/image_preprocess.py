@@ -0,0 +1,174 @@
+"""
+图生图输入图像的本地预处理
+
+调用方常把原始分辨率的照片以 base64 传入 image_input，每次请求上传十几兆的文本，
+服务端也要先解码再缩小。提交前在本地解码，把图像缩小到 jimeng_i2i_v30 实际使用的分辨率
+（指定了 width / height 时保证缩小后仍覆盖输出尺寸，否则长边不超过 max_edge），
+再以 JPEG（带透明通道时为 PNG）重新编码；结果按原图内容与目标尺寸缓存，
+反复编辑同一张图时不再重复处理。
+
+预处理是有损的：JPEG 重新编码（默认质量 90）会引入压缩噪点并丢弃 EXIF 等元数据，
+缩小会损失模型可能用到的细节，对细纹理、文字或已压缩过的图片影响更明显。因此默认关闭，
+由部署方通过环境变量或调用方通过 image_to_image 的 preprocess_image 参数按需开启。
+
+- 需要安装 Pillow；未安装、输入为链接或无法解码时原样上传
+- 只缩小不放大，处理后的数据不比原图小时仍使用原图
+- DREAMAI_IMAGE_PREPROCESS=on 对所有调用开启预处理，默认 off
+- DREAMAI_IMAGE_MAX_EDGE 未指定输出尺寸时的长边上限，默认 2016（模型支持的最大边长）
+- DREAMAI_IMAGE_QUALITY JPEG 编码质量，默认 90
+- DREAMAI_IMAGE_CACHE_BYTES 处理结果缓存的字节预算，默认 64MB
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+_pil_modules: Any = _UNSET
+
+
+def _pil() -> Any:
+    """(Image, ImageOps)，未安装 Pillow 时返回 None；导入结果只检查一次"""
+    global _pil_modules
+    if _pil_modules is _UNSET:
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            logger.info("Pillow is not installed, input images are uploaded as-is")
+            _pil_modules = None
+        else:
+            _pil_modules = (Image, ImageOps)
+    return _pil_modules
+
+
+def target_size(size: tuple[int, int], width: Optional[int], height: Optional[int],
+                max_edge: int) -> tuple[int, int]:
+    """缩小后的尺寸：指定输出宽高时刚好覆盖输出尺寸，否则长边不超过 max_edge；不放大"""
+    image_width, image_height = size
+    if width and height:
+        ratio = max(width / image_width, height / image_height)
+    else:
+        ratio = max_edge / max(image_width, image_height)
+    if ratio >= 1:
+        return size
+    return max(1, round(image_width * ratio)), max(1, round(image_height * ratio))
+
+
+def _decode(image_input: str) -> Optional[bytes]:
+    # 兼容 data:image/png;base64,... 形式
+    data = image_input.split(',', 1)[1] if image_input.startswith('data:') else image_input
+    try:
+        return base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def _has_alpha(image: Any) -> bool:
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+class ImagePreprocessor:
+    """缩小并重新编码 base64 输入图像，按内容哈希缓存处理结果"""
+
+    def __init__(self, enabled: bool = True, max_edge: int = 2016, quality: int = 90,
+                 cache_bytes: int = 64 * 1024 * 1024):
+        self.enabled = enabled
+        self.max_edge = max_edge
+        self.quality = quality
+        self.cache_bytes = cache_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def process(self, image_input: str, width: Optional[int] = None, height: Optional[int] = None,
+                enabled: Optional[bool] = None) -> str:
+        """返回上传用的 base64 数据；无法处理时返回原输入。enabled 为本次调用的开关，未指定时使用实例默认值"""
+        if enabled is None:
+            enabled = self.enabled
+        if not enabled or not image_input or _pil() is None:
+            return image_input
+        raw = _decode(image_input)
+        if raw is None:
+            return image_input
+        key = f"{hashlib.sha256(raw).hexdigest()}:{width}x{height}:{self.max_edge}:{self.quality}"
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        try:
+            encoded = self._shrink(raw, width, height)
+        except Exception as e:
+            logger.warning("input image preprocessing failed, uploading as-is: %s", e)
+            return image_input
+        result = base64.b64encode(encoded).decode('ascii') if encoded is not None else image_input
+        self._store(key, result)
+        return result
+
+    def _shrink(self, raw: bytes, width: Optional[int], height: Optional[int]) -> Optional[bytes]:
+        """缩小并重新编码，结果不比原图小时返回 None"""
+        Image, ImageOps = _pil()
+        with Image.open(io.BytesIO(raw)) as image:
+            # EXIF 方向为 5-8 时图像需要旋转 90 度，目标尺寸按旋转后的宽高计算
+            transposed = image.getexif().get(0x0112) in (5, 6, 7, 8)
+            oriented = image.size[::-1] if transposed else image.size
+            size = target_size(oriented, width, height, self.max_edge)
+            # JPEG 在解码时直接按 1/2、1/4、1/8 缩小，大图的解码耗时随之下降
+            image.draft('RGB', size[::-1] if transposed else size)
+            # 重新编码会丢失 EXIF，先按方向信息旋转
+            image = ImageOps.exif_transpose(image)
+            size = target_size(image.size, width, height, self.max_edge)
+            if size != image.size:
+                image = image.resize(size, Image.LANCZOS)
+            output = io.BytesIO()
+            if _has_alpha(image):
+                image.save(output, format='PNG', optimize=True)
+            else:
+                image.convert('RGB').save(output, format='JPEG', quality=self.quality, optimize=True)
+        encoded = output.getvalue()
+        return encoded if len(encoded) < len(raw) else None
+
+    def _store(self, key: str, value: str) -> None:
+        size = len(key) + len(value)
+        if size > self.cache_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.cache_bytes:
+                old_key, old_value = self._entries.popitem(last=False)
+                self._bytes -= len(old_key) + len(old_value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+# 进程级共享实例；预处理有损，默认关闭
+image_preprocessor = ImagePreprocessor(
+    enabled=os.getenv('DREAMAI_IMAGE_PREPROCESS', 'off').lower() not in ('', 'off', 'none', 'false', '0'),
+    max_edge=_env_int('DREAMAI_IMAGE_MAX_EDGE', 2016),
+    quality=_env_int('DREAMAI_IMAGE_QUALITY', 90),
+    cache_bytes=_env_int('DREAMAI_IMAGE_CACHE_BYTES', 64 * 1024 * 1024),
+)
@@ -0,0 +1,184 @@
+"""
+多凭证密钥池
+
+除主凭证外，provider 可额外配置多组火山引擎凭证（"AccessKey,SecretKey[,权重]"，多组之间用分号或换行分隔）。
+提交任务时按「进行中任务最少」或「平滑加权轮询」选择凭证，被限流的凭证自动冷却并切换到
+下一组；每个 task_id 固定到创建它的凭证，查询结果时路由回同一账号。
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Mapping
+
+from utils.async_client import AsyncVisualClient, background_loop, get_async_client
+from utils.client_pool import credential_fingerprint
+from utils.credential_check import auth_error, credential_validator
+from utils.rate_limit import TaskSlots, is_throttled, rate_limiter
+from utils.submit_queue import INTERACTIVE, submission_scheduler
+from utils.task_journal import task_journal
+
+STRATEGIES = ('least_outstanding', 'weighted_round_robin')
+
+
+@dataclass(frozen=True)
+class ApiKey:
+    access_key: str
+    secret_key: str
+    weight: int = 1
+
+    @property
+    def fingerprint(self) -> str:
+        return credential_fingerprint(self.access_key, self.secret_key)
+
+
+def parse_api_keys(credentials: Mapping[str, Any]) -> list[ApiKey]:
+    """
+    从 provider 凭证解析密钥池，主凭证排在首位
+
+    :raises ValueError: 额外凭证格式不正确
+    """
+    keys = []
+    access_key = credentials.get('volcengine_access_key')
+    secret_key = credentials.get('volcengine_secret_key')
+    if access_key and secret_key:
+        keys.append(ApiKey(access_key, secret_key))
+
+    extra = (credentials.get('volcengine_extra_credentials') or '').replace(';', '\n')
+    entries = [entry.strip() for entry in extra.splitlines() if entry.strip()]
+    for index, entry in enumerate(entries, 1):
+        parts = [part.strip() for part in entry.split(',')]
+        if len(parts) not in (2, 3) or not parts[0] or not parts[1]:
+            raise ValueError(f"Invalid extra credential #{index}, expected 'AccessKey,SecretKey[,weight]'")
+        try:
+            weight = int(parts[2]) if len(parts) == 3 else 1
+        except ValueError:
+            weight = 0
+        if weight < 1:
+            raise ValueError(f"Invalid weight in extra credential #{index}, expected a positive integer")
+        keys.append(ApiKey(parts[0], parts[1], weight))
+
+    # 重复配置的凭证只保留第一组
+    unique = OrderedDict()
+    for key in keys:
+        unique.setdefault(key.fingerprint, key)
+    return list(unique.values())
+
+
+class KeyPool:
+    """凭证选择、冷却与 task_id 固定，状态按凭证指纹在进程内共享"""
+
+    def __init__(self, slots: TaskSlots, cooldown: float = 30.0, max_cooldown: float = 600.0,
+                 max_pins: int = 10000):
+        self._slots = slots
+        self._cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self._max_pins = max_pins
+        self._cooling: dict[str, tuple[float, int]] = {}
+        self._current_weights: dict[str, float] = {}
+        self._pins: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def select(self, keys: list[ApiKey], strategy: str = 'least_outstanding') -> ApiKey:
+        """选择一组凭证；全部在冷却中时选择最早恢复的一组"""
+        now = time.monotonic()
+        with self._lock:
+            available = [key for key in keys if self._cooling.get(key.fingerprint, (0.0, 0))[0] <= now]
+            if not available:
+                return min(keys, key=lambda key: self._cooling[key.fingerprint][0])
+            if strategy == 'weighted_round_robin':
+                return self._weighted_round_robin(available)
+        # 按权重归一化的进行中任务数最少者优先，相同时保持配置顺序
+        return min(available, key=lambda key: self._slots.outstanding(key.fingerprint) / key.weight)
+
+    def _weighted_round_robin(self, keys: list[ApiKey]) -> ApiKey:
+        # 平滑加权轮询：每轮各凭证累加自身权重，选中者减去总权重
+        total = sum(key.weight for key in keys)
+        for key in keys:
+            self._current_weights[key.fingerprint] = self._current_weights.get(key.fingerprint, 0.0) + key.weight
+        chosen = max(keys, key=lambda key: self._current_weights[key.fingerprint])
+        self._current_weights[chosen.fingerprint] -= total
+        return chosen
+
+    def cool_down(self, fingerprint: str) -> float:
+        """凭证被限流，冷却时间随连续限流次数翻倍，返回冷却秒数"""
+        with self._lock:
+            _, strikes = self._cooling.get(fingerprint, (0.0, 0))
+            duration = min(self._cooldown * (2 ** strikes), self._max_cooldown)
+            self._cooling[fingerprint] = (time.monotonic() + duration, strikes + 1)
+            return duration
+
+    def recover(self, fingerprint: str) -> None:
+        with self._lock:
+            self._cooling.pop(fingerprint, None)
+
+    def cooling_down(self, fingerprint: str) -> bool:
+        with self._lock:
+            return self._cooling.get(fingerprint, (0.0, 0))[0] > time.monotonic()
+
+    def pin(self, task_id: str, fingerprint: str) -> None:
+        with self._lock:
+            self._pins[task_id] = fingerprint
+            self._pins.move_to_end(task_id)
+            while len(self._pins) > self._max_pins:
+                self._pins.popitem(last=False)
+
+    def key_for_task(self, keys: list[ApiKey], task_id: str) -> ApiKey:
+        """创建该任务的凭证：先查进程内记录，再查任务日志，都没有时使用主凭证"""
+        with self._lock:
+            fingerprint = self._pins.get(task_id)
+        if fingerprint is None and len(keys) > 1:
+            record = task_journal.get(task_id)
+            fingerprint = record['credential'] if record else None
+        for key in keys:
+            if key.fingerprint == fingerprint:
+                return key
+        return keys[0]
+
+    def submit(self, credentials: Mapping[str, Any], form_data: dict, priority: str = INTERACTIVE,
+               api: str = 'CVSync2AsyncSubmitTask') -> dict:
+        """
+        按策略选择凭证提交任务，被限流时冷却该凭证并换下一组重试，鉴权失败时换下一组
+
+        单组凭证内的限流重试由 rate_limiter 完成，这里只在重试耗尽后切换凭证。
+        提交前按 priority 经过 submission_scheduler 排队，排队被拒绝时不冷却任何凭证。
+        api 为提交接口，动作模仿等 CVProcess 任务传入 'CVProcess' 与 cv_submit_task 请求体。
+        """
+        keys = parse_api_keys(credentials)
+        return submission_scheduler.submit(keys[0].fingerprint, priority,
+                                           lambda: self._submit(credentials, keys, form_data, api),
+                                           weight=len(keys))
+
+    def _submit(self, credentials: Mapping[str, Any], keys: list[ApiKey], form_data: dict, api: str) -> dict:
+        strategy = credentials.get('key_selection')
+        if strategy not in STRATEGIES:
+            strategy = 'least_outstanding'
+        # 已验证为无效的凭证不参与选择；全部无效时仍照常提交，返回接口的真实错误
+        candidates = [key for key in keys if not credential_validator.is_invalid(key.fingerprint)] or list(keys)
+        response: dict = {}
+        while candidates:
+            key = self.select(candidates, strategy)
+            candidates.remove(key)
+            client = get_async_client(key.access_key, key.secret_key)
+            response = background_loop.run(client.json_api(api, form_data))
+            credential_validator.record(key.fingerprint, response)
+            if is_throttled(response):
+                self.cool_down(key.fingerprint)
+                continue
+            if auth_error(response):
+                continue
+            self.recover(key.fingerprint)
+            task_id = (response.get('data') or {}).get('task_id')
+            if task_id:
+                self.pin(task_id, key.fingerprint)
+            break
+        return response
+
+    def client_for_task(self, credentials: Mapping[str, Any], task_id: str) -> AsyncVisualClient:
+        """获取创建该任务的凭证对应的异步客户端"""
+        key = self.key_for_task(parse_api_keys(credentials), task_id)
+        return get_async_client(key.access_key, key.secret_key)
+
+
+# 进程级共享实例，进行中任务数来自 rate_limiter 的并发名额记录
+key_pool = KeyPool(rate_limiter.slots)
@@ -0,0 +1,356 @@
+"""
+调用级的分阶段计时与指标导出
+
+每次工具调用由 InvocationTimer 记录各阶段耗时，按工具名与 req_key 汇总到进程级的 metrics：
+- build：构建请求参数
+- preflight：提交前检查参考链接
+- submit：提交任务的往返时间（含限流等待与限流重试）
+- queue_wait / generation：排队与生成耗时，由轮询观察到的状态变化估算，精度受查询间隔限制
+- delivery：结果下载、解码与输出
+- total：整个调用
+另外记录每次调用的查询次数、输出的字节数与调用结果，异步客户端的每个接口请求记录往返时间与响应字节数。
+
+- metrics.render() 输出 Prometheus 文本格式；设置 DREAMAI_METRICS_PORT 后在该端口提供 /metrics
+- 安装了 opentelemetry-api 时每次调用同时记录为一个 span，各阶段为子 span；未配置 SDK 时为空操作
+"""
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# 覆盖从毫秒级接口请求到十分钟级视频生成的耗时
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+POLL_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[Any]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """按标签累加的计数器"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(tuple(str(labels.get(name, '')) for name in self.labelnames), 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}" for key, value in items]
+
+
+class Histogram:
+    """按标签分桶统计的直方图"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各桶计数..., 总和, 总数]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels: Any) -> int:
+        state = self._values.get(tuple(str(labels.get(name, '')) for name in self.labelnames))
+        return state[-1] if state else 0
+
+    def sum(self, **labels: Any) -> float:
+        state = self._values.get(tuple(str(labels.get(name, '')) for name in self.labelnames))
+        return state[-2] if state else 0.0
+
+    def totals(self) -> dict[tuple, tuple[float, int]]:
+        """各标签组合的 (总和, 总数)，标签按 labelnames 的顺序排列"""
+        with self._lock:
+            return {key: (state[-2], state[-1]) for key, state in self._values.items()}
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            for bound, count in zip(self.buckets + (float('inf'),), state[:len(self.buckets)] + [state[-1]]):
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程级指标集合"""
+
+    def __init__(self):
+        self._metrics: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Any) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+invocations_total = metrics.counter(
+    'dreamai_invocations_total', 'Tool invocations by outcome', ('tool', 'req_key', 'outcome'))
+phase_seconds = metrics.histogram(
+    'dreamai_phase_seconds', 'Time spent in each phase of a tool invocation', ('tool', 'req_key', 'phase'))
+polls_per_invocation = metrics.histogram(
+    'dreamai_polls_per_invocation', 'Task status queries observed by one invocation', ('tool', 'req_key'),
+    buckets=POLL_BUCKETS)
+delivered_bytes_total = metrics.counter(
+    'dreamai_delivered_bytes_total', 'Result bytes delivered or stored by tool invocations', ('tool', 'req_key'))
+api_request_seconds = metrics.histogram(
+    'dreamai_api_request_seconds', 'Round-trip time of VolcEngine API requests', ('api',))
+api_response_bytes_total = metrics.counter(
+    'dreamai_api_response_bytes_total', 'Response bytes received from VolcEngine APIs', ('api',))
+api_throttled_total = metrics.counter(
+    'dreamai_api_throttled_total', 'VolcEngine API responses rejected by rate limiting', ('api',))
+circuit_transitions_total = metrics.counter(
+    'dreamai_circuit_transitions_total', 'Circuit breaker state changes', ('endpoint', 'req_key', 'state'))
+circuit_rejections_total = metrics.counter(
+    'dreamai_circuit_rejections_total', 'Submissions failed fast by an open circuit breaker', ('endpoint', 'req_key'))
+submit_queue_total = metrics.counter(
+    'dreamai_submit_queue_total', 'Submissions by priority class and scheduling outcome', ('priority', 'outcome'))
+submit_queue_wait_seconds = metrics.histogram(
+    'dreamai_submit_queue_wait_seconds', 'Time submissions spent waiting for capacity', ('priority',))
+preflight_checks_total = metrics.counter(
+    'dreamai_preflight_checks_total', 'Reference URL pre-flight checks by outcome', ('kind', 'outcome'))
+hedges_total = metrics.counter(
+    'dreamai_hedges_total', 'Hedged resubmissions of tasks stuck in the queue by outcome', ('req_key', 'outcome'))
+hedge_races_total = metrics.counter(
+    'dreamai_hedge_races_total', 'Hedged tasks by which submission finished first', ('req_key', 'winner'))
+
+
+_UNSET = object()
+_otel_tracer: Any = _UNSET
+
+
+def _tracer() -> Any:
+    """opentelemetry 的 tracer，未安装时返回 None；导入结果只检查一次"""
+    global _otel_tracer
+    if _otel_tracer is _UNSET:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            _otel_tracer = None
+        else:
+            _otel_tracer = trace.get_tracer('dreamai')
+    return _otel_tracer
+
+
+class InvocationTimer:
+    """
+    记录一次工具调用的各阶段耗时
+
+    调用方在 finally 中调用 finish()；outcome 默认 failed，成功、命中缓存或转入后台时由调用方设置。
+    """
+
+    def __init__(self, tool: str, req_key: str = ''):
+        self.tool = tool
+        self.req_key = req_key
+        self.outcome = 'failed'
+        self.polls = 0
+        self.bytes = 0
+        self.phases: dict[str, float] = {}
+        self._started_ns = time.monotonic_ns()
+        # 单调时钟到墙上时钟的偏移，用于 span 的时间戳
+        self._wall_offset_ns = time.time_ns() - self._started_ns
+        self._spans: list[tuple[str, int, int]] = []
+        self._submitted_ns: Optional[int] = None
+        self._status_ns: dict[str, int] = {}
+        self._finished = False
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started_ns = time.monotonic_ns()
+        try:
+            yield
+        finally:
+            self._add_phase(name, started_ns, time.monotonic_ns())
+
+    def _add_phase(self, name: str, started_ns: int, ended_ns: int) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + (ended_ns - started_ns) / 1e9
+        self._spans.append((name, started_ns, ended_ns))
+
+    def submitted(self) -> None:
+        """任务提交成功，之后的等待计入排队与生成"""
+        self._submitted_ns = time.monotonic_ns()
+
+    def observe_status(self, status: Optional[str]) -> None:
+        """记录一次查询到的任务状态"""
+        self.polls += 1
+        if status:
+            self._status_ns.setdefault(status, time.monotonic_ns())
+
+    def add_bytes(self, size: int) -> None:
+        self.bytes += size
+
+    def add_references(self, references: Optional[list]) -> None:
+        """累加 blob 或本地存储引用中的字节数，下载失败的引用不计入"""
+        for reference in references or []:
+            self.bytes += reference.get('size') or 0
+
+    def _derive_task_phases(self) -> None:
+        done_ns = self._status_ns.get('done')
+        if self._submitted_ns is None or done_ns is None:
+            return
+        generating_ns = self._status_ns.get('generating')
+        if generating_ns is None:
+            # 未观察到生成中状态，无法区分排队与生成，整段计入生成
+            self._add_phase('generation', self._submitted_ns, done_ns)
+            return
+        self._add_phase('queue_wait', self._submitted_ns, generating_ns)
+        self._add_phase('generation', generating_ns, done_ns)
+
+    def finish(self, outcome: Optional[str] = None) -> None:
+        """汇总到进程级指标，重复调用只记录一次"""
+        if self._finished:
+            return
+        self._finished = True
+        if outcome is not None:
+            self.outcome = outcome
+        ended_ns = time.monotonic_ns()
+        self._derive_task_phases()
+        self._add_phase('total', self._started_ns, ended_ns)
+
+        labels = {'tool': self.tool, 'req_key': self.req_key}
+        invocations_total.inc(outcome=self.outcome, **labels)
+        for name, seconds in self.phases.items():
+            phase_seconds.observe(seconds, phase=name, **labels)
+        if self._submitted_ns is not None:
+            polls_per_invocation.observe(self.polls, **labels)
+        if self.bytes:
+            delivered_bytes_total.inc(self.bytes, **labels)
+        self._export_spans()
+
+    def _export_spans(self) -> None:
+        tracer = _tracer()
+        if tracer is None:
+            return
+        try:
+            from opentelemetry import trace
+
+            offset = self._wall_offset_ns
+            spans = sorted(self._spans, key=lambda span: span[1])
+            _, started_ns, ended_ns = next(span for span in spans if span[0] == 'total')
+            root = tracer.start_span(f"dreamai.{self.tool}", start_time=started_ns + offset, attributes={
+                'dreamai.tool': self.tool,
+                'dreamai.req_key': self.req_key,
+                'dreamai.outcome': self.outcome,
+                'dreamai.polls': self.polls,
+                'dreamai.bytes': self.bytes,
+            })
+            context = trace.set_span_in_context(root)
+            for name, phase_started_ns, phase_ended_ns in spans:
+                if name == 'total':
+                    continue
+                span = tracer.start_span(f"dreamai.{name}", context=context, start_time=phase_started_ns + offset)
+                span.end(end_time=phase_ended_ns + offset)
+            root.end(end_time=ended_ns + offset)
+        except Exception as e:
+            logger.warning("failed to export spans: %s", e)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = metrics
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        payload = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_metrics(port: Optional[int] = None, host: str = '0.0.0.0') -> Optional[ThreadingHTTPServer]:
+    """在后台线程中提供 /metrics；未指定端口时读取 DREAMAI_METRICS_PORT，均未设置时返回 None"""
+    if port is None:
+        try:
+            port = int(os.getenv('DREAMAI_METRICS_PORT') or 0)
+        except ValueError:
+            logger.warning("invalid DREAMAI_METRICS_PORT: %s", os.getenv('DREAMAI_METRICS_PORT'))
+            return None
+        if not port:
+            return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='dreamai-metrics', daemon=True).start()
+    return server
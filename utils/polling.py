@@ -0,0 +1,261 @@
+"""
+异步任务轮询调度
+
+根据任务状态（in_queue / generating）、req_key 所属的模型族以及历史完成耗时，
+计算下一次查询任务结果前的等待时间，替代各工具中固定的 time.sleep(5)。
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class PollPolicy:
+    """某一类任务的轮询参数（单位：秒）"""
+    first_delay: float   # 提交后首次查询前的等待时间
+    min_interval: float  # 两次查询的最小间隔
+    max_interval: float  # 两次查询的最大间隔
+    backoff: float       # 指数退避倍数
+    jitter: float        # 抖动比例，0.2 表示 ±20%
+    timeout: float       # 最长轮询时间
+    typical_duration: float = 0.0  # 无历史数据时预估的提交到完成耗时
+
+
+# 图片任务通常几秒即可完成，视频任务需要数分钟
+DEFAULT_POLICIES = {
+    'image': PollPolicy(first_delay=2.0, min_interval=1.0, max_interval=8.0, backoff=1.5, jitter=0.2, timeout=300,
+                        typical_duration=15.0),
+    'video': PollPolicy(first_delay=15.0, min_interval=3.0, max_interval=30.0, backoff=1.6, jitter=0.2, timeout=600,
+                        typical_duration=120.0),
+}
+
+_VIDEO_MARKERS = ('t2v', 'i2v', 'video', 'motion')
+
+
+def req_key_family(req_key: str) -> str:
+    """根据 req_key 判断任务所属模型族：image 或 video"""
+    req_key = (req_key or '').lower()
+    if any(marker in req_key for marker in _VIDEO_MARKERS):
+        return 'video'
+    return 'image'
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def get_policy(req_key: str) -> PollPolicy:
+    """
+    获取 req_key 对应的轮询参数
+
+    可通过环境变量覆盖，例如 DREAMAI_POLL_IMAGE_FIRST_DELAY=1.5、
+    DREAMAI_POLL_VIDEO_MAX_INTERVAL=20。
+    """
+    family = req_key_family(req_key)
+    policy = DEFAULT_POLICIES[family]
+    overrides = {}
+    for field in ('first_delay', 'min_interval', 'max_interval', 'backoff', 'jitter', 'timeout', 'typical_duration'):
+        value = _env_float(f"DREAMAI_POLL_{family.upper()}_{field.upper()}")
+        if value is not None:
+            overrides[field] = value
+    return replace(policy, **overrides) if overrides else policy
+
+
+class LatencyHistory:
+    """按 req_key 记录最近完成任务的排队耗时与总耗时"""
+
+    def __init__(self, max_samples: int = 200):
+        self._max_samples = max_samples
+        self._samples: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, req_key: str, queue_seconds: float, total_seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(req_key)
+            if samples is None:
+                samples = self._samples[req_key] = deque(maxlen=self._max_samples)
+            samples.append((max(queue_seconds, 0.0), max(total_seconds, 0.0)))
+
+    def preload(self, samples: list[tuple[str, float]]) -> None:
+        """用持久化的历史总耗时预热尚无样本的 req_key"""
+        with self._lock:
+            known = set(self._samples)
+        for req_key, total_seconds in samples:
+            if req_key not in known:
+                self.record(req_key, total_seconds, total_seconds)
+
+    def count(self, req_key: str) -> int:
+        with self._lock:
+            return len(self._samples.get(req_key, ()))
+
+    def _quantile(self, req_key: str, index: int, quantile: float) -> Optional[float]:
+        with self._lock:
+            samples = self._samples.get(req_key)
+            if not samples:
+                return None
+            values = sorted(sample[index] for sample in samples)
+        position = min(int(quantile * len(values)), len(values) - 1)
+        return values[position]
+
+    def total_quantile(self, req_key: str, quantile: float = 0.5) -> Optional[float]:
+        """历史总耗时（提交到完成）的分位数，无样本时返回 None"""
+        return self._quantile(req_key, 1, quantile)
+
+    def queue_quantile(self, req_key: str, quantile: float = 0.5) -> Optional[float]:
+        """历史排队耗时的分位数，无样本时返回 None"""
+        return self._quantile(req_key, 0, quantile)
+
+
+# 进程级共享的耗时历史
+latency_history = LatencyHistory()
+
+
+def predict_time_to_done(req_key: str, elapsed: float = 0.0, history: Optional[LatencyHistory] = None,
+                         quantile: float = 0.8) -> float:
+    """
+    预测任务从现在起到完成还需的时间
+
+    优先使用该 req_key 历史总耗时的分位数，无历史数据时使用模型族的典型耗时。
+    """
+    history = history or latency_history
+    expected = history.total_quantile(req_key, quantile)
+    if expected is None:
+        expected = get_policy(req_key).typical_duration
+    return max(expected - elapsed, 0.0)
+
+
+class Deadline:
+    """
+    一次工具调用的时间预算
+
+    Dify 对单次插件请求有超时限制（main.py 中的 MAX_REQUEST_TIMEOUT），预计无法在预算内完成的
+    任务应尽早返回 task_id，由后台继续跟踪，之后通过 cv_get_result 取回结果。
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        # 未指定时使用默认预算，0 或负数表示不限制
+        seconds = DEFAULT_DEADLINE_SECONDS if seconds is None else float(seconds)
+        self.seconds = seconds if seconds > 0 else None
+        self.started_at = time.monotonic()
+
+    @property
+    def remaining(self) -> float:
+        if self.seconds is None:
+            return float('inf')
+        return max(self.seconds - (time.monotonic() - self.started_at), 0.0)
+
+    def poll_timeout(self, req_key: str) -> float:
+        """轮询时长上限：取模型族轮询时长与剩余预算中较小者"""
+        return min(get_policy(req_key).timeout, self.remaining)
+
+    def exceeded_by(self, schedule: 'PollSchedule') -> Optional[float]:
+        """预计完成时间超出剩余预算时返回预计剩余耗时，否则返回 None"""
+        eta = predict_time_to_done(schedule.req_key, schedule.elapsed, schedule.history)
+        return eta if eta > self.remaining else None
+
+
+def _default_deadline() -> float:
+    value = _env_float('DREAMAI_DEADLINE_SECONDS')
+    return value if value is not None else 100.0
+
+
+# 工具未指定 deadline_seconds 时的默认预算，需小于 MAX_REQUEST_TIMEOUT；0 表示不限制
+DEFAULT_DEADLINE_SECONDS = _default_deadline()
+
+
+class PollSchedule:
+    """
+    单个任务的轮询计划
+
+    用法：
+        schedule = PollSchedule(req_key)
+        for attempt in schedule:
+            status = ...  # 查询任务状态
+            schedule.update(status)
+            if status == 'done':
+                schedule.finish()
+                break
+    """
+
+    def __init__(self, req_key: str, policy: Optional[PollPolicy] = None,
+                 history: Optional[LatencyHistory] = None, timeout: Optional[float] = None):
+        self.req_key = req_key
+        self.policy = policy or get_policy(req_key)
+        self.history = history or latency_history
+        self.timeout = timeout if timeout is not None else self.policy.timeout
+        self.started_at = time.monotonic()
+        self.attempt = 0
+        self.status: Optional[str] = None
+        self.queue_seconds: Optional[float] = None
+        self._interval = self.policy.min_interval
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def remaining(self) -> float:
+        return max(self.timeout - self.elapsed, 0.0)
+
+    def expired(self) -> bool:
+        return self.elapsed >= self.timeout
+
+    def update(self, status: Optional[str]) -> None:
+        """记录最近一次查询到的任务状态"""
+        if status != self.status:
+            # 状态切换后退避从最小间隔重新开始
+            self._interval = self.policy.min_interval
+            if status in ('generating', 'done') and self.queue_seconds is None:
+                self.queue_seconds = self.elapsed
+        self.status = status
+
+    def finish(self) -> None:
+        """任务完成，记录耗时供后续任务估算"""
+        total = self.elapsed
+        queue = self.queue_seconds if self.queue_seconds is not None else total
+        self.history.record(self.req_key, queue, total)
+
+    def _predicted_remaining(self) -> Optional[float]:
+        expected = self.history.total_quantile(self.req_key, 0.5)
+        if expected is None:
+            return None
+        return expected - self.elapsed
+
+    def next_delay(self) -> float:
+        """计算下一次查询前的等待时间"""
+        policy = self.policy
+        predicted = self._predicted_remaining()
+
+        if self.attempt == 0:
+            delay = policy.first_delay
+            if predicted is not None:
+                # 有历史数据时，在预计完成时间附近进行首次查询
+                delay = min(max(predicted, policy.min_interval), max(policy.first_delay, policy.max_interval))
+        elif self.status == 'generating' and predicted is not None and predicted > policy.min_interval:
+            # 生成中：直接等待到预计完成时间，但不超过最大间隔
+            delay = min(predicted, policy.max_interval)
+        else:
+            # 排队中或已超过预计完成时间：指数退避
+            delay = self._interval
+            self._interval = min(self._interval * policy.backoff, policy.max_interval)
+
+        if policy.jitter > 0:
+            delay *= random.uniform(1 - policy.jitter, 1 + policy.jitter)
+        delay = max(delay, 0.0)
+        return min(delay, self.remaining)
+
+    def __iter__(self):
+        while not self.expired():
+            time.sleep(self.next_delay())
+            self.attempt += 1
+            yield self.attempt
@@ -0,0 +1,86 @@
+"""
+轮询进度消息的合并输出
+
+每次查询都输出一条文本消息时，十分钟的视频任务会向 Dify 推送上百条消息，
+既增加插件 IPC 的序列化开销，也让工作流日志难以阅读。ProgressReporter 只在
+任务状态变化时，或距上一条进度消息超过最小间隔时才产生消息，并可附带已等待时间与预计剩余时间。
+
+- DREAMAI_PROGRESS_INTERVAL 状态未变化时两条进度消息的最小间隔（秒），默认 30，0 表示每次查询都输出
+- DREAMAI_PROGRESS_ETA=off 不在进度消息中附带已等待时间与预计剩余时间
+"""
+import os
+import time
+from typing import Optional
+
+from utils.polling import PollSchedule, predict_time_to_done
+
+STATUS_LABELS = {
+    'in_queue': '任务排队中',
+    'generating': '任务生成中',
+}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}秒"
+    minutes, seconds = divmod(seconds, 60)
+    return f"{minutes}分{seconds}秒" if seconds else f"{minutes}分钟"
+
+
+class ProgressReporter:
+    """
+    合并轮询过程中的进度消息
+
+    用法：
+        progress = ProgressReporter(schedule)
+        for attempt, response in iter_task_results(...):
+            message = progress.update(status, attempt)
+            if message:
+                yield self.create_text_message(message)
+    """
+
+    def __init__(self, schedule: Optional[PollSchedule] = None, min_interval: Optional[float] = None,
+                 show_eta: Optional[bool] = None):
+        self.schedule = schedule
+        self.min_interval = min_interval if min_interval is not None else _env_float('DREAMAI_PROGRESS_INTERVAL', 30)
+        if show_eta is None:
+            show_eta = os.getenv('DREAMAI_PROGRESS_ETA', 'on').lower() not in ('', 'off', 'none', 'false', '0')
+        self.show_eta = show_eta
+        self.started_at = schedule.started_at if schedule is not None else time.monotonic()
+        self.status: Optional[str] = None
+        self.emitted = 0
+        self.suppressed = 0
+        self._last_emitted_at: Optional[float] = None
+
+    def update(self, status: Optional[str], attempt: int) -> Optional[str]:
+        """记录一次查询到的状态，需要输出时返回进度文本，否则返回 None"""
+        now = time.monotonic()
+        changed = status != self.status
+        self.status = status
+        if not changed and self._last_emitted_at is not None and now - self._last_emitted_at < self.min_interval:
+            self.suppressed += 1
+            return None
+        self._last_emitted_at = now
+        self.emitted += 1
+        return self.format(status, attempt, now - self.started_at)
+
+    def format(self, status: Optional[str], attempt: int, elapsed: float) -> str:
+        details = [f"第{attempt}次查询"]
+        if self.show_eta:
+            details.append(f"已等待{_format_seconds(elapsed)}")
+            if self.schedule is not None and status in STATUS_LABELS:
+                eta = predict_time_to_done(self.schedule.req_key, self.schedule.elapsed, self.schedule.history,
+                                           quantile=0.5)
+                if eta > 0:
+                    details.append(f"预计还需约{_format_seconds(eta)}")
+        if status in STATUS_LABELS:
+            return f"{STATUS_LABELS[status]}... ({'，'.join(details)})"
+        return f"任务状态: {status} ({'，'.join(details)})"
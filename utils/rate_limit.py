@@ -0,0 +1,303 @@
+"""
+按凭证的限流与限流重试
+
+- 每个 access key 的提交与查询分别使用独立的令牌桶控制 QPS
+- 按 req_key 限制同时运行的任务数：提交前占用名额，查询到任务结束后释放
+- 遇到火山引擎的限流错误码（50429 QPS 超限、50430 并发超限）时按指数退避自动重试
+
+同步的 PooledVisualService 与异步的 AsyncVisualClient 在发送请求时都经过这里，
+突发流量下的硬失败因此变为稍有延迟的成功，同时保持在账号配额之内。
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, Optional
+
+from utils.metrics import api_throttled_total
+
+# 火山引擎限流错误码：50429 请求频率超限，50430 并发任务数超限
+THROTTLE_CODES = (50429, 50430)
+
+# 会创建任务或执行生成的接口计入提交配额，其余计入查询配额
+SUBMIT_APIS = ('CVSync2AsyncSubmitTask', 'CVSubmitTask', 'CVProcess')
+
+# 创建异步任务的接口，需要占用 req_key 的并发名额
+TASK_APIS = ('CVSync2AsyncSubmitTask', 'CVSubmitTask')
+
+# CVProcess 同时承载同步生成与异步任务：cv_submit_task 提交任务，cv_get_result 查询结果
+CV_PROCESS_SUBMIT = 'cv_submit_task'
+CV_PROCESS_QUERY = 'cv_get_result'
+
+TERMINAL_STATUSES = ('done', 'not_found', 'expired')
+
+
+class TokenBucket:
+    """线程安全的令牌桶，按预约方式返回需要等待的时间，同步与异步调用方均可使用"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """取走一个令牌，返回调用方需要等待的秒数；rate 不大于 0 表示不限制"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class TaskSlots:
+    """
+    按 (凭证, req_key) 限制同时运行的任务数
+
+    提交成功后名额与 task_id 绑定，查询到任务结束时释放；每次查询到任务仍在进行时续期，
+    超过 ttl 未被查询的任务自动释放，避免名额泄漏，后台长时间轮询的任务也不会提前失去名额。
+    """
+
+    def __init__(self, default_limit: int = 0, ttl: float = 900.0):
+        self.default_limit = default_limit
+        self.ttl = ttl
+        self._leases: dict[int, tuple[tuple[str, str], Optional[str], float]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def limit(self, req_key: str) -> int:
+        """req_key 的并发上限，可通过 DREAMAI_MAX_TASKS_<REQ_KEY> 单独设置，0 表示不限制"""
+        value = os.getenv(f"DREAMAI_MAX_TASKS_{req_key.upper()}")
+        try:
+            return int(value) if value else self.default_limit
+        except ValueError:
+            return self.default_limit
+
+    def try_acquire(self, fingerprint: str, req_key: str) -> Optional[int]:
+        """占用一个名额，已满时返回 None"""
+        key = (fingerprint, req_key)
+        limit = self.limit(req_key)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if limit > 0 and sum(1 for lease_key, _, _ in self._leases.values() if lease_key == key) >= limit:
+                return None
+            self._next_id += 1
+            self._leases[self._next_id] = (key, None, now + self.ttl)
+            return self._next_id
+
+    def bind(self, lease: int, task_id: str) -> None:
+        with self._lock:
+            entry = self._leases.get(lease)
+            if entry is not None:
+                self._leases[lease] = (entry[0], task_id, entry[2])
+
+    def release(self, lease: Optional[int]) -> None:
+        if lease is None:
+            return
+        with self._lock:
+            self._leases.pop(lease, None)
+
+    def release_task(self, fingerprint: str, task_id: str) -> None:
+        with self._lock:
+            for lease, (key, bound_task_id, _) in list(self._leases.items()):
+                if key[0] == fingerprint and bound_task_id == task_id:
+                    del self._leases[lease]
+
+    def refresh_task(self, fingerprint: str, task_id: str) -> None:
+        """任务仍在进行，名额从现在起重新计算 ttl"""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for lease, (key, bound_task_id, _) in list(self._leases.items()):
+                if key[0] == fingerprint and bound_task_id == task_id:
+                    self._leases[lease] = (key, bound_task_id, expires_at)
+
+    def outstanding(self, fingerprint: str) -> int:
+        """该凭证下所有 req_key 正在运行的任务数"""
+        with self._lock:
+            self._expire(time.monotonic())
+            return sum(1 for key, _, _ in self._leases.values() if key[0] == fingerprint)
+
+    def total(self) -> int:
+        """所有凭证正在运行的任务数"""
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._leases)
+
+    def running(self, fingerprint: str, req_key: str) -> int:
+        with self._lock:
+            self._expire(time.monotonic())
+            return sum(1 for key, _, _ in self._leases.values() if key == (fingerprint, req_key))
+
+    def _expire(self, now: float) -> None:
+        for lease in [lease for lease, (_, _, expires_at) in self._leases.items() if expires_at <= now]:
+            del self._leases[lease]
+
+
+def is_submission(api: str, form: dict) -> bool:
+    """是否为提交类请求；CVProcess 按 req_key 区分，只有 cv_get_result 是查询"""
+    if api == 'CVProcess':
+        return form.get('req_key') != CV_PROCESS_QUERY
+    return api in SUBMIT_APIS
+
+
+def task_req_key(api: str, form: dict) -> Optional[str]:
+    """创建异步任务的请求占用哪个 req_key 的并发名额，不创建任务时返回 None"""
+    if api in TASK_APIS:
+        return form.get('req_key', '')
+    if api == 'CVProcess' and form.get('req_key') == CV_PROCESS_SUBMIT:
+        # 实际的 req_key 在 task_type 中
+        return form.get('task_type', '')
+    return None
+
+
+def is_throttled(response: Any) -> bool:
+    return isinstance(response, dict) and response.get('code') in THROTTLE_CODES
+
+
+class RateLimiter:
+    """按凭证限流并在限流错误时退避重试"""
+
+    def __init__(self, submit_qps: float = 5.0, submit_burst: float = 10.0, query_qps: float = 20.0,
+                 query_burst: float = 40.0, max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 16.0,
+                 slot_wait: float = 60.0, slots: Optional[TaskSlots] = None):
+        self.submit_qps = submit_qps
+        self.submit_burst = submit_burst
+        self.query_qps = query_qps
+        self.query_burst = query_burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.slot_wait = slot_wait
+        self.slots = slots or TaskSlots()
+        self._buckets: dict[tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, fingerprint: str, kind: str) -> TokenBucket:
+        key = (fingerprint, kind)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    if kind == 'submit':
+                        bucket = TokenBucket(self.submit_qps, self.submit_burst)
+                    else:
+                        bucket = TokenBucket(self.query_qps, self.query_burst)
+                    self._buckets[key] = bucket
+        return bucket
+
+    def retry_delay(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（指数退避，附带抖动）"""
+        delay = min(self.base_delay * (2 ** attempt), self.max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    def call(self, fingerprint: str, api: str, form: dict, send: Callable[[], dict]) -> dict:
+        """同步发送请求"""
+        kind = 'submit' if is_submission(api, form) else 'query'
+        lease = None
+        slot_key = task_req_key(api, form)
+        if slot_key is not None:
+            deadline = time.monotonic() + self.slot_wait
+            lease = self.slots.try_acquire(fingerprint, slot_key)
+            while lease is None and time.monotonic() < deadline:
+                time.sleep(0.2)
+                lease = self.slots.try_acquire(fingerprint, slot_key)
+            if lease is None:
+                return self._slots_exhausted(slot_key)
+        try:
+            attempt = 0
+            while True:
+                time.sleep(self.bucket(fingerprint, kind).reserve())
+                response = send()
+                if not is_throttled(response):
+                    break
+                api_throttled_total.inc(api=api)
+                if attempt >= self.max_retries:
+                    break
+                time.sleep(self.retry_delay(attempt))
+                attempt += 1
+        except Exception:
+            self.slots.release(lease)
+            raise
+        self._settle(fingerprint, api, form, lease, response)
+        return response
+
+    async def call_async(self, fingerprint: str, api: str, form: dict,
+                         send: Callable[[], Awaitable[dict]]) -> dict:
+        """在事件循环中发送请求，等待期间不阻塞其他任务"""
+        kind = 'submit' if is_submission(api, form) else 'query'
+        lease = None
+        slot_key = task_req_key(api, form)
+        if slot_key is not None:
+            deadline = time.monotonic() + self.slot_wait
+            lease = self.slots.try_acquire(fingerprint, slot_key)
+            while lease is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+                lease = self.slots.try_acquire(fingerprint, slot_key)
+            if lease is None:
+                return self._slots_exhausted(slot_key)
+        try:
+            attempt = 0
+            while True:
+                await asyncio.sleep(self.bucket(fingerprint, kind).reserve())
+                response = await send()
+                if not is_throttled(response):
+                    break
+                api_throttled_total.inc(api=api)
+                if attempt >= self.max_retries:
+                    break
+                await asyncio.sleep(self.retry_delay(attempt))
+                attempt += 1
+        except Exception:
+            self.slots.release(lease)
+            raise
+        self._settle(fingerprint, api, form, lease, response)
+        return response
+
+    def _settle(self, fingerprint: str, api: str, form: dict, lease: Optional[int], response: dict) -> None:
+        """提交成功时把名额绑定到 task_id，任务进行中时续期名额，任务结束时释放名额"""
+        data = response.get('data') if isinstance(response, dict) else None
+        data = data if isinstance(data, dict) else {}
+        if lease is not None:
+            if response.get('code') == 10000 and data.get('task_id'):
+                self.slots.bind(lease, data['task_id'])
+            else:
+                self.slots.release(lease)
+        elif not is_submission(api, form) and form.get('task_id') and data.get('status') in TERMINAL_STATUSES:
+            self.slots.release_task(fingerprint, form['task_id'])
+        elif not is_submission(api, form) and form.get('task_id') and data.get('status'):
+            self.slots.refresh_task(fingerprint, form['task_id'])
+
+    def _slots_exhausted(self, req_key: str) -> dict:
+        return {
+            'code': 50430,
+            'message': f"Too many running tasks for {req_key}, please retry later",
+            'data': None,
+        }
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+# 进程级共享实例，配额可通过环境变量调整
+rate_limiter = RateLimiter(
+    submit_qps=_env_float('DREAMAI_SUBMIT_QPS', 5),
+    submit_burst=_env_float('DREAMAI_SUBMIT_BURST', 10),
+    query_qps=_env_float('DREAMAI_QUERY_QPS', 20),
+    query_burst=_env_float('DREAMAI_QUERY_BURST', 40),
+    max_retries=int(_env_float('DREAMAI_THROTTLE_RETRIES', 4)),
+    slots=TaskSlots(default_limit=int(_env_float('DREAMAI_MAX_TASKS', 0))),
+)
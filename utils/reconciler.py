@@ -0,0 +1,86 @@
+"""
+孤儿任务补偿轮询
+
+插件重启后，任务日志中由之前进程提交、尚未结束的任务会在对应凭证首次出现时
+（日志只保存凭证指纹）交给共享轮询器在后台继续轮询；调用方轮询超时的任务也会被接管，
+结果写回任务日志，之后可通过 cv_get_result 取回。
+预计无法在调用时间预算内完成的任务同样提前交给后台，工具直接返回任务句柄。
+"""
+import threading
+import time
+from typing import Optional
+
+from utils.async_client import AsyncVisualClient, get_async_client
+from utils.client_pool import credential_fingerprint
+from utils.polling import PollSchedule, latency_history, predict_time_to_done
+from utils.task_journal import TaskJournal, task_journal
+from utils.task_poller import SharedPoller, shared_poller
+
+_PROCESS_STARTED_AT = time.time()
+
+
+class TaskReconciler:
+    """按凭证恢复未完成任务的后台轮询"""
+
+    def __init__(self, journal: TaskJournal, poller: SharedPoller, timeout: float = 3600):
+        self._journal = journal
+        self._poller = poller
+        self._timeout = timeout
+        self._seen: set[str] = set()
+        self._preloaded = False
+        self._lock = threading.Lock()
+
+    def reconcile(self, access_key: str, secret_key: str) -> None:
+        """凭证在本进程首次出现时，在后台恢复其之前提交的未完成任务"""
+        fingerprint = credential_fingerprint(access_key, secret_key)
+        with self._lock:
+            if fingerprint in self._seen or not self._journal.enabled:
+                return
+            self._seen.add(fingerprint)
+            preload, self._preloaded = not self._preloaded, True
+        if preload:
+            # 用日志中已完成任务的耗时预热耗时模型，重启后也能预测完成时间
+            latency_history.preload(self._journal.completed_durations())
+        threading.Thread(target=self._resume_pending, args=(access_key, secret_key, fingerprint),
+                         name='dreamai-reconciler', daemon=True).start()
+
+    def _resume_pending(self, access_key: str, secret_key: str, fingerprint: str) -> None:
+        records = self._journal.pending(fingerprint, submitted_before=_PROCESS_STARTED_AT)
+        if not records:
+            return
+        client = get_async_client(access_key, secret_key)
+        for record in records:
+            self.adopt(client, record['req_key'], record['task_id'], record['req_json'])
+
+    def adopt(self, client: AsyncVisualClient, req_key: str, task_id: str, req_json: Optional[str] = None,
+              schedule: Optional[PollSchedule] = None) -> None:
+        """
+        接管任务的后续轮询，直至任务结束或超过补偿时长
+
+        :param schedule: 调用方原来的轮询计划；沿用其开始时间与已观察到的状态，记录的耗时从提交时算起
+        """
+        adopted = PollSchedule(req_key, timeout=self._timeout)
+        if schedule is not None:
+            adopted.started_at = schedule.started_at
+            adopted.attempt = schedule.attempt
+            adopted.status = schedule.status
+            adopted.queue_seconds = schedule.queue_seconds
+            adopted.timeout = schedule.elapsed + self._timeout
+        self._poller.watch_detached(client, req_key, task_id, req_json, adopted)
+
+    def detach(self, client: AsyncVisualClient, req_key: str, task_id: str, req_json: Optional[str] = None,
+               schedule: Optional[PollSchedule] = None, eta_seconds: Optional[float] = None) -> dict:
+        """转入后台跟踪并返回任务句柄，可交给 cv_get_result 取回结果"""
+        self.adopt(client, req_key, task_id, req_json, schedule)
+        if eta_seconds is None:
+            elapsed = schedule.elapsed if schedule is not None else 0.0
+            eta_seconds = predict_time_to_done(req_key, elapsed)
+        return {
+            "task_id": task_id,
+            "req_key": req_key,
+            "req_json": req_json,
+            "eta_seconds": round(eta_seconds, 1),
+        }
+
+
+task_reconciler = TaskReconciler(task_journal, shared_poller)
@@ -0,0 +1,187 @@
+"""
+各工具的请求构建
+
+把工具参数转换为提交接口的 form_data 与查询时使用的 req_json，
+供单次调用的工具与批量工具共用；参数不合法时抛出 ValueError。
+
+各 req_key 的参数规则以 RequestSpec 声明，类型、默认值与范围取自工具 YAML（见 utils/request_schema.py）；
+新增模型版本只需在对应工具的 variants 中增加一项。
+"""
+from typing import Any, Optional
+
+from utils.request_schema import OMIT, Field, Group, RequestSpec, ToolSchema
+
+PROMPT = Field('prompt')
+SEED = Field('seed', kind='int', skip=(-1,), default=OMIT)
+USE_PRE_LLM = Field('use_pre_llm', kind='bool')
+USE_SR = Field('use_sr', kind='bool')
+RETURN_URL = Field('return_url', kind='bool')
+
+# 查询时传递的水印参数
+LOGO_INFO = Group('logo_info', enabled_by='add_logo', constants={'add_logo': True}, fields=(
+    Field('position', kind='int'),
+    Field('language', kind='int'),
+    Field('opacity', kind='float'),
+    Field('logo_text_content', kind='str'),
+))
+
+IMAGE_REQ_JSON = (RETURN_URL, LOGO_INFO)
+
+
+def _text_to_image_spec(req_key: str, label: str, *fields: Field) -> RequestSpec:
+    return RequestSpec(req_key, label, (PROMPT, SEED, Field('width', kind='int'), Field('height', kind='int'),
+                                        USE_PRE_LLM, USE_SR, RETURN_URL, *fields), req_json=IMAGE_REQ_JSON)
+
+
+TEXT_TO_IMAGE = ToolSchema('text_to_image', selector='model_version', default='3.1', variants={
+    '3.0': _text_to_image_spec('jimeng_t2i_v30', '3.0'),
+    '3.1': _text_to_image_spec('jimeng_t2i_v31', '3.1'),
+    'doubao_3.0': _text_to_image_spec('high_aes_general_v30l_zt2i', 'Doubao 3.0',
+                                      Field('scale', kind='float', default=2.5, min=1.0, max=10.0)),
+    '4.0': RequestSpec('jimeng_t2i_v40', '4.0', (
+        PROMPT,
+        SEED,
+        # 参考图链接，多个链接用换行分割
+        Field('image_urls', kind='lines'),
+        Field('size', kind='int', skip=(0,), default=OMIT),
+        Field('width', kind='int', default=OMIT),
+        Field('height', kind='int', default=OMIT),
+        USE_PRE_LLM,
+        USE_SR,
+        RETURN_URL,
+        Field('scale', kind='float', default=0.5, min=0.0, max=1.0),
+        Field('force_single', kind='bool'),
+        Field('min_ratio', kind='float', default=OMIT),
+        Field('max_ratio', kind='float', default=OMIT),
+    ), together=(('width', 'height'),), req_json=IMAGE_REQ_JSON),
+})
+
+IMAGE_TO_IMAGE = ToolSchema('image_to_image', default='jimeng_i2i_v30', variants={
+    # 即梦图生图3.0智能参考
+    'jimeng_i2i_v30': RequestSpec('jimeng_i2i_v30', 'image-to-image 3.0', (
+        PROMPT,
+        # 图片输入：binary_data_base64 和 image_urls 二选一
+        Field('image_input', kind='image'),
+        SEED,
+        Field('scale', kind='float'),
+        Field('width', kind='int', default=OMIT),
+        Field('height', kind='int', default=OMIT),
+        USE_PRE_LLM,
+        USE_SR,
+        RETURN_URL,
+    ), together=(('width', 'height'),), req_json=IMAGE_REQ_JSON),
+})
+
+TEXT_TO_VIDEO = ToolSchema('text_to_video', selector='req_key', default='jimeng_t2v_v30', variants={
+    req_key: RequestSpec(req_key, req_key, (PROMPT, SEED, Field('frames', kind='int'), Field('aspect_ratio')))
+    for req_key in ('jimeng_t2v_v30', 'jimeng_t2v_v30_1080p')
+})
+
+
+def _video_generation_spec(req_key: str, label: str) -> RequestSpec:
+    return RequestSpec(req_key, label, (
+        PROMPT,
+        SEED,
+        Field('duration', kind='int'),
+        Field('fps', kind='int'),
+        Field('aspect_ratio'),
+        Field('motion_strength'),
+        Field('camera_motion'),
+        Field('reference_image', default=OMIT),
+        # 参考强度只在提供参考图像时生效
+        Field('reference_strength', kind='float', requires='reference_image'),
+        USE_PRE_LLM,
+        RETURN_URL,
+    ))
+
+
+VIDEO_GENERATION = ToolSchema('video_generation', selector='video_quality', default='pro', variants={
+    'pro': _video_generation_spec('jimeng_video_v30_pro_L', 'Video 3.0 Pro'),
+    '720p': _video_generation_spec('jimeng_video_v30_720p_L', 'Video 3.0 720P'),
+    '1080p': _video_generation_spec('jimeng_video_v30_1080p_L', 'Video 3.0 1080P'),
+})
+
+MOTION_IMITATION = ToolSchema('motion_imitation', default='jimeng_motion_imitation_L', variants={
+    'jimeng_motion_imitation_L': RequestSpec('jimeng_motion_imitation_L', 'motion imitation', (
+        Field('source_image'),
+        Field('motion_video'),
+        SEED,
+        Field('duration', kind='int'),
+        Field('fps', kind='int'),
+        Field('aspect_ratio'),
+        Field('motion_strength', kind='float'),
+        Field('face_fidelity', kind='float'),
+        Field('body_fidelity', kind='float'),
+        Field('preserve_background', kind='bool'),
+        Field('smoothness', kind='float'),
+        RETURN_URL,
+    )),
+})
+
+SYNC_TEXT_TO_IMAGE = ToolSchema('sync_text_to_image', default='jimeng_high_aes_general_v21_L', variants={
+    # 即梦AI-文生图2.1，水印与 AIGC 元数据直接写入提交参数
+    'jimeng_high_aes_general_v21_L': RequestSpec('jimeng_high_aes_general_v21_L', 'DreamAI 2.1', (
+        PROMPT,
+        SEED,
+        Field('width', kind='int'),
+        Field('height', kind='int'),
+        USE_PRE_LLM,
+        USE_SR,
+        RETURN_URL,
+    ), groups=(
+        Group('logo_info', enabled_by='add_logo', constants={'add_logo': True}, fields=(
+            Field('logo_position', kind='int', key='position'),
+            Field('logo_language', kind='int', key='language'),
+            Field('logo_opacity', kind='float', key='opacity'),
+            Field('logo_text_content', kind='str'),
+        )),
+        Group('aigc_meta', enabled_by='add_aigc_meta', encode=True, skip_empty=True, fields=(
+            Field('content_producer'),
+            Field('producer_id'),
+            Field('content_propagator'),
+            Field('propagate_id'),
+        )),
+    )),
+})
+
+SCHEMAS = (TEXT_TO_IMAGE, IMAGE_TO_IMAGE, TEXT_TO_VIDEO, VIDEO_GENERATION, MOTION_IMITATION, SYNC_TEXT_TO_IMAGE)
+
+
+def compile_all() -> None:
+    """预先读取工具 YAML 并编译全部 schema"""
+    for schema in SCHEMAS:
+        schema.compile()
+
+
+def build_text_to_image_request(tool_parameters: dict[str, Any]) -> tuple[str, dict[str, Any], str]:
+    """
+    构建文生图请求
+
+    :return: (req_key, form_data, req_json)
+    """
+    return TEXT_TO_IMAGE.build(tool_parameters)
+
+
+def build_image_to_image_request(tool_parameters: dict[str, Any]) -> tuple[str, dict[str, Any], str]:
+    """构建图生图请求，返回 (req_key, form_data, req_json)"""
+    return IMAGE_TO_IMAGE.build(tool_parameters)
+
+
+def build_text_to_video_request(tool_parameters: dict[str, Any]) -> tuple[str, dict[str, Any], Optional[str]]:
+    """构建文生视频请求，返回 (req_key, form_data, None)"""
+    return TEXT_TO_VIDEO.build(tool_parameters)
+
+
+def build_video_generation_request(tool_parameters: dict[str, Any]) -> tuple[str, dict[str, Any], Optional[str]]:
+    """构建视频生成请求，返回 (req_key, form_data, None)"""
+    return VIDEO_GENERATION.build(tool_parameters)
+
+
+def build_motion_imitation_request(tool_parameters: dict[str, Any]) -> tuple[str, dict[str, Any], Optional[str]]:
+    """构建动作模仿请求，返回 (req_key, form_data, None)"""
+    return MOTION_IMITATION.build(tool_parameters)
+
+
+def build_sync_text_to_image_request(tool_parameters: dict[str, Any]) -> tuple[str, dict[str, Any], Optional[str]]:
+    """构建同步文生图请求，返回 (req_key, form_data, None)"""
+    return SYNC_TEXT_TO_IMAGE.build(tool_parameters)
@@ -0,0 +1,279 @@
+"""
+声明式的请求参数 schema
+
+参数的类型、默认值与取值范围来自工具 YAML（tools/<tool>.yaml 的 parameters），各 req_key 特有的规则
+（写入哪些字段、覆盖的默认值与范围、需同时传入的参数对、写入 req_json 的分组）在 RequestSpec 中声明。
+每个工具的 schema 在首次使用时编译为一组按顺序执行的字段处理函数并缓存，
+之后每次调用只是依次执行这些函数，不再逐个判断模型版本。
+
+参数不合法时抛出 ValueError，消息可直接展示给用户。
+"""
+import json
+import os
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import yaml
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools')
+
+# 默认值取自 YAML
+FROM_YAML = object()
+# 未传入时不写入请求
+OMIT = object()
+
+# YAML 参数类型到字段类型的映射，select 按选项值的类型推断
+_YAML_KINDS = {'string': 'str', 'number': 'float', 'boolean': 'bool'}
+
+
+def _to_int(value: Any) -> int:
+    # 字符串形式的小数（如 "4.0"）先转为浮点数；大整数（如 seed）不经过浮点数以免丢失精度
+    if isinstance(value, str) and not value.strip().lstrip('-').isdigit():
+        return int(float(value))
+    return int(value)
+
+
+_CONVERTERS: dict[str, Callable[[Any], Any]] = {
+    'str': str,
+    'int': _to_int,
+    'float': float,
+    'bool': bool,
+    'raw': lambda value: value,
+}
+
+
+@dataclass(frozen=True)
+class Field:
+    """一个工具参数到请求字段的映射"""
+    name: str
+    # str / int / float / bool / raw，以及 lines（按换行拆分为列表）与 image（链接或 base64 图片）；空时按 YAML 类型推断
+    kind: str = ''
+    # 写入请求的字段名，默认与参数名相同
+    key: str = ''
+    default: Any = FROM_YAML
+    # 视为未传入的取值，如 seed 的 -1
+    skip: tuple = ()
+    # 取值范围，未指定时使用 YAML 中的 min / max
+    min: Optional[float] = None
+    max: Optional[float] = None
+    # 是否必填，未指定时使用 YAML 中的 required
+    required: Optional[bool] = None
+    # 仅当该参数有值时才写入
+    requires: str = ''
+
+
+@dataclass(frozen=True)
+class Group:
+    """由开关参数控制的一组字段，写入为一个嵌套对象，如水印参数 logo_info"""
+    key: str
+    enabled_by: str
+    fields: tuple[Field, ...]
+    # 固定写入的字段
+    constants: dict = field(default_factory=dict)
+    # 以 JSON 字符串写入
+    encode: bool = False
+    # 没有任何字段有值时不写入
+    skip_empty: bool = False
+
+
+@dataclass(frozen=True)
+class RequestSpec:
+    """一个 req_key 的请求 schema"""
+    req_key: str
+    # 出现在错误消息中的模型名称
+    label: str
+    fields: tuple[Field, ...]
+    # 需同时传入或都不传入的参数对
+    together: tuple[tuple[str, str], ...] = ()
+    # 写入提交参数的分组
+    groups: tuple[Group, ...] = ()
+    # 写入 req_json 的字段与分组，为空时不生成 req_json
+    req_json: tuple[Any, ...] = ()
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or value == ''
+
+
+def load_tool_parameters(tool: str) -> dict[str, dict]:
+    """读取工具 YAML 中的参数定义，返回 参数名 -> 定义"""
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(os.path.join(TOOLS_DIR, f"{tool}.yaml"), encoding='utf-8') as f:
+        document = yaml.load(f, Loader=loader)
+    return {parameter['name']: parameter for parameter in document.get('parameters') or []}
+
+
+def _kind(spec_field: Field, parameter: dict) -> str:
+    if spec_field.kind:
+        return spec_field.kind
+    if parameter.get('type') == 'select':
+        values = [option.get('value') for option in parameter.get('options') or []]
+        if values and all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            return 'int'
+        return 'str'
+    return _YAML_KINDS.get(parameter.get('type'), 'raw')
+
+
+def _compile_value(spec: RequestSpec, spec_field: Field, parameter: dict) -> Callable[[dict], Any]:
+    """编译为 取参数 -> 转换 -> 校验 的函数，参数未传入且无默认值时返回 OMIT"""
+    name = spec_field.name
+    kind = _kind(spec_field, parameter)
+    default = parameter.get('default') if spec_field.default is FROM_YAML else spec_field.default
+    if default is None:
+        default = OMIT
+    skip = spec_field.skip
+    required = spec_field.required if spec_field.required is not None else bool(parameter.get('required'))
+    requires = spec_field.requires
+    lower = spec_field.min if spec_field.min is not None else parameter.get('min')
+    upper = spec_field.max if spec_field.max is not None else parameter.get('max')
+    if kind not in ('int', 'float'):
+        lower = upper = None
+    range_error = f"{name.capitalize()} value for {spec.label} model must be between {lower} and {upper}"
+
+    if kind == 'lines':
+        def convert(value):
+            lines = [line.strip() for line in str(value).split('\n') if line.strip()]
+            return lines or OMIT
+    elif kind == 'image':
+        # 图片输入：http 链接或 base64 数据，由调用方写入 image_urls 或 binary_data_base64
+        def convert(value):
+            return ('image_urls' if str(value).startswith('http') else 'binary_data_base64', [value])
+    else:
+        convert = _CONVERTERS[kind]
+
+    def value_of(params: dict) -> Any:
+        if requires and _is_missing(params.get(requires)):
+            return OMIT
+        value = params.get(name)
+        if _is_missing(value) or (skip and value in skip):
+            if required:
+                raise ValueError(f"{name} is required")
+            if default is OMIT:
+                return OMIT
+            value = default
+        try:
+            value = convert(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for {name}: {params.get(name)!r}")
+        if (lower is not None and value < lower) or (upper is not None and value > upper):
+            raise ValueError(range_error)
+        return value
+
+    return value_of
+
+
+def _compile_field(spec: RequestSpec, spec_field: Field, parameters: dict,
+                   target: str) -> Callable[[dict, dict, dict], None]:
+    value_of = _compile_value(spec, spec_field, parameters.get(spec_field.name, {}))
+    key = spec_field.key or spec_field.name
+    image = spec_field.kind == 'image'
+
+    def apply(params: dict, form: dict, req_json: dict) -> None:
+        value = value_of(params)
+        if value is OMIT:
+            return
+        destination = form if target == 'form' else req_json
+        if image:
+            image_key, value = value
+            destination[image_key] = value
+        else:
+            destination[key] = value
+
+    return apply
+
+
+def _compile_group(spec: RequestSpec, group: Group, parameters: dict,
+                   target: str) -> Callable[[dict, dict, dict], None]:
+    members = [(spec_field.key or spec_field.name, _compile_value(spec, spec_field, parameters.get(spec_field.name, {})))
+               for spec_field in group.fields]
+
+    def apply(params: dict, form: dict, req_json: dict) -> None:
+        if not params.get(group.enabled_by):
+            return
+        values = {}
+        for key, value_of in members:
+            value = value_of(params)
+            if value is not OMIT:
+                values[key] = value
+        if group.skip_empty and not values:
+            return
+        nested = {**group.constants, **values}
+        destination = form if target == 'form' else req_json
+        destination[group.key] = json.dumps(nested) if group.encode else nested
+
+    return apply
+
+
+def _compile_together(spec: RequestSpec, first: str, second: str) -> Callable[[dict, dict, dict], None]:
+    message = f"For {spec.label} model, {first} and {second} must be specified together or not at all"
+
+    def apply(params: dict, form: dict, req_json: dict) -> None:
+        if _is_missing(params.get(first)) != _is_missing(params.get(second)):
+            raise ValueError(message)
+
+    return apply
+
+
+class CompiledSpec:
+    """编译后的请求 schema"""
+
+    def __init__(self, spec: RequestSpec, parameters: dict[str, dict]):
+        self.spec = spec
+        self.req_key = spec.req_key
+        self.has_req_json = bool(spec.req_json)
+        steps = [_compile_together(spec, first, second) for first, second in spec.together]
+        steps += [_compile_field(spec, spec_field, parameters, 'form') for spec_field in spec.fields]
+        steps += [_compile_group(spec, group, parameters, 'form') for group in spec.groups]
+        for entry in spec.req_json:
+            if isinstance(entry, Group):
+                steps.append(_compile_group(spec, entry, parameters, 'req_json'))
+            else:
+                steps.append(_compile_field(spec, entry, parameters, 'req_json'))
+        self._steps = tuple(steps)
+
+    def build(self, params: dict[str, Any]) -> tuple[dict[str, Any], Optional[str]]:
+        """返回 (form_data, req_json)，spec 未声明 req_json 时 req_json 为 None"""
+        form: dict[str, Any] = {'req_key': self.req_key}
+        req_json: dict[str, Any] = {}
+        for step in self._steps:
+            step(params, form, req_json)
+        return form, (json.dumps(req_json) if self.has_req_json else None)
+
+
+class ToolSchema:
+    """
+    一个工具的全部请求 schema
+
+    selector 为选择模型版本的参数名，variants 为 参数值 -> RequestSpec；未识别的取值使用 default 对应的版本。
+    工具 YAML 在首次构建请求时读取并编译，之后复用。
+    """
+
+    def __init__(self, tool: str, variants: dict[str, RequestSpec], selector: str = '', default: str = ''):
+        self.tool = tool
+        self.selector = selector
+        self.default = default
+        self._variants = variants
+        self._compiled: Optional[dict[str, CompiledSpec]] = None
+        self._lock = threading.Lock()
+
+    def compile(self) -> dict[str, CompiledSpec]:
+        if self._compiled is None:
+            with self._lock:
+                if self._compiled is None:
+                    parameters = load_tool_parameters(self.tool)
+                    self._compiled = {value: CompiledSpec(spec, parameters) for value, spec in self._variants.items()}
+        return self._compiled
+
+    def variant(self, params: dict[str, Any]) -> CompiledSpec:
+        compiled = self.compile()
+        if not self.selector:
+            return compiled[self.default]
+        return compiled.get(str(params.get(self.selector) or self.default)) or compiled[self.default]
+
+    def build(self, params: dict[str, Any]) -> tuple[str, dict[str, Any], Optional[str]]:
+        """返回 (req_key, form_data, req_json)"""
+        spec = self.variant(params)
+        form, req_json = spec.build(params)
+        return spec.req_key, form, req_json
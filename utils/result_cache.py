@@ -0,0 +1,195 @@
+"""
+确定性生成请求的结果缓存
+
+显式指定 seed 时，相同的 form_data 与 req_json 会得到相同的结果。缓存键为规范化请求的
+SHA-256，内存层按字节预算做 LRU 淘汰，可选的磁盘层（DREAMAI_RESULT_CACHE_DIR）
+在进程重启后仍然有效；过期时间不会晚于返回的图片/视频链接本身的失效时间。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
+
+# 不影响生成结果的字段，不参与缓存键计算
+VOLATILE_FIELDS = frozenset({'request_id', 'req_id', 'callback_url'})
+
+# 链接失效前预留的安全时间
+_URL_EXPIRY_MARGIN = 60
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()
+                if key not in VOLATILE_FIELDS and item is not None and item != ''}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def request_fingerprint(form_data: dict, req_json: Optional[str] = None, namespace: str = '') -> str:
+    """计算请求的规范化指纹；namespace 用于按凭证隔离"""
+    payload = {'form_data': _canonical(form_data)}
+    if req_json:
+        try:
+            payload['req_json'] = _canonical(json.loads(req_json))
+        except (TypeError, ValueError):
+            payload['req_json'] = req_json
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(f"{namespace}\0{canonical}".encode('utf-8')).hexdigest()
+
+
+def _url_expires_at(url: str) -> Optional[float]:
+    """解析签名链接中的过期时间（epoch 秒），无法解析时返回 None"""
+    try:
+        query = {key.lower(): values[0] for key, values in parse_qs(urlparse(url).query).items()}
+    except ValueError:
+        return None
+    if 'x-expires' in query and query['x-expires'].isdigit() and len(query['x-expires']) >= 10:
+        # byteimg 等 CDN 签名：x-expires 为绝对时间戳
+        return float(query['x-expires'])
+    for date_key, expires_key in (('x-tos-date', 'x-tos-expires'), ('x-date', 'x-expires')):
+        if date_key in query and query.get(expires_key, '').isdigit():
+            try:
+                signed_at = datetime.strptime(query[date_key], '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+            return signed_at.timestamp() + int(query[expires_key])
+    if query.get('expires', '').isdigit():
+        return float(query['expires'])
+    return None
+
+
+def _collect_urls(value: Any) -> list[str]:
+    urls = []
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in ('image_urls', 'video_url', 'url', 'urls'):
+                urls.extend(item if isinstance(item, list) else [item])
+            elif isinstance(item, (dict, list)):
+                urls.extend(_collect_urls(item))
+    elif isinstance(value, list):
+        for item in value:
+            urls.extend(_collect_urls(item))
+    return [url for url in urls if isinstance(url, str) and url.startswith('http')]
+
+
+def result_expires_at(value: Any, default_ttl: float) -> float:
+    """结果的缓存过期时间：默认 TTL 与结果中链接失效时间的较小者"""
+    expires_at = time.time() + default_ttl
+    for url in _collect_urls(value):
+        url_expires = _url_expires_at(url)
+        if url_expires is not None:
+            expires_at = min(expires_at, url_expires - _URL_EXPIRY_MARGIN)
+    return expires_at
+
+
+class ResultCache:
+    """内存 LRU（按字节预算）+ 可选磁盘层的结果缓存"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, default_ttl: float = 86400,
+                 disk_dir: Optional[str] = None):
+        self._max_bytes = max_bytes
+        self._default_ttl = default_ttl
+        self._disk_dir = disk_dir
+        self._entries: OrderedDict[str, tuple[Any, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return value
+                self._drop(key)
+        value, expires_at = self._read_disk(key, now)
+        if value is not None:
+            self._store_memory(key, value, expires_at, len(json.dumps(value, ensure_ascii=False)))
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        expires_at = result_expires_at(value, self._default_ttl)
+        if expires_at <= time.time():
+            return
+        encoded = json.dumps(value, ensure_ascii=False)
+        self._store_memory(key, value, expires_at, len(encoded))
+        self._write_disk(key, encoded, expires_at)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _store_memory(self, key: str, value: Any, expires_at: float, size: int) -> None:
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self._disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str, now: float) -> tuple[Optional[Any], float]:
+        if not self._disk_dir:
+            return None, 0.0
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None, 0.0
+        if record.get('expires_at', 0) <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None, 0.0
+        return record.get('value'), record['expires_at']
+
+    def _write_disk(self, key: str, encoded: str, expires_at: float) -> None:
+        if not self._disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再原子替换，避免并发读到半个文件
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(f'{{"expires_at": {expires_at}, "value": {encoded}}}')
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+result_cache = ResultCache(
+    max_bytes=int(_env_float('DREAMAI_RESULT_CACHE_BYTES', 32 * 1024 * 1024)),
+    default_ttl=_env_float('DREAMAI_RESULT_CACHE_TTL', 86400),
+    disk_dir=os.getenv('DREAMAI_RESULT_CACHE_DIR') or None,
+)
@@ -0,0 +1,98 @@
+"""
+相同请求的提交去重（single-flight）
+
+相同指纹的请求在进行中时，后来者不再提交新任务，而是等待首个请求的提交结果并复用其
+task_id；之后的轮询由共享轮询器合并，任务结果自然广播给所有等待方。
+"""
+import threading
+import time
+from collections.abc import Callable
+from typing import Optional
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[dict] = None
+        self.error: Optional[Exception] = None
+        self.expires_at = float('inf')
+        self.followers = 0
+
+
+def _has_task_id(response: Optional[dict]) -> bool:
+    return isinstance(response, dict) and response.get('code') == 10000 \
+        and bool((response.get('data') or {}).get('task_id'))
+
+
+class SingleFlight:
+    """按请求指纹合并进行中的提交"""
+
+    def __init__(self):
+        self._flights: dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, submit: Callable[[], dict], ttl: float) -> tuple[dict, bool]:
+        """
+        提交任务或加入相同请求的进行中任务
+
+        :param key: 请求指纹
+        :param submit: 实际提交任务的函数
+        :param ttl: 提交成功后该任务可被复用的时长，通常为轮询时长上限
+        :return: (提交响应, 是否由本次调用实际提交)
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response, False
+
+        try:
+            response = submit()
+        except Exception as e:
+            flight.error = e
+            self._remove(key, flight)
+            flight.done.set()
+            raise
+        flight.response = response
+        if _has_task_id(response):
+            flight.expires_at = time.monotonic() + ttl
+        else:
+            # 提交失败的结果只返回给当前等待方，不再被复用
+            self._remove(key, flight)
+        flight.done.set()
+        return response, True
+
+    def release(self, key: Optional[str]) -> None:
+        """任务异常结束时移除记录，后续相同请求将重新提交"""
+        if not key:
+            return
+        with self._lock:
+            self._flights.pop(key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._flights)
+
+    def _remove(self, key: str, flight: _Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _expire(self, now: float) -> None:
+        expired = [key for key, flight in self._flights.items() if flight.expires_at <= now]
+        for key in expired:
+            del self._flights[key]
+
+
+# 进程级共享实例
+single_flight = SingleFlight()
@@ -0,0 +1,205 @@
+"""
+区分交互与批量流量的提交调度
+
+所有生成工具共用账号的并发任务配额，批量补跑的视频任务会占满配额，交互调用的文生图只能排在其后。
+设置 DREAMAI_SUBMIT_CAPACITY（进程内同时运行的任务数上限）后，提交任务前先经过调度：
+
+- 优先级：interactive 先于 batch 出队；batch 最多只使用 capacity 减去为交互流量预留的名额，
+  视频任务占满配额时交互调用仍可立即提交
+- 同一优先级内按租户（凭证组）加权公平出队（stride 调度），权重为凭证组中的凭证数
+- 各优先级的排队数超过上限或等待超时时直接返回错误（load shedding），不再无限堆积
+
+运行中的任务数取自 rate_limiter 的并发名额记录，任务结束时自动归还；未设置容量时调度不生效。
+优先级可由工具参数 priority 按调用指定，或通过 DREAMAI_PRIORITY_<TOOL> 按工具指定。
+
+- DREAMAI_SUBMIT_CAPACITY 同时运行的任务数上限，默认 0（不限制，不排队）
+- DREAMAI_INTERACTIVE_RESERVE 为交互流量预留的名额，默认为容量的 20%（至少 1 个）
+- DREAMAI_QUEUE_DEPTH_INTERACTIVE / DREAMAI_QUEUE_DEPTH_BATCH 各优先级的最大排队数，默认 50 / 200
+- DREAMAI_QUEUE_TIMEOUT_INTERACTIVE / DREAMAI_QUEUE_TIMEOUT_BATCH 最长排队时间（秒），默认 30 / 600
+"""
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Optional
+
+from utils.metrics import submit_queue_total, submit_queue_wait_seconds
+from utils.rate_limit import TaskSlots, rate_limiter
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+# 按出队顺序排列
+PRIORITIES = (INTERACTIVE, BATCH)
+
+# 各工具未指定优先级时的默认值
+TOOL_PRIORITIES = {
+    'text_to_image': INTERACTIVE,
+    'image_to_image': INTERACTIVE,
+    'text_to_video': BATCH,
+    'video_generation': BATCH,
+    'motion_imitation': BATCH,
+    'batch_text_to_image': BATCH,
+}
+
+
+def resolve_priority(tool: str, tool_parameters: Mapping[str, Any]) -> str:
+    """本次调用的优先级：工具参数 > DREAMAI_PRIORITY_<TOOL> > 工具默认值"""
+    for value in (tool_parameters.get('priority'), os.getenv(f"DREAMAI_PRIORITY_{tool.upper()}")):
+        if value in PRIORITIES:
+            return value
+    return TOOL_PRIORITIES.get(tool, INTERACTIVE)
+
+
+@dataclass
+class _Waiter:
+    tenant: str
+    priority: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted: bool = False
+
+
+class SubmissionScheduler:
+    """按优先级与租户权重分配提交名额"""
+
+    def __init__(self, capacity: int = 0, interactive_reserve: Optional[int] = None,
+                 max_depth: Optional[dict[str, int]] = None, max_wait: Optional[dict[str, float]] = None,
+                 slots: Optional[TaskSlots] = None):
+        self.capacity = capacity
+        if interactive_reserve is None:
+            interactive_reserve = max(1, capacity // 5)
+        self.interactive_reserve = min(interactive_reserve, max(capacity - 1, 0))
+        self.max_depth = max_depth or {INTERACTIVE: 50, BATCH: 200}
+        self.max_wait = max_wait or {INTERACTIVE: 30.0, BATCH: 600.0}
+        self.slots = slots or rate_limiter.slots
+        # 优先级 -> 租户 -> 排队中的请求
+        self._queues: dict[str, dict[str, deque]] = {priority: {} for priority in PRIORITIES}
+        # stride 调度：优先级 -> 租户 -> 已获得的加权名额（pass 值）
+        self._passes: dict[str, dict[str, float]] = {priority: {} for priority in PRIORITIES}
+        # 各优先级最近一次放行时的 pass 值
+        self._virtual: dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._weights: dict[str, int] = {}
+        # 已放行但尚未拿到并发名额（提交请求仍在发送中）的数量
+        self._submitting = 0
+        self._condition = threading.Condition()
+
+    def limit(self, priority: str) -> int:
+        """该优先级可使用的运行任务数上限"""
+        return self.capacity if priority == INTERACTIVE else self.capacity - self.interactive_reserve
+
+    def depth(self, priority: str) -> int:
+        with self._condition:
+            return sum(len(queue) for queue in self._queues[priority].values())
+
+    def submit(self, tenant: str, priority: str, send: Callable[[], dict], weight: int = 1) -> dict:
+        """排队等待名额后调用 send 提交任务；队列已满或等待超时时返回错误响应"""
+        if self.capacity <= 0:
+            return send()
+        if priority not in PRIORITIES:
+            priority = INTERACTIVE
+        waiter = _Waiter(tenant, priority)
+        with self._condition:
+            if sum(len(queue) for queue in self._queues[priority].values()) >= self.max_depth[priority]:
+                submit_queue_total.inc(priority=priority, outcome='shed_full')
+                return self._shed(priority, 'the submission queue is full')
+            self._weights[tenant] = max(weight, 1)
+            self._enqueue(waiter)
+            deadline = waiter.enqueued_at + self.max_wait[priority]
+            self._dispatch()
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queues[priority][tenant].remove(waiter)
+                    submit_queue_total.inc(priority=priority, outcome='shed_timeout')
+                    return self._shed(priority, f"no capacity within {self.max_wait[priority]:g}s")
+                # 任务结束时名额由查询结果释放，这里定期重新检查
+                self._condition.wait(min(remaining, 0.2))
+                self._dispatch()
+        submit_queue_wait_seconds.observe(time.monotonic() - waiter.enqueued_at, priority=priority)
+        submit_queue_total.inc(priority=priority, outcome='admitted')
+        try:
+            return send()
+        finally:
+            with self._condition:
+                self._submitting -= 1
+                self._dispatch()
+                self._condition.notify_all()
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        queues = self._queues[waiter.priority]
+        passes = self._passes[waiter.priority]
+        if not queues.get(waiter.tenant):
+            # 重新进入排队的租户从当前的虚拟时间开始，不能凭借空闲期间积累的额度插队
+            passes[waiter.tenant] = max(passes.get(waiter.tenant, 0.0), self._virtual[waiter.priority])
+        queues.setdefault(waiter.tenant, deque()).append(waiter)
+
+    def _dispatch(self) -> None:
+        """在持有锁时按优先级与租户权重放行排队中的请求"""
+        granted = False
+        while True:
+            waiter = self._next()
+            if waiter is None:
+                break
+            self._queues[waiter.priority][waiter.tenant].popleft()
+            passes = self._passes[waiter.priority]
+            self._virtual[waiter.priority] = passes[waiter.tenant]
+            passes[waiter.tenant] += 1.0 / self._weights.get(waiter.tenant, 1)
+            self._submitting += 1
+            waiter.granted = True
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _next(self) -> Optional[_Waiter]:
+        running = self.slots.total() + self._submitting
+        for priority in PRIORITIES:
+            queues = self._queues[priority]
+            tenants = [tenant for tenant, queue in queues.items() if queue]
+            if not tenants:
+                continue
+            # 高优先级仍有排队时不放行低优先级，避免批量流量抢占刚释放的名额
+            if running >= self.limit(priority):
+                return None
+            tenant = min(tenants, key=lambda tenant: (self._passes[priority][tenant], queues[tenant][0].enqueued_at))
+            return queues[tenant][0]
+        return None
+
+    def _shed(self, priority: str, reason: str) -> dict:
+        message = f"Too many pending {priority} tasks: {reason}, please retry later"
+        return {
+            'code': 50430,
+            'message': message,
+            'data': None,
+            'ResponseMetadata': {'Error': {'Code': 'SubmissionQueueFull', 'Message': message}},
+        }
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _env_reserve() -> Optional[int]:
+    value = os.getenv('DREAMAI_INTERACTIVE_RESERVE')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+# 进程级共享实例
+submission_scheduler = SubmissionScheduler(
+    capacity=int(_env_float('DREAMAI_SUBMIT_CAPACITY', 0)),
+    interactive_reserve=_env_reserve(),
+    max_depth={
+        INTERACTIVE: int(_env_float('DREAMAI_QUEUE_DEPTH_INTERACTIVE', 50)),
+        BATCH: int(_env_float('DREAMAI_QUEUE_DEPTH_BATCH', 200)),
+    },
+    max_wait={
+        INTERACTIVE: _env_float('DREAMAI_QUEUE_TIMEOUT_INTERACTIVE', 30),
+        BATCH: _env_float('DREAMAI_QUEUE_TIMEOUT_BATCH', 600),
+    },
+)
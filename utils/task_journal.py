@@ -0,0 +1,149 @@
+"""
+持久化任务日志
+
+使用嵌入式 SQLite（WAL 模式）记录每个已提交任务的 task_id、req_key、req_json、提交时间和
+最近状态，插件超时或重启后仍可通过 cv_get_result 或后台补偿轮询继续跟踪付费任务。
+日志只保存凭证指纹，不保存密钥本身。
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('done', 'not_found', 'expired')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    credential   TEXT NOT NULL,
+    task_id      TEXT NOT NULL,
+    req_key      TEXT NOT NULL,
+    req_json     TEXT,
+    submitted_at REAL NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'submitted',
+    updated_at   REAL NOT NULL,
+    result       TEXT,
+    duration     REAL,
+    PRIMARY KEY (credential, task_id)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, submitted_at);
+"""
+
+
+def _default_path() -> str:
+    return os.path.join(tempfile.gettempdir(), 'dreamai', 'task_journal.db')
+
+
+def _summarize_result(data: Optional[dict]) -> Optional[str]:
+    """只保留结果中的链接等小字段，base64 数据不写入日志"""
+    if not data:
+        return None
+    summary = {key: value for key, value in data.items() if key != 'binary_data_base64'}
+    if 'binary_data_base64' in data:
+        summary['binary_data_count'] = len(data['binary_data_base64'] or [])
+    return json.dumps(summary, ensure_ascii=False)
+
+
+class TaskJournal:
+    """线程安全的任务日志，数据库不可用时自动降级为空操作"""
+
+    def __init__(self, path: Optional[str], retention: float = 7 * 86400):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(tasks)')}
+            if 'duration' not in columns:
+                conn.execute('ALTER TABLE tasks ADD COLUMN duration REAL')
+            conn.execute('DELETE FROM tasks WHERE submitted_at < ?', (time.time() - retention,))
+            self._conn = conn
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("task journal disabled: %s", e)
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def _execute(self, sql: str, params: tuple = ()) -> list[dict[str, Any]]:
+        if self._conn is None:
+            return []
+        try:
+            with self._lock:
+                cursor = self._conn.execute(sql, params)
+                columns = [column[0] for column in cursor.description or ()]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.warning("task journal error: %s", e)
+            return []
+
+    def record_submit(self, credential: str, task_id: str, req_key: str, req_json: Optional[str] = None) -> None:
+        now = time.time()
+        self._execute(
+            'INSERT OR IGNORE INTO tasks (credential, task_id, req_key, req_json, submitted_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (credential, task_id, req_key, req_json or None, now, now),
+        )
+
+    def update_status(self, credential: str, task_id: str, status: str, data: Optional[dict] = None,
+                      timed: bool = False) -> None:
+        """
+        更新任务状态
+
+        :param timed: 完成时刻是否由持续轮询及时观测到；只有这类任务的提交到完成耗时才会被记录，
+                      手动查询或重启后补偿时才发现的完成时间会偏大
+        """
+        now = time.time()
+        done = status == 'done'
+        self._execute(
+            'UPDATE tasks SET status = ?, updated_at = ?, result = COALESCE(?, result), '
+            'duration = COALESCE(duration, CASE WHEN ? THEN ? - submitted_at END) '
+            'WHERE credential = ? AND task_id = ?',
+            (status, now, _summarize_result(data) if done else None, done and timed, now, credential, task_id),
+        )
+
+    def get(self, task_id: str, credential: Optional[str] = None) -> Optional[dict[str, Any]]:
+        if credential is None:
+            rows = self._execute('SELECT * FROM tasks WHERE task_id = ? ORDER BY submitted_at DESC LIMIT 1',
+                                 (task_id,))
+        else:
+            rows = self._execute('SELECT * FROM tasks WHERE credential = ? AND task_id = ?', (credential, task_id))
+        return rows[0] if rows else None
+
+    def pending(self, credential: str, submitted_before: Optional[float] = None) -> list[dict[str, Any]]:
+        """未结束的任务，submitted_before 用于只取之前进程提交的任务"""
+        placeholders = ','.join('?' for _ in TERMINAL_STATUSES)
+        return self._execute(
+            f'SELECT * FROM tasks WHERE credential = ? AND status NOT IN ({placeholders}) AND submitted_at < ? '
+            'ORDER BY submitted_at',
+            (credential, *TERMINAL_STATUSES, submitted_before if submitted_before is not None else time.time()),
+        )
+
+    def completed_durations(self, limit: int = 1000) -> list[tuple[str, float]]:
+        """最近已完成任务的 (req_key, 提交到完成耗时)，用于预热耗时模型"""
+        rows = self._execute(
+            'SELECT req_key, duration FROM tasks WHERE duration IS NOT NULL ORDER BY updated_at DESC LIMIT ?',
+            (limit,),
+        )
+        return [(row['req_key'], row['duration']) for row in rows]
+
+
+def _journal_path() -> Optional[str]:
+    path = os.getenv('DREAMAI_TASK_JOURNAL', _default_path())
+    if path.lower() in ('', 'off', 'none', 'false', '0'):
+        return None
+    return path
+
+
+task_journal = TaskJournal(_journal_path())
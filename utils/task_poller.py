@@ -0,0 +1,391 @@
+"""
+进程级共享任务轮询器
+
+所有进行中的 (req_key, task_id) 由同一个轮询器在后台事件循环上统一调度：
+到期检查放在时间轮中，同一任务只查询一次并把结果广播给所有等待方，
+cv_get_result 手动查询正在轮询的任务时也直接复用这次查询。
+"""
+import asyncio
+import math
+import os
+import queue
+import time
+from collections.abc import Generator
+from typing import Any, Optional
+
+from utils.async_client import AsyncVisualClient, background_loop
+from utils.polling import PollSchedule
+from utils.task_journal import task_journal
+
+# 查询到以下状态后停止轮询
+TERMINAL_STATUSES = ('done', 'not_found', 'expired')
+
+# 通过 CVProcess 的 cv_submit_task 提交的任务（如动作模仿），结果同样通过 CVProcess 查询
+CV_PROCESS_TASKS = ('jimeng_motion_imitation_L',)
+
+_FINISHED = object()
+
+
+async def get_task_result(client: AsyncVisualClient, query: dict) -> dict:
+    """按任务的提交方式查询一次结果，CVProcess 的响应展开为与 CVSync2AsyncGetResult 相同的格式"""
+    if query.get('req_key') not in CV_PROCESS_TASKS:
+        return await client.cv_sync2async_get_result(query)
+    response = await client.cv_process({'req_key': 'cv_get_result', 'task_id': query['task_id']})
+    error = (response.get('ResponseMetadata') or {}).get('Error')
+    if error:
+        return {
+            'code': error.get('CodeN') or 50500,
+            'message': f"{error.get('Code', '')}: {error.get('Message', '')}",
+            'data': None,
+            'ResponseMetadata': response['ResponseMetadata'],
+        }
+    return response.get('Result') or response
+
+
+class TimerWheel:
+    """哈希时间轮，按 tick 粒度把到期项放入对应槽位"""
+
+    def __init__(self, tick: float = 0.25, slots: int = 512):
+        self.tick = tick
+        self._slots: list[list] = [[] for _ in range(slots)]
+        self._current = math.floor(time.monotonic() / tick)
+
+    def add(self, item: Any, delay: float) -> None:
+        target = max(math.ceil((time.monotonic() + delay) / self.tick), self._current + 1)
+        self._slots[target % len(self._slots)].append((target, item))
+
+    def advance(self) -> list:
+        """推进到当前时间，返回所有到期项"""
+        now = math.floor(time.monotonic() / self.tick)
+        due = []
+        steps = min(now - self._current, len(self._slots))
+        for offset in range(1, steps + 1):
+            slot = self._slots[(self._current + offset) % len(self._slots)]
+            if not slot:
+                continue
+            pending = []
+            for target, item in slot:
+                (due if target <= now else pending).append(item)
+            slot[:] = pending
+        self._current = max(self._current, now)
+        return due
+
+    def __len__(self) -> int:
+        return sum(len(slot) for slot in self._slots)
+
+
+class Subscription:
+    """一次调用对某个任务的订阅，可迭代得到 (第几次查询, 响应)"""
+
+    def __init__(self, poller: 'SharedPoller', req_json: Optional[str], timeout: float):
+        self.req_json = req_json or None
+        self.deadline = time.monotonic() + timeout
+        self.attempt = 0
+        self.key: Optional[tuple] = None
+        self._poller = poller
+        self._events: queue.Queue = queue.Queue()
+        self._closed = False
+
+    def deliver(self, response: dict) -> None:
+        self.attempt += 1
+        self._events.put((self.attempt, response))
+
+    def fail(self, error: Exception) -> None:
+        self._events.put(error)
+
+    def finish(self) -> None:
+        self._events.put(_FINISHED)
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._poller.unsubscribe(self)
+
+    def __iter__(self) -> Generator[tuple[int, dict[str, Any]], None, None]:
+        try:
+            while True:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    event = self._events.get(timeout=remaining)
+                except queue.Empty:
+                    return
+                if event is _FINISHED:
+                    return
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            self.close()
+
+
+class _WatchedTask:
+    def __init__(self, client: AsyncVisualClient, req_key: str, task_id: str, req_json: Optional[str],
+                 schedule: PollSchedule):
+        self.key = (client.fingerprint, req_key, task_id)
+        self.client = client
+        self.req_key = req_key
+        self.task_id = task_id
+        self.req_json = req_json or None
+        self.schedule = schedule
+        self.subscribers: list[Subscription] = []
+        # 任务完成后正在按自己的 req_json 再取一次结果的订阅方，由 _deliver_own 结束
+        self.delivering: set[Subscription] = set()
+        self.waiters: list[asyncio.Future] = []
+        self.generation = 0
+        self.checking = False
+        self.last_response: Optional[dict] = None
+        self.last_checked = 0.0
+        # 连续查询失败的次数
+        self.errors = 0
+        # 无订阅方时继续轮询直至结束（用于超时或重启后的补偿轮询）
+        self.detached = False
+
+    def query(self, req_json: Optional[str] = None) -> dict:
+        query_params = {"task_id": self.task_id, "req_key": self.req_key}
+        req_json = req_json if req_json is not None else self.req_json
+        if req_json:
+            query_params["req_json"] = req_json
+        return query_params
+
+
+class SharedPoller:
+    """进程级共享轮询器，所有状态只在后台事件循环中修改"""
+
+    def __init__(self, tick: float = 0.25, max_inflight: int = 64, max_errors: int = 3):
+        self._tick = tick
+        self._max_inflight = max_inflight
+        self._max_errors = max_errors
+        self._tasks: dict[tuple, _WatchedTask] = {}
+        self._wheel: Optional[TimerWheel] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._driver: Optional[asyncio.Task] = None
+        self._pending: set = set()
+
+    # ---- 线程安全的对外接口 ----
+
+    def watch(self, client: AsyncVisualClient, req_key: str, task_id: str, req_json: Optional[str] = None,
+              schedule: Optional[PollSchedule] = None) -> Subscription:
+        """订阅任务状态；同一任务已在轮询时直接加入，不会产生额外查询"""
+        schedule = schedule or PollSchedule(req_key)
+        return self.subscribe(Subscription(self, req_json, schedule.remaining), client, req_key, task_id, schedule)
+
+    def subscribe(self, subscription: Subscription, client: AsyncVisualClient, req_key: str, task_id: str,
+                  schedule: PollSchedule) -> Subscription:
+        """加入调用方自行构造的订阅（如转发到其他队列的 Subscription 子类）"""
+        background_loop.loop.call_soon_threadsafe(self._add, client, req_key, task_id, schedule, subscription)
+        return subscription
+
+    def watch_detached(self, client: AsyncVisualClient, req_key: str, task_id: str, req_json: Optional[str] = None,
+                       schedule: Optional[PollSchedule] = None) -> None:
+        """在后台继续轮询任务直至结束，状态变化写入任务日志"""
+        schedule = schedule or PollSchedule(req_key)
+        background_loop.loop.call_soon_threadsafe(self._add_detached, client, req_key, task_id, req_json, schedule)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        background_loop.loop.call_soon_threadsafe(self._remove_subscriber, subscription)
+
+    def fetch(self, client: AsyncVisualClient, req_key: str, task_id: str, req_json: Optional[str] = None) -> dict:
+        """查询一次任务结果；任务正在被轮询时复用其查询结果"""
+        return background_loop.run(self._fetch(client, req_key, task_id, req_json or None))
+
+    def watching(self) -> int:
+        return len(self._tasks)
+
+    # ---- 以下方法只在事件循环中调用 ----
+
+    def _add(self, client, req_key, task_id, schedule, subscription) -> None:
+        key = (client.fingerprint, req_key, task_id)
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = _WatchedTask(client, req_key, task_id, subscription.req_json, schedule)
+            self._schedule(task, schedule.next_delay())
+        else:
+            # 新订阅方的截止时间更晚时延长共享轮询的时长
+            task.schedule.timeout = max(task.schedule.timeout,
+                                        task.schedule.elapsed + subscription.deadline - time.monotonic())
+        subscription.key = key
+        task.subscribers.append(subscription)
+
+    def _add_detached(self, client, req_key, task_id, req_json, schedule) -> None:
+        key = (client.fingerprint, req_key, task_id)
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = _WatchedTask(client, req_key, task_id, req_json, schedule)
+            self._schedule(task, schedule.next_delay())
+        else:
+            task.schedule.timeout = max(task.schedule.timeout, task.schedule.elapsed + schedule.remaining)
+        task.detached = True
+
+    def _remove_subscriber(self, subscription: Subscription) -> None:
+        task = self._tasks.get(subscription.key)
+        if task is None:
+            return
+        if subscription in task.subscribers:
+            task.subscribers.remove(subscription)
+        if not task.subscribers and not task.waiters and not task.detached:
+            self._tasks.pop(task.key, None)
+
+    def _schedule(self, task: _WatchedTask, delay: float) -> None:
+        if self._wheel is None:
+            self._wheel = TimerWheel(self._tick)
+            self._semaphore = asyncio.Semaphore(self._max_inflight)
+        task.generation += 1
+        self._wheel.add((task.key, task.generation), delay)
+        if self._driver is None or self._driver.done():
+            self._driver = asyncio.get_running_loop().create_task(self._drive())
+
+    def _spawn(self, coro) -> None:
+        future = asyncio.ensure_future(coro)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+
+    async def _drive(self) -> None:
+        while self._tasks:
+            await asyncio.sleep(self._tick)
+            for key, generation in self._wheel.advance():
+                task = self._tasks.get(key)
+                # 过期的时间轮项（任务已结束或已被提前查询）直接忽略
+                if task is None or task.generation != generation or task.checking:
+                    continue
+                self._spawn(self._check(task))
+
+    async def _check(self, task: _WatchedTask) -> None:
+        task.checking = True
+        try:
+            async with self._semaphore:
+                response = await get_task_result(task.client, task.query())
+        except Exception as e:
+            self._on_error(task, e)
+            return
+        finally:
+            task.checking = False
+
+        task.errors = 0
+        schedule = task.schedule
+        schedule.attempt += 1
+        data = response.get('data') or {}
+        status = data.get('status')
+        # 补偿轮询首次查询即已完成时，完成时刻未知，日志与耗时历史都不记录耗时
+        timed = schedule.status is not None or not task.detached
+        if status and status != schedule.status:
+            task_journal.update_status(task.client.fingerprint, task.task_id, status, data, timed=timed)
+        schedule.update(status)
+        if status == 'done' and timed:
+            schedule.finish()
+        task.last_response, task.last_checked = response, time.monotonic()
+
+        waiters, task.waiters = task.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(response)
+
+        terminal = response.get('code') != 10000 or status in TERMINAL_STATUSES
+        for subscription in list(task.subscribers):
+            if status == 'done' and subscription.req_json != task.req_json:
+                # req_json 不同会影响返回内容，任务完成后按订阅方自己的参数再取一次
+                task.delivering.add(subscription)
+                self._spawn(self._deliver_own(task, subscription))
+                continue
+            subscription.deliver(response)
+            if terminal:
+                subscription.finish()
+
+        if terminal or schedule.expired():
+            self._finish(task)
+        elif not task.subscribers and not task.detached:
+            self._tasks.pop(task.key, None)
+        else:
+            self._schedule(task, schedule.next_delay())
+
+    def _on_error(self, task: _WatchedTask, error: Exception) -> None:
+        """查询出错：网络抖动等偶发错误按退避重试，连续多次失败才通知订阅方"""
+        task.errors += 1
+        waiters, task.waiters = task.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+        if task.schedule.expired():
+            self._finish(task, error=error)
+            return
+        if task.errors >= self._max_errors:
+            # 后台跟踪的任务不受影响，继续轮询直至超时
+            subscribers, task.subscribers = task.subscribers, []
+            for subscription in subscribers:
+                subscription.fail(error)
+        if not task.subscribers and not task.detached:
+            self._tasks.pop(task.key, None)
+            return
+        self._schedule(task, task.schedule.next_delay())
+
+    async def _deliver_own(self, task: _WatchedTask, subscription: Subscription) -> None:
+        try:
+            subscription.deliver(await get_task_result(task.client, task.query(subscription.req_json or '')))
+            subscription.finish()
+        except Exception as e:
+            subscription.fail(e)
+        finally:
+            task.delivering.discard(subscription)
+
+    def _finish(self, task: _WatchedTask, error: Optional[Exception] = None) -> None:
+        self._tasks.pop(task.key, None)
+        for subscription in task.subscribers:
+            if subscription in task.delivering:
+                continue
+            if error is not None:
+                subscription.fail(error)
+            else:
+                subscription.finish()
+        if error is not None:
+            for waiter in task.waiters:
+                if not waiter.done():
+                    waiter.set_exception(error)
+            task.waiters = []
+
+    async def _fetch(self, client: AsyncVisualClient, req_key: str, task_id: str, req_json: Optional[str]) -> dict:
+        task = self._tasks.get((client.fingerprint, req_key, task_id))
+        if task is not None:
+            response = task.last_response
+            if response is None or time.monotonic() - task.last_checked > task.schedule.policy.min_interval:
+                waiter = asyncio.get_running_loop().create_future()
+                task.waiters.append(waiter)
+                if not task.checking:
+                    await self._check(task)
+                response = await waiter
+            status = (response.get('data') or {}).get('status')
+            if status != 'done' or req_json == task.req_json:
+                return response
+        query_params = {"task_id": task_id, "req_key": req_key}
+        if req_json:
+            query_params["req_json"] = req_json
+        return await get_task_result(client, query_params)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+shared_poller = SharedPoller(
+    tick=_env_float('DREAMAI_POLLER_TICK', 0.25),
+    max_inflight=int(_env_float('DREAMAI_POLLER_MAX_INFLIGHT', 64)),
+    max_errors=int(_env_float('DREAMAI_POLLER_MAX_ERRORS', 3)),
+)
+
+
+def iter_task_results(client: AsyncVisualClient, req_key: str, task_id: str, req_json: Optional[str] = None,
+                      schedule: Optional[PollSchedule] = None) -> Subscription:
+    """
+    轮询任务结果，按查询顺序产出 (第几次查询, 响应)
+
+    任务结束、查询出错或超过轮询时长后停止；调用方提前退出时自动取消订阅。
+    """
+    return shared_poller.watch(client, req_key, task_id, req_json, schedule)
+
+
+def fetch_task_result(client: AsyncVisualClient, req_key: str, task_id: str, req_json: Optional[str] = None) -> dict:
+    """查询一次任务结果，任务正在被轮询时与轮询合并"""
+    return shared_poller.fetch(client, req_key, task_id, req_json)
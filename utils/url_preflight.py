@@ -0,0 +1,179 @@
+"""
+提交前的参考链接检查
+
+文生图 4.0 的参考图、图生图的图片链接、视频生成的参考图以及动作模仿的源图与动作视频都以链接提交，
+链接无法访问或文件过大时，任务要在服务端排队后才会失败。提交前在后台事件循环上并发检查全部链接：
+先发送 HEAD 请求，服务端不支持 HEAD 或未返回类型与大小时改用只取首字节的 Range GET，
+校验状态码、内容类型与文件大小；检查通过的链接在 ttl 内不再重复检查。
+
+- 连接失败、链接格式错误、HTTP 错误状态、类型不符或超过大小上限时返回错误；超时或其他异常视为无法判断，放行且不缓存
+- 内容类型为 application/octet-stream 或缺失时不校验类型，未返回大小时不校验大小
+- DREAMAI_PREFLIGHT=off 关闭检查
+- DREAMAI_PREFLIGHT_TIMEOUT 单个链接的超时（秒），默认 3
+- DREAMAI_PREFLIGHT_TTL 检查通过的结果缓存时间（秒），默认 300
+- DREAMAI_PREFLIGHT_MAX_IMAGE_BYTES / DREAMAI_PREFLIGHT_MAX_VIDEO_BYTES 文件大小上限，默认 15MB / 200MB
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+from utils.async_client import background_loop
+from utils.metrics import preflight_checks_total
+
+logger = logging.getLogger(__name__)
+
+# 不校验类型的通用内容类型
+GENERIC_CONTENT_TYPES = ('', 'application/octet-stream', 'binary/octet-stream')
+
+
+def _is_url(value: object) -> bool:
+    return isinstance(value, str) and value.startswith(('http://', 'https://'))
+
+
+def _content_length(response: httpx.Response) -> Optional[int]:
+    # Range GET 的总大小在 Content-Range 中，如 bytes 0-0/123456
+    content_range = response.headers.get('content-range', '')
+    if '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('content-length', '')
+    return int(length) if length.isdigit() else None
+
+
+def _format_bytes(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f}MB"
+
+
+class UrlPreflight:
+    """并发检查参考链接，缓存检查通过的结果"""
+
+    def __init__(self, enabled: bool = True, timeout: float = 3.0, ttl: float = 300.0,
+                 max_bytes: Optional[dict[str, int]] = None):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_bytes = max_bytes or {'image': 15 * 1024 * 1024, 'video': 200 * 1024 * 1024}
+        self._passed: dict[tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def check(self, references: list[tuple[str, str]]) -> list[str]:
+        """
+        检查 (链接, 类型) 列表，类型为 image 或 video；非链接的值（如 base64）跳过
+
+        :return: 错误消息列表，全部通过时为空
+        """
+        if not self.enabled:
+            return []
+        now = time.monotonic()
+        pending = []
+        with self._lock:
+            for url, kind in dict.fromkeys(references):
+                if not _is_url(url):
+                    continue
+                if self._passed.get((url, kind), 0) > now:
+                    preflight_checks_total.inc(kind=kind, outcome='cached')
+                    continue
+                pending.append((url, kind))
+        if not pending:
+            return []
+        try:
+            results = background_loop.run(self._check_all(pending), timeout=self.timeout * 3)
+        except TimeoutError:
+            logger.info("preflight timed out for %d URLs, skipping", len(pending))
+            return []
+        errors = []
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for (url, kind), (outcome, error) in zip(pending, results):
+                preflight_checks_total.inc(kind=kind, outcome=outcome)
+                if outcome == 'passed':
+                    self._passed[(url, kind)] = expires_at
+                elif error:
+                    errors.append(error)
+            self._expire(time.monotonic())
+        return errors
+
+    def clear(self) -> None:
+        with self._lock:
+            self._passed.clear()
+
+    def _expire(self, now: float) -> None:
+        for key in [key for key, expires_at in self._passed.items() if expires_at <= now]:
+            del self._passed[key]
+
+    def _get_http(self) -> httpx.AsyncClient:
+        # httpx.AsyncClient 绑定到创建它的事件循环，因此在后台循环中惰性创建
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+            )
+        return self._http
+
+    async def _check_all(self, pending: list[tuple[str, str]]) -> list[tuple[str, Optional[str]]]:
+        return await asyncio.gather(*(self._check_one(url, kind) for url, kind in pending))
+
+    async def _check_one(self, url: str, kind: str) -> tuple[str, Optional[str]]:
+        """返回 (结果, 错误消息)，结果为 passed / failed / inconclusive"""
+        try:
+            response = await asyncio.wait_for(self._fetch_headers(url), self.timeout * 2)
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            logger.info("preflight timed out for %s, skipping", url)
+            return 'inconclusive', None
+        except httpx.HTTPError as e:
+            return 'failed', f"{kind} URL is not reachable: {url} ({type(e).__name__})"
+        except httpx.InvalidURL:
+            return 'failed', f"{kind} URL is not a valid URL: {url}"
+        except Exception as e:
+            # 其他异常只影响这一个链接，视为无法判断并放行，由服务端给出最终结果
+            logger.info("preflight failed for %s, skipping: %s", url, e)
+            return 'inconclusive', None
+
+        if response.status_code >= 400:
+            return 'failed', f"{kind} URL returned HTTP {response.status_code}: {url}"
+        content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+        if content_type not in GENERIC_CONTENT_TYPES and not content_type.startswith(f"{kind}/"):
+            return 'failed', f"{kind} URL has unexpected content type {content_type}: {url}"
+        size = _content_length(response)
+        limit = self.max_bytes.get(kind)
+        if size is not None and limit and size > limit:
+            return 'failed', f"{kind} URL is too large ({_format_bytes(size)} > {_format_bytes(limit)}): {url}"
+        return 'passed', None
+
+    async def _fetch_headers(self, url: str) -> httpx.Response:
+        http = self._get_http()
+        response = await http.head(url)
+        if response.status_code >= 400 or not self._has_metadata(response):
+            # 不支持 HEAD 或未返回类型与大小时只取首字节，不读取响应体
+            async with http.stream('GET', url, headers={'Range': 'bytes=0-0'}) as response:
+                pass
+        return response
+
+    def _has_metadata(self, response: httpx.Response) -> bool:
+        return bool(response.headers.get('content-type')) and _content_length(response) is not None
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+# 进程级共享实例
+url_preflight = UrlPreflight(
+    enabled=os.getenv('DREAMAI_PREFLIGHT', 'on').lower() not in ('', 'off', 'none', 'false', '0'),
+    timeout=_env_float('DREAMAI_PREFLIGHT_TIMEOUT', 3),
+    ttl=_env_float('DREAMAI_PREFLIGHT_TTL', 300),
+    max_bytes={
+        'image': int(_env_float('DREAMAI_PREFLIGHT_MAX_IMAGE_BYTES', 15 * 1024 * 1024)),
+        'video': int(_env_float('DREAMAI_PREFLIGHT_MAX_VIDEO_BYTES', 200 * 1024 * 1024)),
+    },
+)
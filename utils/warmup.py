@@ -0,0 +1,66 @@
+"""
+插件启动后的后台预热
+
+插件进程在 Dify daemon 下会被频繁回收重建，首个调用需要承担导入火山引擎 SDK、
+启动后台事件循环、编译请求 schema 与创建客户端的开销。Plugin(...) 启动后在守护线程中提前完成这些工作，
+不阻塞插件启动；预热失败只记录日志，首个调用时仍会按需初始化。
+
+- DREAMAI_WARMUP=off 关闭预热
+- DREAMAI_WARMUP_CREDENTIALS 可选，格式与 provider 的额外凭证相同（"AccessKey,SecretKey"，
+  多组之间用分号分隔），为这些凭证预建同步与异步客户端并预先签名一次请求
+"""
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _warmup_credentials() -> list:
+    from utils.key_pool import parse_api_keys
+
+    value = os.getenv('DREAMAI_WARMUP_CREDENTIALS')
+    if not value:
+        return []
+    try:
+        return parse_api_keys({'volcengine_extra_credentials': value})
+    except ValueError as e:
+        logger.warning("invalid DREAMAI_WARMUP_CREDENTIALS: %s", e)
+        return []
+
+
+def run_warm_up() -> float:
+    """同步执行预热，返回耗时（秒）"""
+    started_at = time.perf_counter()
+
+    from utils.async_client import background_loop, get_async_client
+    from utils.client_pool import load_sdk
+    from utils.request_builders import compile_all
+
+    load_sdk()
+    background_loop.loop
+    # 读取工具 YAML 并编译请求 schema
+    compile_all()
+    for api_key in _warmup_credentials():
+        client = get_async_client(api_key.access_key, api_key.secret_key)
+        # 预先走一遍请求构造与签名，加载签名相关的代码路径
+        client.sign('CVSync2AsyncGetResult', {})
+    return time.perf_counter() - started_at
+
+
+def warm_up() -> Optional[threading.Thread]:
+    """在守护线程中预热，已关闭时返回 None"""
+    if os.getenv('DREAMAI_WARMUP', 'on').lower() in ('', 'off', 'none', 'false', '0'):
+        return None
+
+    def run():
+        try:
+            logger.info("warm-up finished in %.3fs", run_warm_up())
+        except Exception as e:
+            logger.warning("warm-up failed: %s", e)
+
+    thread = threading.Thread(target=run, name='dreamai-warmup', daemon=True)
+    thread.start()
+    return thread